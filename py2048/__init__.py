@@ -1,2 +0,0 @@
-import sys
-print('potato')
\ No newline at end of file
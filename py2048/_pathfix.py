@@ -25,8 +25,6 @@ if not root_dir.endswith("src"):
     root_dir = Path(root_dir) / "src"
 sys.path.append(str(root_dir))
 
-print(f"Fixing paths from {root_dir}")
-
 
 def suppress_unused_import():
     pass
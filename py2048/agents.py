@@ -0,0 +1,200 @@
+"""
+    Programmatic players. An agent looks at a `Grid` and picks one of engine.DIRECTIONS (by index) to move in.
+"""
+import time
+from math import comb
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Optional, Callable, List
+
+from engine import Grid, FOUR_PROBABILITY
+from heuristics import Heuristic, evaluate_heuristic
+from transposition import TranspositionCache, canonical_hash
+from utils import FancyDict
+
+
+class SearchTimeout(Exception):
+    """ Raised inside a search when its time budget runs out """
+    ...
+
+
+class Agent(ABC):
+
+    @abstractmethod
+    def act(self, grid: Grid) -> Optional[int]:
+        """ :return: the index of the direction to move in, or None if no move changes the grid """
+        ...
+
+
+class RandomAgent(Agent):
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+
+    def act(self, grid: Grid) -> Optional[int]:
+        legal = np.flatnonzero(grid.legal_moves)
+        return int(self.rng.choice(legal)) if legal.size else None
+
+
+class ExpectimaxAgent(Agent):
+
+    def __init__(self, depth: int = 2, time_budget: Optional[float] = None, prob_cutoff: float = 1e-3,
+                 evaluate: Callable[[np.ndarray], float] = evaluate_heuristic, loss_penalty: float = 2e5,
+                 weights: Optional[dict] = None, cache_size: int = 0, cache_policy: str = 'lru',
+                 cache: Optional[TranspositionCache] = None):
+        """
+            Expectimax search: we pick the direction, and the spawn that follows is a chance node whose outcomes (and
+            their probabilities) come from Grid.chance_outcomes.
+        :param depth: how many (move, spawn) plies to look ahead. With a time budget, this is the deepest we go.
+        :param time_budget: seconds per move. If given, we deepen iteratively from depth 1 till the budget runs out,
+            and play the best move of the deepest search that finished.
+        :param prob_cutoff: chance outcomes whose probability (along the whole path from the root) is below this are
+            not searched. The outcomes which are searched are renormalised.
+        :param evaluate: scores a board at the leaves of the search. If it has a `batch` method (like
+            heuristics.Heuristic) taking (N, dim, dim) boards, we use that to score all leaves of a node in one call.
+        :param loss_penalty: subtracted from the evaluation of boards where the game is over
+        :param weights: shorthand for evaluate=heuristics.Heuristic(**weights), e.g. from the command line
+        :param cache_size: if not 0, remember the values of positions we searched (up to symmetry) in a
+            transposition.TranspositionCache of this many entries, kept from move to move
+        :param cache_policy: its replacement policy, 'lru' or 'depth'
+        :param cache: a cache to use (and maybe share with other agents) instead
+        """
+        if depth < 1:
+            raise ValueError(f"Depth must be at least 1. Got {depth}.")
+
+        self.depth: int = depth
+        self.time_budget: Optional[float] = time_budget
+        self.prob_cutoff: float = prob_cutoff
+        self.evaluate: Callable[[np.ndarray], float] = Heuristic(**weights) if weights else evaluate
+        self.evaluate_batch: Optional[Callable[[np.ndarray], np.ndarray]] = getattr(self.evaluate, 'batch', None)
+        self.loss_penalty: float = loss_penalty
+        if cache is None and cache_size:
+            cache = TranspositionCache(cache_size, cache_policy)
+        self.cache: Optional[TranspositionCache] = cache
+
+        # Per move latency, nodes expanded and depth reached, to be summarised by `report`
+        self.latencies: List[float] = []
+        self.nodes: List[int] = []
+        self.depths: List[int] = []
+
+        # State of the ongoing search
+        self._grid: Optional[Grid] = None
+        self._deadline: float = float('inf')
+        self._nodes: int = 0
+        self._next_check: int = 0       # the node count at which we next look at the clock
+
+        # Arrays to expand nodes into, one set per depth, so that a search allocates nothing per node
+        self._afters: List[np.ndarray] = []
+        self._outcomes: List[np.ndarray] = []
+
+    def _buffers_(self, grid: Grid):
+        dim, spawns = grid.dim, grid._spawn_freq
+        n_outcomes = comb(dim * dim, spawns) * 2 ** spawns
+        if self._outcomes and self._outcomes[0].shape == (n_outcomes, dim, dim):
+            return
+        self._afters = [np.zeros((4, dim, dim), dtype=np.int32) for _ in range(self.depth + 1)]
+        self._outcomes = [np.zeros((n_outcomes, dim, dim), dtype=np.int32) for _ in range(self.depth + 1)]
+
+    def _max_node_(self, vals: np.ndarray, depth: int, prob: float) -> (float, Optional[int]):
+        """ Our move: the best direction and its value """
+        self._nodes += 1
+        if self._nodes >= self._next_check:
+            self._next_check = self._nodes + 64
+            if time.perf_counter() > self._deadline:
+                raise SearchTimeout
+
+        afters, _, changed = self._grid.afterstates(vals, out=self._afters[depth])
+        if not changed.any():
+            return self.evaluate(vals) - self.loss_penalty, None
+
+        if depth <= 1 and self.evaluate_batch is not None:
+            # All the children are leaves, so score them together
+            directions = np.flatnonzero(changed)
+            values = self.evaluate_batch(afters[directions])
+            self._nodes += directions.size
+            best = int(np.argmax(values))
+            return float(values[best]), int(directions[best])
+
+        best_value, best_direction = -np.inf, None
+        for direction in np.flatnonzero(changed):
+            value = self._chance_node_(afters[direction], depth, prob)
+            if value > best_value:
+                best_value, best_direction = value, int(direction)
+
+        return best_value, best_direction
+
+    def _chance_node_(self, vals: np.ndarray, depth: int, prob: float) -> float:
+        """ The spawn after our move: the expected value over all outcomes which are likely enough """
+        self._nodes += 1
+        if depth <= 1:
+            return self.evaluate(vals)
+
+        boards, probs = self._grid.chance_outcomes(vals, out=self._outcomes[depth])
+        total, weight = 0., 0.
+        for i in np.flatnonzero(prob * probs >= self.prob_cutoff):
+            total += probs[i] * self._value_(boards[i], depth - 1, prob * probs[i])
+            weight += probs[i]
+
+        return total / weight if weight else self.evaluate(vals)
+
+    def _value_(self, vals: np.ndarray, depth: int, prob: float) -> float:
+        """ The value of a max node, from the cache if we searched it (or a symmetric board) at least this deep """
+        if self.cache is None:
+            return self._max_node_(vals, depth, prob)[0]
+
+        key = canonical_hash(vals)
+        value = self.cache.get(key, depth)
+        if value is None:
+            value = self._max_node_(vals, depth, prob)[0]
+            self.cache.put(key, depth, value)
+        return value
+
+    def act(self, grid: Grid) -> Optional[int]:
+        if grid.numgen not in FOUR_PROBABILITY:
+            raise ValueError(f"Unknown spawn distribution for number generator: {grid.numgen}.")
+
+        start = time.perf_counter()
+        self._grid = grid
+        self._buffers_(grid)
+        self._deadline = start + self.time_budget if self.time_budget else float('inf')
+        self._nodes = 0
+        self._next_check = 0
+
+        # Without a time budget we go straight to full depth, otherwise deepen till we run out of time
+        best, reached = None, 0
+        for depth in range(1 if self.time_budget else self.depth, self.depth + 1):
+            try:
+                _, direction = self._max_node_(grid.vals.copy(), depth, 1.)
+            except SearchTimeout:
+                break
+            best, reached = direction, depth
+            if direction is None:
+                break
+
+        # If not even depth 1 finished in time, just play any legal move
+        if reached == 0:
+            legal = np.flatnonzero(grid.legal_moves)
+            best = int(legal[0]) if legal.size else None
+
+        self.latencies.append(time.perf_counter() - start)
+        self.nodes.append(self._nodes)
+        self.depths.append(reached)
+        self._grid = None
+        return best
+
+    def report(self) -> FancyDict:
+        """ Summary of the moves played so far: latency (seconds) per move, nodes per second, and depth reached """
+        if not self.latencies:
+            return FancyDict(moves=0)
+
+        latencies = np.array(self.latencies)
+        return FancyDict(
+            moves=len(latencies),
+            latency_mean=float(latencies.mean()),
+            latency_p50=float(np.percentile(latencies, 50)),
+            latency_p95=float(np.percentile(latencies, 95)),
+            latency_max=float(latencies.max()),
+            nodes_per_sec=float(sum(self.nodes) / latencies.sum()) if latencies.sum() else 0.,
+            depth_mean=float(np.mean(self.depths)),
+            **({'cache': self.cache.report()} if self.cache is not None else {}),
+        )
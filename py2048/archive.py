@@ -0,0 +1,198 @@
+"""
+    Many games in one file, for datasets of finished games.
+
+    Every board of every game is one fixed size record: the tile exponents (one byte per cell, see utils.to_exponents),
+    and the direction of the move which led to it (NO_ACTION for the first board of a game). The boards of a game are
+    contiguous, and an index at the end of the file says where each game starts, how long it is, and how it ended.
+
+    File layout (little endian): header | board records | index
+    The archive is opened with np.memmap, so reading a game, or any slice of boards, copies nothing until it is used.
+
+    Usage:
+        python archive.py saves games.p2a       # pack every session in a save directory into an archive
+"""
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Optional, Iterable, Union
+
+from engine import Game, DIRECTION_KEYS
+from utils import FancyDict, to_exponents, from_exponents
+
+MAGIC: bytes = b'P2AR'
+VERSION: int = 1
+
+# magic, version, dim, n_games, n_boards
+HEADER = struct.Struct('<4sBB2xQQ')
+
+# The action of the first board of every game, which no move led to
+NO_ACTION: int = 255
+
+INDEX_DTYPE = np.dtype([
+    ('session_id', 'S32'),
+    ('start', '<u8'),           # the number of the game's first board
+    ('length', '<u4'),          # how many boards the game has (one more than its moves)
+    ('score', '<i8'),
+    ('max_tile', '<u4'),
+    ('gameover', 'u1'),
+])
+
+
+def encode_session_id(session_id: str) -> bytes:
+    """ The session ID as it fits in the index: UTF-8, cut to 32 bytes where a character ends """
+    size = INDEX_DTYPE['session_id'].itemsize
+    return session_id.encode()[:size].decode('utf-8', errors='ignore').encode()
+
+
+def record_dtype(dim: int) -> np.dtype:
+    return np.dtype([('board', 'u1', (dim, dim)), ('action', 'u1')])
+
+
+class ArchiveWriter:
+    """ Streams games into a new archive. The index is kept in memory, and written with the header at `close`. """
+
+    def __init__(self, path: Union[str, Path], dim: int = 4):
+        self.path: Path = Path(path)
+        self.dim: int = dim
+        self._dtype: np.dtype = record_dtype(dim)
+        self._index: list = []
+        self._n_boards: int = 0
+
+        self._file = self.path.open('wb')
+        self._file.write(bytes(HEADER.size))         # filled in at close
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, boards: np.ndarray, actions: np.ndarray, session_id: str = '', score: int = 0,
+            gameover: bool = False):
+        """
+            Append a game.
+        :param boards: (n, dim, dim) tile values (not exponents) of every board in the game, in order
+        :param actions: (n - 1) indices into engine.DIRECTIONS, of the moves between consecutive boards
+        """
+        boards = np.asarray(boards)
+        if boards.ndim != 3 or boards.shape[1:] != (self.dim, self.dim):
+            raise ValueError(f"Expected boards of shape (n, {self.dim}, {self.dim}). Got {boards.shape}.")
+        if len(actions) != len(boards) - 1:
+            raise ValueError(f"Expected {len(boards) - 1} actions for {len(boards)} boards. Got {len(actions)}.")
+
+        records = np.zeros(len(boards), dtype=self._dtype)
+        records['board'] = to_exponents(boards)
+        records['action'][0] = NO_ACTION
+        records['action'][1:] = actions
+        self._file.write(records.tobytes())
+
+        self._index.append((encode_session_id(session_id), self._n_boards, len(boards), int(score),
+                            int(boards[-1].max()), int(bool(gameover))))
+        self._n_boards += len(boards)
+
+    def add_game(self, game: Game):
+        """ Append a game with its whole trajectory (from its replay). Without a full replay, only its last board. """
+        if len(game.replay) == len(game.history):
+            boards = np.stack([vals.copy() for vals, _ in game.replay.trajectory(game.grid)])
+            actions = [DIRECTION_KEYS.index(key) for key in game.history]
+        else:
+            boards, actions = game.grid.vals[None], []
+        self.add(boards, actions, game.session_id, game.score, game.grid.is_over)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(np.array(self._index, dtype=INDEX_DTYPE).tobytes())
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.dim, len(self._index), self._n_boards))
+        self._file.close()
+
+
+class Archive:
+    """ A read only view of an archive. Everything returned is a view into the memory mapped file. """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path: Path = Path(path)
+        with self.path.open('rb') as f:
+            magic, version, self.dim, self.n_games, self.n_boards = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an archive (version {VERSION}). Magic: {magic}, version: {version}.")
+
+        dtype = record_dtype(self.dim)
+        self.records: np.ndarray = np.memmap(self.path, dtype=dtype, mode='r', offset=HEADER.size,
+                                             shape=(self.n_boards,)) if self.n_boards else np.zeros(0, dtype=dtype)
+        self.index: np.ndarray = np.memmap(self.path, dtype=INDEX_DTYPE, mode='r',
+                                           offset=HEADER.size + self.n_boards * dtype.itemsize,
+                                           shape=(self.n_games,)) if self.n_games else np.zeros(0, dtype=INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        return self.n_games
+
+    @property
+    def boards(self) -> np.ndarray:
+        """ (n_boards, dim, dim) tile exponents of every board in the archive """
+        return self.records['board']
+
+    @property
+    def actions(self) -> np.ndarray:
+        return self.records['action']
+
+    def __getitem__(self, i: int) -> FancyDict:
+        """ A game: its session id, score, whether it was over, and the exponents and actions of all its boards """
+        entry = self.index[i]
+        records = self.records[int(entry['start']): int(entry['start']) + int(entry['length'])]
+        return FancyDict(
+            session_id=entry['session_id'].decode(),
+            score=int(entry['score']),
+            max_tile=int(entry['max_tile']),
+            gameover=bool(entry['gameover']),
+            boards=records['board'],
+            actions=records['action'][1:],
+        )
+
+    def vals(self, i: int) -> np.ndarray:
+        """ The tile values (not exponents) of every board of game i. This one is a copy. """
+        return from_exponents(self[i].boards)
+
+
+def convert_savedir(savedir: Union[str, Path], path: Union[str, Path]) -> int:
+    """ Pack every loadable session in a save directory into an archive at path. :return: the number of games """
+    savedir = Path(savedir)
+    games = 0
+    writer = None
+    try:
+        for fname in sorted(savedir.glob('*.json')):
+            try:
+                game = Game._load_(fname.stem, savedir=savedir)
+            except (ValueError, KeyError, FileNotFoundError, json.decoder.JSONDecodeError):
+                continue
+            game.autosave = False
+
+            if writer is None:
+                writer = ArchiveWriter(path, dim=game.grid.dim)
+            elif game.grid.dim != writer.dim:
+                continue            # one archive holds boards of one size
+            writer.add_game(game)
+            games += 1
+    finally:
+        if writer is None:
+            writer = ArchiveWriter(path)
+        writer.close()
+    return games
+
+
+def main(args: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Pack the sessions of a save directory into one archive.")
+    parser.add_argument('savedir')
+    parser.add_argument('out', help="the archive file to write")
+    args = parser.parse_args(args)
+
+    games = convert_savedir(args.savedir, args.out)
+    print(f"Packed {games} games into {args.out}.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
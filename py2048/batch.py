@@ -0,0 +1,136 @@
+"""
+    Vectorized stepping of many grids at once.
+
+    A `BatchGrid` keeps N boards in one (N, dim, dim) array. Every move is done by re-orienting the boards so that the
+    requested direction becomes 'left', and then running the `Grid._proc_row_` semantics (shift, merge, shift) over all
+    rows of all boards together with NumPy (see kernel.py), instead of one row at a time in Python.
+"""
+import numpy as np
+from typing import Optional, Callable
+
+from engine import FOUR_PROBABILITY, generate_biased_two_four
+from kernel import UP, DOWN, LEFT, RIGHT, orient, proc_rows
+
+
+def move_boards(vals: np.ndarray, actions: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+        Move every board in a (N, dim, dim) array in its own direction.
+    :param vals: the boards. These are not modified.
+    :param actions: (N,) array of directions (UP, DOWN, LEFT or RIGHT)
+    :return: the moved boards, and the score gained on every board
+    """
+    n, dim, _ = vals.shape
+    out = vals.copy()
+    scores = np.zeros(n, dtype=np.int64)
+
+    for direction in (UP, DOWN, LEFT, RIGHT):
+        inds = np.flatnonzero(actions == direction)
+        if inds.size == 0:
+            continue
+
+        boards = out[inds]
+        view = orient(boards, direction)
+        rows, row_scores = proc_rows(view.reshape(-1, dim))
+        view[...] = rows.reshape(view.shape)
+
+        out[inds] = boards
+        scores[inds] = row_scores.reshape(inds.size, dim).sum(axis=1)
+
+    return out, scores
+
+
+def boards_over(vals: np.ndarray) -> np.ndarray:
+    """ A board is over when it has no free cells and no two neighbouring cells are equal """
+    full = (vals != 0).all(axis=(1, 2))
+    hor = (vals[:, :, 1:] == vals[:, :, :-1]).any(axis=(1, 2))
+    ver = (vals[:, 1:, :] == vals[:, :-1, :]).any(axis=(1, 2))
+    return full & ~hor & ~ver
+
+
+class BatchGrid:
+
+    def __init__(self, n: int, dim: int = 4, spawns: int = 1, numgen: Optional[Callable] = None,
+                 seed: Optional[int] = None):
+        """
+            N grids of the same size, moved together.
+        :param n: the number of boards
+        :param dim: the size of every grid
+        :param spawns: how many new blocks are added to a board after a move that changes it
+        :param numgen: one of the number generators in engine. We only use its probability of spawning a 4.
+        :param seed: seed for the random generator used for all spawns in this batch
+        """
+        numgen = numgen if numgen else generate_biased_two_four
+        if numgen not in FOUR_PROBABILITY:
+            raise ValueError(f"Unknown number generator: {numgen}. Expected one of {list(FOUR_PROBABILITY)}.")
+
+        self.n: int = n
+        self.dim: int = dim
+        self._spawn_freq: int = spawns
+        self._four_prob: float = FOUR_PROBABILITY[numgen]
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+
+        self.vals: np.ndarray = np.zeros((n, dim, dim), dtype=np.int32)
+        self.scores: np.ndarray = np.zeros(n, dtype=np.int64)
+
+        # Init the games
+        self.reset()
+
+    @property
+    def max(self) -> np.ndarray:
+        return self.vals.max(axis=(1, 2))
+
+    @property
+    def is_over(self) -> np.ndarray:
+        return boards_over(self.vals)
+
+    def reset(self, mask: Optional[np.ndarray] = None):
+        """ Start a new game on every board selected by the (N,) bool mask (all boards, by default) """
+        mask = np.ones(self.n, dtype=bool) if mask is None else mask
+        self.vals[mask] = 0
+        self.scores[mask] = 0
+        self.spawn(2, mask=mask)
+
+    def spawn(self, n: int = -1, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+            Spawn n values in random free cells of every board selected by the mask (all boards, by default).
+            Unlike `Grid.spawn`, boards without enough free cells do not raise; they just get fewer (or no) values.
+        :return: (N,) bool array of boards where at least one value was spawned
+        """
+        if n < 0:
+            n = self._spawn_freq
+
+        flat = self.vals.reshape(self.n, -1)
+        mask = np.ones(self.n, dtype=bool) if mask is None else mask
+
+        # A random key for every free cell; the n cells with the largest keys get the new values
+        keys = self.rng.random(flat.shape)
+        keys[(flat != 0) | ~mask[:, None]] = -1
+        cells = np.argpartition(-keys, n - 1, axis=1)[:, :n]
+        valid = np.take_along_axis(keys, cells, axis=1) >= 0
+
+        values = np.where(self.rng.random(cells.shape) < self._four_prob, 4, 2)
+        boards = np.broadcast_to(np.arange(self.n)[:, None], cells.shape)
+        flat[boards[valid], cells[valid]] = values[valid]
+
+        return valid.any(axis=1)
+
+    def step(self, actions: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+            Move every board in its own direction, and spawn values into the boards which changed.
+        :param actions: (N,) array of directions: 0 for up, 1 for down, 2 for left, 3 for right.
+        :return: (N,) arrays of the score gained, whether the board changed, and whether the game is over
+        """
+        actions = np.asarray(actions)
+        if actions.shape != (self.n,):
+            raise ValueError(f"Expected one action per board i.e. shape {(self.n,)}. Got {actions.shape}.")
+        if ((actions < UP) | (actions > RIGHT)).any():
+            raise ValueError(f"Actions must be one of {UP, DOWN, LEFT, RIGHT}.")
+
+        new, scores = move_boards(self.vals, actions)
+        changed = (new != self.vals).any(axis=(1, 2))
+
+        self.vals = new
+        self.scores += scores
+        self.spawn(mask=changed)
+
+        return scores, changed, self.is_over
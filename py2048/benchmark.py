@@ -0,0 +1,186 @@
+"""
+    Benchmarks for the engine, spawning, game over checks, rendering and persistence, across board sizes, and the time
+    it takes a fresh interpreter to import the engine (which every worker process pays).
+
+    Usage:
+        python benchmark.py --out bench.json                            # run and save the results
+        python benchmark.py --compare bench.json --tolerance 0.2        # run and flag anything 20% slower than before
+
+    In compare mode the exit code is 1 if there is any regression, so this can gate CI.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from pathlib import Path
+from tabulate import tabulate
+from typing import Callable, Optional, Iterable, List
+
+import engine
+from engine import Grid, Game, DIRECTIONS
+from bitboard import BitGrid
+from utils import FancyDict
+
+
+# Seconds a fresh interpreter may take to import each module, on top of numpy (which they all need anyway)
+IMPORT_BUDGET = {'engine': 0.25, 'bitboard': 0.5}
+
+# Modules which importing the engine must not pull in: the UI and persistence ones are imported when first used
+UI_MODULES = ('curses', 'tabulate', 'random_username', 'visualisation', 'sessions', 'sqlite3', 'journal')
+
+
+def import_time(module: str, repeats: int = 3) -> (float, List[str]):
+    """
+        Seconds to import a module (of this directory) in a fresh interpreter which has imported numpy already, best
+        of `repeats`. :return: that, and which of UI_MODULES the import pulled in.
+    """
+    code = ("import sys, time, json, numpy; start = time.perf_counter(); import {module}; "
+            "print(json.dumps([time.perf_counter() - start, [m for m in {ui} if m in sys.modules]]))")
+    best, loaded = float('inf'), []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', code.format(module=module, ui=list(UI_MODULES))],
+                             cwd=Path(__file__).parent, capture_output=True, text=True, check=True).stdout
+        secs, loaded = json.loads(out)
+        best = min(best, secs)
+    return best, loaded
+
+
+def bench_import() -> dict:
+    return {f"import.{module}": import_time(module)[0] for module in IMPORT_BUDGET}
+
+
+def measure(fn: Callable, setup: Optional[Callable] = None, min_time: float = 0.2, repeats: int = 3) -> float:
+    """
+        Seconds per call of fn, best of `repeats` rounds, each running for at least `min_time` seconds.
+        If given, `setup` is called before every call of fn (and not timed). Its return value is passed to fn.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        calls, elapsed = 0, 0.
+        while elapsed < min_time:
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            elapsed += time.perf_counter() - start
+            calls += 1
+        best = min(best, elapsed / calls)
+    return best
+
+
+def random_board(rng: np.random.Generator, dim: int, fill: float = 0.5, maxexp: int = 11) -> np.ndarray:
+    vals = 1 << rng.integers(1, maxexp, (dim, dim))
+    return np.where(rng.random((dim, dim)) < fill, vals, 0).astype(np.int32)
+
+
+def full_board(dim: int) -> np.ndarray:
+    """ A full board where no move changes anything: the worst case for is_over """
+    rows, cols = np.indices((dim, dim))
+    return np.where((rows + cols) % 2, 2, 4).astype(np.int32)
+
+
+def bench_grid(grid_cls, dim: int, min_time: float) -> dict:
+    rng = np.random.default_rng(0)
+    boards = [random_board(rng, dim) for _ in range(64)]
+    grid = grid_cls(dim=dim, seed=0)
+    results = {}
+
+    def fresh(board_list):
+        # a new state, so that nothing is served from the grid's cache of transitions
+        def setup():
+            grid.set_vals(board_list[rng.integers(len(board_list))].copy())
+        return setup
+
+    for direction in DIRECTIONS:
+        results[f"move.{direction}"] = measure(lambda _: getattr(grid, direction)(), fresh(boards), min_time)
+
+    results['is_over.full'] = measure(lambda _: grid.is_over, fresh([full_board(dim)]), min_time)
+    results['is_over.open'] = measure(lambda _: grid.is_over, fresh(boards), min_time)
+    results['spawn'] = measure(lambda _: grid.spawn(), fresh(boards), min_time)
+    return results
+
+
+def bench_render(dim: int, min_time: float) -> dict:
+    grid = Grid(dim=dim, seed=0)
+    grid.set_vals(random_board(np.random.default_rng(0), dim, maxexp=14))
+    return {'render': measure(lambda: grid.viz(grid), min_time=min_time)}
+
+
+def bench_persistence(dim: int, min_time: float) -> dict:
+    savedir = engine.CONFIG.savedir
+    with tempfile.TemporaryDirectory() as tmp:
+        engine.CONFIG.savedir = Path(tmp)
+        try:
+            game = Game(grid=Grid(dim=dim, seed=0), session_id='benchmark', autosave=False)
+            for direction in np.random.default_rng(0).integers(0, 4, 200):
+                game.step(int(direction))
+
+            def load():
+                Game._load_('benchmark').autosave = False
+
+            results = {'save': measure(game._save_, min_time=min_time), 'load': measure(load, min_time=min_time)}
+        finally:
+            engine.CONFIG.savedir = savedir
+    return results
+
+
+def run(dims: Iterable[int] = (4, 8, 16), min_time: float = 0.2) -> dict:
+    """ :return: {benchmark name: seconds per op} """
+    results = {}
+    for dim in dims:
+        grid_classes = [('grid', Grid)] + ([('bitgrid', BitGrid)] if dim == 4 else [])
+        for prefix, grid_cls in grid_classes:
+            for name, secs in bench_grid(grid_cls, dim, min_time).items():
+                results[f"{prefix}.{name}.dim{dim}"] = secs
+        for name, secs in {**bench_render(dim, min_time), **bench_persistence(dim, min_time)}.items():
+            results[f"{name}.dim{dim}"] = secs
+    results.update(bench_import())
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[list]:
+    """ :return: rows of (name, baseline, current, ratio, flag) for benchmarks present in both """
+    rows = []
+    for name, secs in results.items():
+        if name not in baseline:
+            continue
+        ratio = secs / baseline[name]
+        rows.append([name, baseline[name], secs, ratio, 'REGRESSION' if ratio > 1 + tolerance else ''])
+    return rows
+
+
+def main(args: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the 2048 engine.")
+    parser.add_argument('--dims', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds to spend per measurement round")
+    parser.add_argument('--out', default=None, help="file to write the results to (JSON)")
+    parser.add_argument('--compare', default=None, help="results file (JSON) from an earlier run, to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="slowdown ratio above which we flag a regression")
+    args = parser.parse_args(args)
+
+    results = run(args.dims, args.min_time)
+    report = FancyDict(
+        meta={'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        results=results
+    )
+    if args.out:
+        json.dump(report, open(args.out, 'w+'), indent=2)
+
+    if not args.compare:
+        print(tabulate([[name, secs * 1e6, 1 / secs] for name, secs in results.items()],
+                       headers=['benchmark', 'us/op', 'ops/sec'], floatfmt='.1f'))
+        return 0
+
+    baseline = json.load(open(args.compare, 'r'))['results']
+    rows = compare(results, baseline, args.tolerance)
+    print(tabulate([[name, old * 1e6, new * 1e6, ratio, flag] for name, old, new, ratio, flag in rows],
+                   headers=['benchmark', 'baseline us/op', 'current us/op', 'ratio', ''], floatfmt='.2f'))
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+    A bitboard implementation of the 4x4 grid.
+
+    The board is packed into one 64-bit integer where every cell is a 4-bit nibble holding the log2 exponent of the
+    tile (0 for an empty cell). Cell (r, c) lives at nibble `4*r + c`, so row `r` is the 16-bit slice at `16*r`.
+
+    Moving a row left/right is a lookup into tables of all 65536 possible rows, precomputed once on import. The tables
+    of merged tiles, which only `merges` (and so `BitGrid`) needs, are turned into lists the first time they are used.
+    Up/down are handled by transposing the board and treating its columns as rows.
+
+    The functions here work on plain ints and are what you want in a hot loop.
+    `BitGrid` wraps them behind the regular `Grid` API so that `Game` and `VisualizeGrid` work unchanged.
+"""
+import numpy as np
+from typing import Optional, List, Tuple, Union
+
+from engine import Grid
+
+ROW_MASK: int = 0xFFFF
+MAX_EXPONENT: int = 15       # 4 bits per cell, so the largest tile is 2**15 = 32768
+
+_SHIFTS: np.ndarray = np.arange(0, 64, 4, dtype=np.uint64)
+
+
+def _compact_rows_(cells: np.ndarray) -> np.ndarray:
+    """ Slide all nonzero values of every row to the left, preserving their order """
+    order = np.argsort(cells == 0, axis=1, kind='stable')
+    return np.take_along_axis(cells, order, axis=1)
+
+
+def _slide_rows_(cells: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+        Apply the `Grid._proc_row_` (shift, merge, shift) semantics to a (n, 4) array of exponent rows, all at once.
+        Tiles at MAX_EXPONENT are not merged any further since the result would not fit in a nibble.
+    :return: the resulting rows, and a (n, 4) array with the exponent of the merged tile at each merge position
+    """
+    cells = _compact_rows_(cells)
+    merged = np.zeros_like(cells)
+    for i in range(cells.shape[1] - 1):
+        mask = (cells[:, i] == cells[:, i + 1]) & (cells[:, i] != 0) & (cells[:, i] < MAX_EXPONENT)
+        cells[mask, i] += 1
+        cells[mask, i + 1] = 0
+        merged[mask, i] = cells[mask, i]
+    return _compact_rows_(cells), merged
+
+
+def _build_tables_() -> dict:
+    """ Precompute the left and right move results, score deltas and merged tiles for every possible row """
+    rows = np.arange(1 << 16, dtype=np.int64)
+    cells = np.stack([(rows >> (4 * c)) & 0xF for c in range(4)], axis=1)
+    weights = np.array([1 << (4 * c) for c in range(4)], dtype=np.int64)
+
+    # Moving a row right is moving its mirror image left, and mirroring the result back
+    left, left_merged = _slide_rows_(cells)
+    mirror = cells[:, ::-1] @ weights
+
+    tables = {}
+    for name, flip in (('left', False), ('right', True)):
+        res, merged = (left[mirror][:, ::-1], left_merged[mirror]) if flip else (left, left_merged)
+
+        result = res @ weights
+        tiles = np.where(merged > 0, 1 << merged, 0)
+
+        # Spread each resulting row over a column (nibble c -> nibble 4c) so up/down can skip transposing back
+        col = sum(((result >> (4 * c)) & 0xF) << (16 * c) for c in range(4))
+        col_orig = sum(((rows >> (4 * c)) & 0xF) << (16 * c) for c in range(4))
+
+        tables[name] = {
+            'row_xor': (result ^ rows).tolist(),
+            'col_xor': (col ^ col_orig).tolist(),
+            'score': tiles.sum(axis=1).tolist(),
+            'merged': tiles.astype(np.int32),
+        }
+    return tables
+
+
+_TABLES = _build_tables_()
+_ROW_LEFT: List[int] = _TABLES['left']['row_xor']
+_ROW_RIGHT: List[int] = _TABLES['right']['row_xor']
+_COL_UP: List[int] = _TABLES['left']['col_xor']
+_COL_DOWN: List[int] = _TABLES['right']['col_xor']
+_SCORE_LEFT: List[int] = _TABLES['left']['score']
+_SCORE_RIGHT: List[int] = _TABLES['right']['score']
+_MERGED: dict = {name: _TABLES[name]['merged'] for name in ('left', 'right')}
+_MERGES: dict = {}          # 'left'/'right' -> the merged tiles of every row as tuples, made from _MERGED when needed
+del _TABLES
+
+
+def _merges_table_(name: str) -> List[Tuple[int, ...]]:
+    table = _MERGES.get(name)
+    if table is None:
+        table = _MERGES[name] = [tuple(tile for tile in row if tile) for row in _MERGED[name].tolist()]
+    return table
+
+
+def pack(vals: np.ndarray) -> int:
+    """ Turn a 4x4 array of tile values into a bitboard """
+    if vals.shape != (4, 4):
+        raise ValueError(f"Bitboards can only hold 4x4 grids. Got an array of shape {vals.shape}.")
+    if vals.max() > 1 << MAX_EXPONENT:
+        raise ValueError(f"Bitboards can only hold tiles up to {1 << MAX_EXPONENT}. Got {vals.max()}.")
+    exps = np.where(vals > 0, np.frexp(vals)[1] - 1, 0).astype(np.uint64)
+    return int((exps.ravel() << _SHIFTS).sum())
+
+
+def unpack(board: int) -> np.ndarray:
+    """ Turn a bitboard into a 4x4 int32 array of tile values """
+    exps = (np.uint64(board) >> _SHIFTS) & np.uint64(0xF)
+    return np.where(exps > 0, np.left_shift(1, exps.astype(np.int32)), 0).astype(np.int32).reshape(4, 4)
+
+
+def transpose(board: int) -> int:
+    """ Swap rows and columns of the bitboard, i.e. nibble 4*r + c goes to 4*c + r """
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def move_left(board: int) -> (int, int):
+    """ :return: the new board and the score gained by this move """
+    r0 = board & ROW_MASK
+    r1 = (board >> 16) & ROW_MASK
+    r2 = (board >> 32) & ROW_MASK
+    r3 = (board >> 48) & ROW_MASK
+    board ^= _ROW_LEFT[r0] | (_ROW_LEFT[r1] << 16) | (_ROW_LEFT[r2] << 32) | (_ROW_LEFT[r3] << 48)
+    return board, _SCORE_LEFT[r0] + _SCORE_LEFT[r1] + _SCORE_LEFT[r2] + _SCORE_LEFT[r3]
+
+
+def move_right(board: int) -> (int, int):
+    """ :return: the new board and the score gained by this move """
+    r0 = board & ROW_MASK
+    r1 = (board >> 16) & ROW_MASK
+    r2 = (board >> 32) & ROW_MASK
+    r3 = (board >> 48) & ROW_MASK
+    board ^= _ROW_RIGHT[r0] | (_ROW_RIGHT[r1] << 16) | (_ROW_RIGHT[r2] << 32) | (_ROW_RIGHT[r3] << 48)
+    return board, _SCORE_RIGHT[r0] + _SCORE_RIGHT[r1] + _SCORE_RIGHT[r2] + _SCORE_RIGHT[r3]
+
+
+def move_up(board: int) -> (int, int):
+    """ :return: the new board and the score gained by this move """
+    t = transpose(board)
+    c0 = t & ROW_MASK
+    c1 = (t >> 16) & ROW_MASK
+    c2 = (t >> 32) & ROW_MASK
+    c3 = (t >> 48) & ROW_MASK
+    board ^= _COL_UP[c0] | (_COL_UP[c1] << 4) | (_COL_UP[c2] << 8) | (_COL_UP[c3] << 12)
+    return board, _SCORE_LEFT[c0] + _SCORE_LEFT[c1] + _SCORE_LEFT[c2] + _SCORE_LEFT[c3]
+
+
+def move_down(board: int) -> (int, int):
+    """ :return: the new board and the score gained by this move """
+    t = transpose(board)
+    c0 = t & ROW_MASK
+    c1 = (t >> 16) & ROW_MASK
+    c2 = (t >> 32) & ROW_MASK
+    c3 = (t >> 48) & ROW_MASK
+    board ^= _COL_DOWN[c0] | (_COL_DOWN[c1] << 4) | (_COL_DOWN[c2] << 8) | (_COL_DOWN[c3] << 12)
+    return board, _SCORE_RIGHT[c0] + _SCORE_RIGHT[c1] + _SCORE_RIGHT[c2] + _SCORE_RIGHT[c3]
+
+
+# Same order in which Game.command handles the arrows
+MOVES = (move_up, move_down, move_left, move_right)
+
+
+def merges(board: int, direction: int) -> List[int]:
+    """ The tiles created by moving the board in a direction (index into MOVES), in the order `Grid` reports them """
+    if direction in (0, 1):
+        board = transpose(board)
+    table = _merges_table_('left' if direction in (0, 2) else 'right')
+    return [tile for shift in (0, 16, 32, 48) for tile in table[(board >> shift) & ROW_MASK]]
+
+
+def is_over(board: int) -> bool:
+    """ True if no direction changes the board """
+    return all(move(board)[0] == board for move in MOVES)
+
+
+class BitGrid(Grid):
+    """
+        A drop-in replacement for `Grid` (4x4 only) backed by a bitboard.
+
+        `self.board` is the source of truth. `self.vals` is decoded from it on demand and cached until the board
+        changes. Write to the grid with `set_vals` (or by assigning `vals`), not by mutating `vals` in place.
+    """
+
+    def __init__(self, dim: int = 4, spawns: int = 1, numgen=None, debug: bool = False, seed: Optional[int] = None):
+        if dim != 4:
+            raise ValueError(f"BitGrid only supports 4x4 grids. Got dim: {dim}.")
+        self.board: int = 0
+        self._old_board: int = 0
+        self._vals: Optional[np.ndarray] = None
+        self._afterboards: List[int] = []
+        self._afterboards_of: Optional[int] = None
+        super().__init__(dim=dim, spawns=spawns, numgen=numgen, debug=debug, seed=seed)
+
+    @property
+    def vals(self) -> np.ndarray:
+        if self._vals is None:
+            self._vals = unpack(self.board)
+        return self._vals
+
+    @vals.setter
+    def vals(self, mat: np.ndarray):
+        self.board = pack(mat)
+        self._vals = mat
+
+    @property
+    def afterboards(self) -> List[int]:
+        """ The board after moving in each direction. Computed once per state, like `Grid.transitions`. """
+        if self._afterboards_of != self.board:
+            self._afterboards = [move(self.board)[0] for move in MOVES]
+            self._afterboards_of = self.board
+        return self._afterboards
+
+    @property
+    def transitions(self) -> List[Tuple[np.ndarray, bool, List[int]]]:
+        return [(unpack(after), after != self.board, merges(self.board, direction))
+                for direction, after in enumerate(self.afterboards)]
+
+    @property
+    def legal_moves(self) -> np.ndarray:
+        return np.array([after != self.board for after in self.afterboards])
+
+    @property
+    def is_unchanged(self) -> bool:
+        return self.board == self._old_board
+
+    @property
+    def is_over(self) -> bool:
+        return all(after == self.board for after in self.afterboards)
+
+    def spawn(self, n=-1):
+        # Grid.spawn writes into self.vals, which is our decoded cache. Pack it back in afterwards.
+        super().spawn(n)
+        self.vals = self.vals
+
+    def _move_(self, direction: int, vals: Optional[np.ndarray]) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
+        if vals is None:
+            self._old_board = self.board
+            merged = merges(self.board, direction)
+            self.board = self.afterboards[direction]
+            self._vals = None
+            self._hashes = None         # recomputed from the new board when asked for
+            return merged
+
+        board = pack(vals)
+        vals[:] = unpack(MOVES[direction](board)[0])
+        return vals, merges(board, direction)
+
+    def move(self, direction: int) -> List[int]:
+        return self._move_(direction, None)
+
+    def up(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
+        return self._move_(0, vals)
+
+    def down(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
+        return self._move_(1, vals)
+
+    def left(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
+        return self._move_(2, vals)
+
+    def right(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
+        return self._move_(3, vals)
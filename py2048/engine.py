@@ -1,27 +1,43 @@
-""" Here be dataclasses we need """
+"""
+    Here be dataclasses we need.
+
+    Importing this module only pulls in numpy and the pure game logic, so that worker processes and command line tools
+    start quickly. The UI and persistence parts (tabulate, random_username, visualisation, the journal and the session
+    index) are imported where they are first used. Nothing here seeds the global random generators either: every
+    Grid has a generator of its own.
+"""
 import json
-import curses
-import random
+import inspect
 import datetime
 import numpy as np
+from itertools import combinations, product
 from pathlib import Path
-from tabulate import tabulate
-from typing import Optional, Callable, List, Union, Tuple
-from random_username.generate import generate_username
+from typing import Optional, Callable, List, Union, Tuple, TYPE_CHECKING
 
-from visualisation import VisualizeGrid
-from utils import FancyDict, NoFreeCells, nparr_to_dict, dict_to_nparr, UnknownSessionID, VisualisationError
+from replay import Replay
+from undo import UndoBuffer
+from kernel import move_board, afterstates
+from profiling import PROFILER
+from transposition import zobrist_hashes, update_hashes
+from utils import FancyDict, NoFreeCells, nparr_to_dict, dict_to_nparr, UnknownSessionID, VisualisationError, \
+    to_exponents
+
+if TYPE_CHECKING:
+    from journal import JournalWriter
+    from visualisation import VisualizeGrid
 
 ROOT_LOC: Path = Path("..") if 'py2048/py2048' in Path().cwd().__str__() else Path(".")
 CONFIG = FancyDict(**{
-    'seed': 42,
     'savedir': ROOT_LOC / Path('saves'),
-    'max_loadgame_candidates': 5
+    'max_loadgame_candidates': 5,
+    'rng_block': 1024,          # how many random numbers a grid draws at a time, to spawn values with
+    'vector_dim': 8,            # grids at least this big move with the whole-board kernel (kernel.py), not row by row
+    'journal_queue': 4096,      # how many moves can wait for the autosave journal's writer before the game blocks
+    'journal_fsync_interval': 0.5,      # seconds
+    'compact_every': 256,       # moves between snapshots of an autosaved game (see journal.py)
+    'undo_capacity': 1024,      # how many states of a game we keep to undo to (see undo.py)
 })
 
-random.seed(CONFIG.seed)
-np.random.seed(CONFIG.seed)
-
 ASCII = FancyDict(**{
     's': 115,
     'S': 83,
@@ -33,26 +49,70 @@ ASCII = FancyDict(**{
     'N': 78,
     'h': 104,
     'H': 72,
+    'p': 112,
+    'P': 80,
+    'u': 117,
+    'U': 85,
+    'r': 114,
+    'R': 82,
+})
+
+# Arrow key codes, same as curses.KEY_* (so that the engine does not need to import curses)
+KEYS = FancyDict(**{
+    'up': 259,
+    'down': 258,
+    'left': 260,
+    'right': 261,
 })
-ARROWS = {curses.KEY_UP: '↑', curses.KEY_DOWN: '↓', curses.KEY_LEFT: '←', curses.KEY_RIGHT: '→'}
+ARROWS = {KEYS.up: '↑', KEYS.down: '↓', KEYS.left: '←', KEYS.right: '→'}
+
+# Directions as used by Grid.move and Game.step, and their arrow key codes
+DIRECTIONS = ('up', 'down', 'left', 'right')
+DIRECTION_KEYS = (KEYS.up, KEYS.down, KEYS.left, KEYS.right)
+
+
+def generate_biased_two_four(rng: Optional[np.random.Generator] = None):
+    rng = rng if rng else np.random.default_rng()
+    return 4 if rng.uniform(0, 1) > 0.8 else 2
 
 
-def generate_biased_two_four():
-    return 4 if np.random.default_rng().uniform(0, 1) > 0.8 else 2
+def generate_uniform_two_four(rng: Optional[np.random.Generator] = None):
+    rng = rng if rng else np.random.default_rng()
+    return 4 if rng.uniform(0, 1) > 0.5 else 2
 
 
-def generate_uniform_two_four():
-    return 4 if np.random.default_rng().uniform(0, 1) > 0.5 else 2
+# The probability of each number generator above spawning a 4 (instead of a 2)
+FOUR_PROBABILITY = {
+    generate_biased_two_four: 0.2,
+    generate_uniform_two_four: 0.5
+}
+
+
+def _takes_args_(fn: Callable) -> bool:
+    """ Whether a callable takes any (positional) argument, e.g. a numgen which takes a random generator """
+    try:
+        return any(param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD, param.VAR_POSITIONAL)
+                   for param in inspect.signature(fn).parameters.values())
+    except (TypeError, ValueError):
+        return False
+
+
+def fresh_seed() -> int:
+    """ A new seed from OS entropy, for when none is given """
+    return int(np.random.SeedSequence().entropy)
 
 
 class Grid:
-    def __init__(self, dim: int = 4, spawns: int = 1, numgen: Optional[Callable] = None, debug: bool = False):
+    def __init__(self, dim: int = 4, spawns: int = 1, numgen: Optional[Callable] = None, debug: bool = False,
+                 seed: Optional[int] = None):
         """
             Grid is the fundamental thing we want to have. It is a size x size matrix.
             We have four functions: up, down, left, right which simulate movements etc
         :param dim: the size of the grid. a 2048 grid is usually `4`
         :param spawns: how many new blocks are added at each iteration
         :numgen a callable that generates a number to populate the grid. If unspecified, we
+        :param seed: seeds the random generator of this grid, which decides where and what we spawn.
+            Two grids with the same seed (and the same moves) play out the same. If unspecified, we pick one.
         """
         self.vals: np.ndarray = np.zeros((dim, dim), dtype=np.int32)
         self._old_vals: np.ndarray = np.zeros((dim, dim), dtype=np.int32)
@@ -60,10 +120,32 @@ class Grid:
         self.dim: int = dim
         self._debug = debug
 
+        # Cached results of moving the grid in each direction (None till asked for), and the state they are for. See
+        #   transition.
+        self._transitions: List[Optional[Tuple[np.ndarray, bool, List[int]]]] = [None] * len(DIRECTIONS)
+        self._transitions_of: Optional[np.ndarray] = None
+        self._changed: Optional[bool] = None
+
+        # (flat cell index, value) of everything spawned by the last call to spawn
+        self.last_spawn: List[Tuple[int, int]] = []
+
+        # Zobrist hashes of the 8 symmetric versions of the grid (see transposition.py). Computed when first asked for,
+        #   and from then on updated by moves and spawns.
+        self._hashes: Optional[np.ndarray] = None
+
         self.numgen: Callable = numgen if numgen else generate_biased_two_four
+        self._numgen_takes_rng: bool = _takes_args_(self.numgen)
 
-        # The lib used to visualise the grid
-        self.viz: VisualizeGrid = VisualizeGrid(align='center')
+        # Every grid has its own random generator. We draw from it in blocks (see _randoms_) and track how many
+        #   numbers we have drawn so far, so that the generator can be put back to any point (see _seek_rng_).
+        self.seed: int = seed if seed is not None else fresh_seed()
+        self._rng: np.random.Generator = np.random.Generator(np.random.PCG64(self.seed))
+        self._randoms: np.ndarray = np.zeros(0)
+        self._randoms_start: int = 0        # how many numbers were drawn before the current block
+        self._randoms_pos: int = 0          # how many numbers of the current block are used up
+
+        # The lib used to visualise the grid (see the viz property)
+        self._viz: Optional['VisualizeGrid'] = None
 
         # Init the game
         self.spawn(2)
@@ -74,18 +156,66 @@ class Grid:
             'vals': nparr_to_dict(self.vals),
             'numgen': self.numgen.__name__,
             'spawns': self._spawn_freq,
-            'dim': self.dim
+            'dim': self.dim,
+            'seed': self.seed,
+            'draws': self.draws
         }
 
     @classmethod
     def de_serialize(cls, data: dict) -> 'Grid':
         # To make a nice json thing into an object
-        numgen = locals()[data['numgen']]
-        grid = Grid(dim=data['dim'], spawns=data['spawns'], numgen=numgen)
+        numgen = globals()[data['numgen']]
+        grid = cls(dim=data['dim'], spawns=data['spawns'], numgen=numgen, seed=data.get('seed'))
         vals = dict_to_nparr(data['vals'])
         grid.set_vals(vals)
+        if 'draws' in data:
+            grid._seek_rng_(data['draws'])
         return grid
 
+    @property
+    def nbytes(self) -> int:
+        """ Roughly how much memory the grid's arrays take (mostly the block of pre-drawn random numbers) """
+        return 2 * self.vals.nbytes + self._randoms.nbytes
+
+    @property
+    def draws(self) -> int:
+        """ How many random numbers this grid has used so far """
+        return self._randoms_start + self._randoms_pos
+
+    def _randoms_(self, n: int) -> np.ndarray:
+        """ The next n uniform random numbers in [0, 1), from the pre-drawn block (drawing a new one if needed) """
+        if self._randoms_pos + n > self._randoms.size:
+            if n > CONFIG.rng_block:
+                raise ValueError(f"Can not draw {n} random numbers at once. The limit is {CONFIG.rng_block}.")
+            self._randoms_start += self._randoms.size
+            self._randoms = self._rng.random(CONFIG.rng_block)
+            self._randoms_pos = 0
+
+        self._randoms_pos += n
+        return self._randoms[self._randoms_pos - n: self._randoms_pos]
+
+    def _seek_rng_(self, draws: int):
+        """ Put the random generator back to where it was after drawing `draws` numbers in total """
+        start = draws - draws % CONFIG.rng_block
+        bitgen = np.random.PCG64(self.seed)
+        bitgen.advance(start)
+        self._rng = np.random.Generator(bitgen)
+        self._randoms = self._rng.random(CONFIG.rng_block)
+        self._randoms_start = start
+        self._randoms_pos = draws - start
+
+    @property
+    def hashes(self) -> np.ndarray:
+        """ (8,) uint64 Zobrist hashes of the grid and its rotations and reflections """
+        if self._hashes is None:
+            self._hashes = zobrist_hashes(self.vals)
+        return self._hashes
+
+    @property
+    def canonical_hash(self) -> int:
+        """ The same for this grid and all its rotations and reflections (see transposition.py) """
+        return int(self.hashes.min())
+
     @property
     def max(self) -> int:
         return self.vals.max()
@@ -100,44 +230,62 @@ class Grid:
                              f"or the dtype: {mat.dtype} is not expected i.e.: {self.vals.dtype}")
 
         self.vals = mat
+        self._changed = None
+        self._hashes = None
 
     @property
     def is_unchanged(self) -> bool:
-        return (self.vals == self._old_vals).all()
+        if self._changed is None:
+            return (self.vals == self._old_vals).all()
+        return not self._changed
 
     @property
     def is_over(self) -> bool:
         if not bool((self.vals != 0).all()):                        # there is at least one zero
             return False
-        elif not (self.vals == self.up(self.vals.copy())).all():    # up direction changes something
-            return False
-        elif not (self.vals == self.down(self.vals.copy())).all():  # down direction changes something
-            return False
-        elif not (self.vals == self.left(self.vals.copy())).all():  # left direction changes something
-            return False
-        elif not (self.vals == self.right(self.vals.copy())).all(): # left direction changes something
-            return False
-        return True
+        # no direction changes anything. Stops moving the grid at the first one which does.
+        return not any(self.transition(direction)[1] for direction in range(len(DIRECTIONS)))
 
     def spawn(self, n=-1):
 
         if n < 0:
             n = self._spawn_freq
 
-        # choose n places from empty cells
-        zeros_x, zeros_y = np.where(self.vals == 0)
+        # choose n (distinct) places from empty cells
+        free = np.flatnonzero(self.vals == 0)
 
-        if len(zeros_x) < n:
+        if len(free) < n:
             raise NoFreeCells(f"There are not enough free positions to spawn values into.")
 
-        inds = np.random.choice(np.arange(len(zeros_x)), n)
-        insert_x = zeros_x[inds]
-        insert_y = zeros_y[inds]
+        randoms = self._randoms_(2 * n)
+        cells = []
+        for u in randoms[:n]:
+            ind = int(u * len(free))
+            cells.append(free[ind])
+            free = np.delete(free, ind)
 
         # choose values to insert
-        values = [self.numgen() for _ in range(n)]
+        if self.numgen in FOUR_PROBABILITY:
+            values = np.where(randoms[n:] < FOUR_PROBABILITY[self.numgen], 4, 2)
+        else:
+            values = [self._custom_value_(u) for u in randoms[n:]]
 
-        self.vals[insert_x, insert_y] = values
+        self.vals.flat[cells] = values
+        self.last_spawn = [(int(cell), int(value)) for cell, value in zip(cells, values)]
+        if self._hashes is not None:
+            self._hashes = update_hashes(self._hashes, self.dim, np.array(cells, dtype=np.int64),
+                                         np.zeros(len(cells), dtype=np.uint8), to_exponents(np.asarray(values)))
+        self._transitions_of = None
+
+    def _custom_value_(self, u: float) -> int:
+        """
+            A value from a numgen which is not one of ours. One which takes an argument is given a generator seeded from
+            u (one of our draws), so that what it spawns is decided by the grid's seed and draws too. One which takes
+            none is just called, and spawns whatever it likes.
+        """
+        if self._numgen_takes_rng:
+            return self.numgen(np.random.default_rng(int(u * 2 ** 53)))
+        return self.numgen()
 
     @staticmethod
     def _shift_row_(row: np.ndarray) -> np.ndarray:
@@ -201,36 +349,30 @@ class Grid:
         """ Simulate a direction movement. If vals arg is provided, we do the operation on it. Else we do it on"""
 
         if vals is None:
-            # overwrite old_val mat by current val mat
-            vals = self.vals
-            self._old_vals = np.copy(self.vals)
-            update_self = True
-        else:
-            update_self = False
+            # Use the (cached) result of simulating this direction on the current state
+            return self.move(0)
+
+        if self.dim >= CONFIG.vector_dim and not self._debug:
+            return move_board(vals, 0)
 
         # Go over each column and treat it as a row; add it back as a column
         merges = []
         for i in range(self.dim):
             op =  self._proc_row_(vals[:, i])
-            self.vals[:, i] = op[0]
+            vals[:, i] = op[0]
             merges += op[1]
 
-        if update_self:
-            self.vals = vals
-            return merges
-        else:
-            return vals, merges
+        return vals, merges
 
     def down(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
         """ Simulate a direction movement. If vals arg is provided, we do the operation on it. Else we do it on"""
 
         if vals is None:
-            # overwrite old_val mat by current val mat
-            vals = self.vals
-            self._old_vals = np.copy(self.vals)
-            update_self = True
-        else:
-            update_self = False
+            # Use the (cached) result of simulating this direction on the current state
+            return self.move(1)
+
+        if self.dim >= CONFIG.vector_dim and not self._debug:
+            return move_board(vals, 1)
 
         # Go over each column and treat it as a row; invert it; add it back as a column after inverting the output
         merges = []
@@ -239,22 +381,17 @@ class Grid:
             vals[:, i] = op[0][::-1]
             merges += op[1]
 
-        if update_self:
-            self.vals = vals
-            return merges
-        else:
-            return vals, merges
+        return vals, merges
 
     def left(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
         """ Simulate a direction movement. If vals arg is provided, we do the operation on it. Else we do it on"""
 
         if vals is None:
-            # overwrite old_val mat by current val mat
-            vals = self.vals
-            self._old_vals = np.copy(self.vals)
-            update_self = True
-        else:
-            update_self = False
+            # Use the (cached) result of simulating this direction on the current state
+            return self.move(2)
+
+        if self.dim >= CONFIG.vector_dim and not self._debug:
+            return move_board(vals, 2)
 
         # Go over each row and simply pass to the proc row
         merges = []
@@ -263,22 +400,17 @@ class Grid:
             vals[i] = op[0]
             merges += op[1]
 
-        if update_self:
-            self.vals = vals
-            return merges
-        else:
-            return vals, merges
+        return vals, merges
 
     def right(self, vals: Optional[np.ndarray] = None) -> Union[List[int], Tuple[np.ndarray, List[int]]]:
         """ Simulate a direction movement. If vals arg is provided, we do the operation on it. Else we do it on"""
 
         if vals is None:
-            # overwrite old_val mat by current val mat
-            vals = self.vals
-            self._old_vals = np.copy(self.vals)
-            update_self = True
-        else:
-            update_self = False
+            # Use the (cached) result of simulating this direction on the current state
+            return self.move(3)
+
+        if self.dim >= CONFIG.vector_dim and not self._debug:
+            return move_board(vals, 3)
 
         # Go over each row and simply pass to the proc row but inverted; and invert the output also
         merges = []
@@ -287,11 +419,92 @@ class Grid:
             vals[i] = op[0][::-1]
             merges += op[1]
 
-        if update_self:
-            self.vals = vals
-            return merges
-        else:
-            return vals, merges
+        return vals, merges
+
+    def transition(self, direction: int) -> Tuple[np.ndarray, bool, List[int]]:
+        """
+            The result of moving the current grid in one of the DIRECTIONS: the afterstate, whether it differs from
+            the current grid, and the merges. This is computed when first asked for and reused by `move`,
+            `legal_moves` and `is_over` till the grid changes (by a move, a spawn or `set_vals`).
+        """
+        if self._transitions_of is not self.vals:
+            self._transitions = [None] * len(DIRECTIONS)
+            self._transitions_of = self.vals
+        if self._transitions[direction] is None:
+            simulate = (self.up, self.down, self.left, self.right)[direction]
+            afterstate, merges = simulate(self.vals.copy())
+            self._transitions[direction] = (afterstate, not np.array_equal(afterstate, self.vals), merges)
+        return self._transitions[direction]
+
+    @property
+    def transitions(self) -> List[Tuple[np.ndarray, bool, List[int]]]:
+        """ The transition in every one of the DIRECTIONS """
+        return [self.transition(direction) for direction in range(len(DIRECTIONS))]
+
+    def afterstates(self, vals: Optional[np.ndarray] = None,
+                    out: Optional[np.ndarray] = None) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+            All four moves at once (see kernel.afterstates), for search. Neither the grid nor vals is modified.
+        :param vals: the board to move. The current one if not given.
+        :param out: a (4, dim, dim) array to write the afterstates into, so that a search can reuse its arrays
+        :return: (4, dim, dim) afterstates in the order of DIRECTIONS, (4,) score gained, (4,) whether the board changed
+        """
+        return afterstates(self.vals if vals is None else vals, out)
+
+    def chance_outcomes(self, vals: Optional[np.ndarray] = None,
+                        out: Optional[np.ndarray] = None) -> (np.ndarray, np.ndarray):
+        """
+            Every way `spawn` can fill a board, and how likely it is. The spawn picks `spawns` distinct free cells
+            uniformly, and gives each a 4 with the numgen's probability (see FOUR_PROBABILITY), a 2 otherwise.
+        :param vals: the board (usually an afterstate) to spawn into. The current one if not given.
+        :param out: an array of at least (n_outcomes, dim, dim) to write the outcomes into
+        :return: (n_outcomes, dim, dim) boards and (n_outcomes,) probabilities which add up to 1. No outcomes at all if
+            there are fewer free cells than spawns.
+        """
+        if self.numgen not in FOUR_PROBABILITY:
+            raise ValueError(f"Unknown spawn distribution for number generator: {self.numgen}.")
+
+        vals = self.vals if vals is None else vals
+        free = np.flatnonzero(vals == 0)
+        if free.size < self._spawn_freq:
+            return np.zeros((0, self.dim, self.dim), dtype=vals.dtype), np.zeros(0)
+
+        cells = np.array(list(combinations(free, self._spawn_freq)))             # (n_cells, spawns)
+        values = np.array(list(product((2, 4), repeat=self._spawn_freq)))       # (n_values, spawns)
+        four = FOUR_PROBABILITY[self.numgen]
+        value_probs = np.where(values == 4, four, 1 - four).prod(axis=1)
+
+        n = len(cells) * len(values)
+        boards = np.empty((n, self.dim, self.dim), dtype=vals.dtype) if out is None else out[:n]
+        boards[:] = vals
+        boards.reshape(n, -1)[np.arange(n)[:, None], np.repeat(cells, len(values), axis=0)] = \
+            np.tile(values, (len(cells), 1))
+        return boards, np.tile(value_probs, len(cells)) / len(cells)
+
+    @property
+    def legal_moves(self) -> np.ndarray:
+        """ A bool mask over DIRECTIONS, True where the move would change the grid """
+        return np.array([changed for _, changed, _ in self.transitions])
+
+    def move(self, direction: int) -> List[int]:
+        """ Move the grid in one of the DIRECTIONS, referred to by its index """
+        afterstate, changed, merges = self.transition(direction)
+        if changed and self._hashes is not None:
+            cells = np.flatnonzero(afterstate != self.vals)
+            self._hashes = update_hashes(self._hashes, self.dim, cells, to_exponents(self.vals.flat[cells]),
+                                         to_exponents(afterstate.flat[cells]))
+        self._old_vals = self.vals
+        self._changed = changed
+        self.vals = afterstate
+        return merges
+
+    @property
+    def viz(self) -> 'VisualizeGrid':
+        """ The lib used to visualise the grid. Made (and imported) the first time the grid is drawn. """
+        if self._viz is None:
+            from visualisation import VisualizeGrid
+            self._viz = VisualizeGrid(align='center')
+        return self._viz
 
     def __repr__(self) -> str:
 
@@ -309,17 +522,51 @@ class Game:
     """
 
     def __init__(self, grid: Optional[Grid] = None, history: Optional[List[int]] = None, score: Optional[int] = None,
-                 session_id: str = None, debug: bool = False):
+                 session_id: str = None, debug: bool = False, autosave: bool = True, seed: Optional[int] = None,
+                 replay: Optional[Replay] = None, record: bool = True):
 
         # All the state variables
-        self.grid = Grid(debug=debug) if not grid else grid
+        self.grid = Grid(debug=debug, seed=seed) if not grid else grid
         self.history: List[int] = [] if not history else history
         self.score = 0 if not score else score
         self.session_id = self._gen_session_id_() if not session_id else session_id
         self.message = ''  # This message is updated at commands, and is queried as needed for the UI
+        self.autosave = autosave  # Whether to journal every move to disk, and save when this object is deleted
+        self.journal: Optional['JournalWriter'] = None        # opened at the first move, if autosaving
+        self._epoch: int = 0            # the number of the last snapshot (see journal.py)
+        self._journaled: int = 0        # records journaled since then
+
+        # Whether to keep the replay and the undo buffer up to date. Headless play which needs neither (see env.py) is
+        #   faster without them, but such a game can not be undone or seeked, and is saved without a replay.
+        self.record: bool = record
 
-        # Shortcut to the visualization thing
-        self.viz = self.grid.viz
+        # Replays only log spawned 2s and 4s, so there is none for a grid whose numgen is not one of ours (which may
+        #   spawn anything, see Grid._custom_value_). Such a game can still be undone: its undo buffer keeps raw values.
+        self.replaying: bool = record and self.grid.numgen in FOUR_PROBABILITY
+
+        # Log of every move and spawn, from which any earlier state of the game can be rebuilt
+        self.replay: Replay = replay if replay else Replay(self.grid.dim, self.grid.vals, score=self.score,
+                                                           spawns=self.grid._spawn_freq)
+
+        # The last states of the game, to undo and redo moves with. It starts with the state we are in now.
+        self.undo_buffer: UndoBuffer = UndoBuffer(self.grid.dim, self.grid._spawn_freq, CONFIG.undo_capacity,
+                                                  raw=self.grid.numgen not in FOUR_PROBABILITY)
+        self._reset_undo_()
+
+    @property
+    def seed(self) -> int:
+        """ The seed of the random generator which decides everything this game spawns. It lives in the grid. """
+        return self.grid.seed
+
+    @property
+    def nbytes(self) -> int:
+        """ Roughly how much memory the game's state takes: the grid, the replay, the undo buffer and the history """
+        return self.grid.nbytes + self.replay.nbytes + self.undo_buffer.nbytes + 8 * len(self.history)
+
+    @property
+    def viz(self) -> 'VisualizeGrid':
+        """ Shortcut to the visualization thing """
+        return self.grid.viz
 
     def get_statusbar_message(self, width: int) -> str:
         """
@@ -333,6 +580,10 @@ class Game:
             TODO: add curses formatting support here
         :return: str
         """
+        with PROFILER.phase('statusbar'):
+            return self._statusbar_(width)
+
+    def _statusbar_(self, width: int) -> str:
         left = f"{self.score:8d} | {self.message if self.message else 'Press h for help.'}"
         history = ' '.join([ARROWS[direction] for direction in self.history[:-15:-1]][::-1])
         right = f"{history} | {self.session_id}"
@@ -348,36 +599,34 @@ class Game:
             return left + pad + right
 
     def get_loadgame_candidates(self):
-        """ Go to savedir and find savegame candidates, sorted by last edit date, and mention score and state. """
-        data = []
-        saved_files = sorted([f for f in self.save_fname.parent.glob('*.json')], key=lambda fnm: -fnm.stat().st_mtime)[:CONFIG.max_loadgame_candidates]
-        scores = []
-        is_not_gameover = []
-        edit_timestamp = []
-        for f in saved_files:
-            try:
-                loaded = json.load(f.open('r'))
-                scores.append(loaded['score'])
-                is_not_gameover.append('✓' if not loaded['gameover'] else '𐄂')
-                edit_timestamp.append(str(datetime.datetime.fromtimestamp(f.stat().st_mtime)))
-            except json.decoder.JSONDecodeError:
-                scores.append('--')
-                is_not_gameover.append('?')
-                edit_timestamp.append('XXXX-XX-XX XX:XX:XX.XXXXXX')
+        """ Ask the session index for savegame candidates, sorted by last edit date, and mention score and state. """
+        from tabulate import tabulate
+        from sessions import SessionIndex
+
+        candidates = SessionIndex.get(CONFIG.savedir).newest(CONFIG.max_loadgame_candidates)
 
         # Present all this in a nice table.
         table = [['SessionID', 'Last Edit Time', 'Score', 'Game is playable?']]
-        table += [[nm.stem, dtime, score, gmover]
-                 for nm, dtime, score, gmover in zip(saved_files, edit_timestamp, scores, is_not_gameover)]
+        table += [[entry.session_id, str(datetime.datetime.fromtimestamp(entry.mtime)), entry.score,
+                   '✓' if not entry.gameover else '𐄂'] for entry in candidates]
         return tabulate(table, headers='firstrow')
 
     @property
     def save_fname(self):
         return CONFIG.savedir / f"{self.session_id}.json"
 
+    @property
+    def replay_fname(self):
+        return CONFIG.savedir / f"{self.session_id}.replay"
+
+    @property
+    def journal_fname(self):
+        return CONFIG.savedir / f"{self.session_id}.journal"
+
     @staticmethod
     def _gen_session_id_():
         """ Gen a session ID and see if this is already saved to disk """
+        from random_username.generate import generate_username
 
         # See if the main dir exists or not
         save_loc: Path = CONFIG.savedir
@@ -407,6 +656,8 @@ class Game:
                 -> load (with dir)
                 -> save (ASCII for 's' or 'S')
                 -> help (ASCII for 'h' or 'H')
+                -> profiling on/off ('p') and its report ('P'), see profiling.py
+                -> undo ('u' or 'U') and redo ('r' or 'R')
         :return: status code:
             1. called save and save successful
             2. called save and save unsuccessful
@@ -418,9 +669,14 @@ class Game:
             8. direction arrow given and it didnt change the state
             9. direction arrow given and game over | game was over when arrow was sent
             10. unknown command
+            11. profiling switched on or off
+            12. profiling report asked for (the UI shows PROFILER.table())
+            13. called undo or redo and it changed the state
+            14. called undo or redo and there was nothing to undo or redo
         """
 
         self.message = ''
+        PROFILER.count('command')
 
         # save
         if arg_a == ASCII.s or arg_a == ASCII.S:
@@ -449,43 +705,33 @@ class Game:
             return self._newgame_(), 5
 
         elif arg_a == ASCII.h or arg_a == ASCII.H:
-            self.message = 'Press s to save; n for newgame; l to load or q to quit.'
+            self.message = 'Press s to save; u/r to undo/redo; n for newgame; l to load or q to quit.'
             return self, 6
 
-        # direction: up or down or left or right
-        elif arg_a in [curses.KEY_DOWN, curses.KEY_UP, curses.KEY_RIGHT, curses.KEY_LEFT]:
+        elif arg_a == ASCII.p:
+            self.message = f"Profiling {'on' if PROFILER.toggle() else 'off'}. Press P for the report."
+            return self, 11
 
-            """Stuff before invoking state change"""
-            # See if the game is over, in which case send a game over message and dont move the grid.
-            if self.grid.is_over:
-                self.message = 'Game over. Press n for newgame or q to quit.'
-                return self, 9
+        elif arg_a == ASCII.P:
+            return self, 12
 
-            """Invoking state change"""
-            if arg_a == curses.KEY_UP:
-                merges = self.grid.up()
-            elif arg_a == curses.KEY_DOWN:
-                merges = self.grid.down()
-            elif arg_a == curses.KEY_LEFT:
-                merges = self.grid.left()
-            elif arg_a == curses.KEY_RIGHT:
-                merges = self.grid.right()
-            else:
-                raise NotImplementedError("Code will never come here, this is only to calm PyCharm down.")
+        elif arg_a in (ASCII.u, ASCII.U, ASCII.r, ASCII.R):
+            undo = arg_a in (ASCII.u, ASCII.U)
+            if self.undo() if undo else self.redo():
+                return self, 13
+            self.message = f"Nothing to {'undo' if undo else 'redo'}."
+            return self, 14
 
-            """Post invoking state change"""
+        # direction: up or down or left or right
+        elif arg_a in DIRECTION_KEYS:
 
-            self.history.append(arg_a)          # log the direction
-            self.score += sum(merges)           # update score
+            # Move the grid, and see if the game was over (before or after the move) or if something changed
+            _, changed, gameover = self.step(DIRECTION_KEYS.index(arg_a))
 
-            # Is it game over? (do the game over fn)
-            if self.grid.is_over:
+            if gameover:
                 self.message = 'Game over. Press n for newgame or q to quit.'
                 return self, 9
-
-            # See if something changed in the grid, if so, spawn
-            if not self.grid.is_unchanged:
-                self.grid.spawn()               # spawn new values
+            elif changed:
                 return self, 7
             else:
                 self.message = 'No change. Try another direction ;)'
@@ -495,46 +741,246 @@ class Game:
             self.message = ''
             return self, 10
 
+    def step(self, direction: int) -> (int, bool, bool):
+        """
+            Move the grid in one of the DIRECTIONS (referred to by its index) and do all the game bookkeeping, but none
+            of the UI work. This is what `command` does for arrow keys, and what headless agents should call.
+        :return: the score gained by this move, whether it changed the grid, and whether the game is over
+        """
+        # See if the game is over, in which case don't move the grid.
+        with PROFILER.phase('is_over'):
+            over = self.grid.is_over
+        if over:
+            return 0, False, True
+
+        if self.autosave and self.journal is None:
+            self._open_journal_()
+
+        with PROFILER.phase('move'):
+            merges = self.grid.move(direction)
+        gain = int(sum(merges))
+
+        self.history.append(DIRECTION_KEYS[direction])      # log the direction
+        self.score += gain                                  # update score
+
+        # Is it game over? If not, and if something changed in the grid, spawn
+        with PROFILER.phase('is_over'):
+            changed, gameover, spawned = not self.grid.is_unchanged, self.grid.is_over, []
+        if changed and not gameover:
+            with PROFILER.phase('spawn'):
+                self.grid.spawn()                           # spawn new values
+            spawned = self.grid.last_spawn
+            with PROFILER.phase('is_over'):
+                gameover = self.grid.is_over                # the spawn may have filled the last free cell
+
+        if self.record:
+            with PROFILER.phase('replay'):
+                if self.replaying:
+                    self.replay.append(direction, spawned, self.grid.vals, self.score)
+                if changed:
+                    self.undo_buffer.push(self.grid.vals, self.score, self.grid.draws, len(self.history), direction,
+                                          spawned)
+
+        if self.journal is not None:
+            self._journal_(len(self.history) - 1, direction, self.score, self.grid.draws, spawned)
+
+        return gain, changed, gameover
+
+    def _journal_(self, move: int, direction: int, score: int, draws: int, spawned: List[Tuple[int, int]]):
+        """ Append a record to the journal, and compact it every CONFIG.compact_every records """
+        with PROFILER.phase('journal'):
+            self.journal.append(move, direction, score, draws, spawned)
+        self._count_journaled_()
+
+    def _journal_record_(self, record: bytes):
+        """ Like _journal_, for a record encoded already """
+        with PROFILER.phase('journal'):
+            self.journal.append_encoded(record)
+        self._count_journaled_()
+
+    def _count_journaled_(self):
+        """ Compact the journal every CONFIG.compact_every records """
+        self._journaled += 1
+        if self._journaled >= CONFIG.compact_every:
+            with PROFILER.phase('compact'):
+                self._compact_()
+
+    def _redo_(self, direction: int, spawned: List[Tuple[int, int]], score: int):
+        """ Play a move with known outcome (from the journal): move the grid and put the spawns where they were """
+        self.grid.move(direction)
+        vals = self.grid.vals.copy()
+        for cell, value in spawned:
+            vals.flat[cell] = value
+        self.grid.set_vals(vals)
+        self.grid.last_spawn = list(spawned)
+
+        self.history.append(DIRECTION_KEYS[direction])
+        self.score = score
+        if self.replaying:
+            self.replay.append(direction, spawned, self.grid.vals, self.score)
+
+    def undo(self) -> bool:
+        """
+            Go back to the state before the last move which changed the grid (dropping it, and any moves after it which
+            changed nothing, from the history and the replay). The grid's random generator goes back too, so playing
+            the same move again spawns the same. :return: whether there was anything to undo
+        """
+        state = self.undo_buffer.undo()
+        if state is None:
+            return False
+
+        record = None
+        if self.journal is not None:
+            from journal import encode_restore
+            try:
+                record = encode_restore(state.moves, state.score, state.draws, state.vals.ravel().tolist())
+            except Exception:
+                self.undo_buffer.redo()     # nothing changed yet: stay where we were
+                raise
+
+        self._truncate_(state.moves)
+        self._restore_(state)
+        if record is not None:
+            self._journal_record_(record)
+        return True
+
+    def redo(self) -> bool:
+        """ Play the last undone move again. :return: whether there was anything to redo """
+        state = self.undo_buffer.redo()
+        if state is None:
+            return False
+
+        self.history.append(DIRECTION_KEYS[state.direction])
+        if self.replaying:
+            self.replay.append(state.direction, state.spawned, state.vals, state.score)
+        self.undo_buffer.set_moves(len(self.history))
+        self._restore_(state)
+        if self.journal is not None:
+            self._journal_(len(self.history) - 1, state.direction, state.score, state.draws, state.spawned)
+        return True
+
+    def _truncate_(self, moves: int):
+        """ Forget every move after the first `moves`, from the history and the replay """
+        undone = len(self.history) - moves
+        del self.history[moves:]
+        self.replay.truncate(max(len(self.replay) - undone, 0))
+
+    def _restore_(self, state: FancyDict):
+        """ Put the grid and the score as they were in a state from the undo buffer """
+        self.grid.set_vals(state.vals)
+        self.grid._seek_rng_(state.draws)
+        self.grid.last_spawn = state.spawned
+        self.score = state.score
+
+    def _reset_undo_(self):
+        """ Forget all states to undo to, and start from the current one """
+        self.undo_buffer.clear()
+        if self.record:
+            self.undo_buffer.push(self.grid.vals, self.score, self.grid.draws, len(self.history))
+
+    def seek(self, index: int) -> (np.ndarray, int):
+        """ The grid values and the score after the first `index` moves of this game (see Replay.seek) """
+        return self.replay.seek(index, self.grid)
+
     def __del__(self):
         """
             Save the current game to disk if there is some activity in this session
             Do other things?
         :return:
         """
-        if len(self.history) > 0:
-            self._save_()
+        if self.autosave and len(self.history) > 0:
+            self.close()
 
-    def _save_(self) -> Path:
+    def _snapshot_(self) -> (List[Tuple[Path, Callable[[], bytes]]], Callable[[], None]):
         """
-            To dump the current game to disk
-        :return:
+            The files which make up a save of the game as it is now, and how to update the session index after.
+            The files come as functions which make their contents from copies of the game's state, so that the slow
+            part (dumping the history and the replay) can run on the journal's writer thread.
         """
-
-        # Prepare the entire saving thing
         save_dict = {
             'grid': self.grid.serialise(),
             'score': int(self.score),
-            'history': self.history,
+            'history': list(self.history),
             'session_id': self.session_id,
-            'gameover': self.grid.is_over
+            'gameover': bool(self.grid.is_over),
+            'epoch': self._epoch
         }
+        files = [(self.save_fname, lambda: json.dumps(save_dict).encode())]
+        if self.replaying:
+            files.insert(0, (self.replay_fname, self.replay.freeze()))
+
+        session_id, score, max_tile, save_fname = self.session_id, self.score, self.grid.max, self.save_fname
+
+        def update_index():
+            from sessions import SessionIndex
+            SessionIndex.get(CONFIG.savedir).update(session_id, score, max_tile, save_dict['gameover'],
+                                                    save_fname.stat().st_mtime)
+        return files, update_index
+
+    def _open_journal_(self):
+        """ Start journaling moves. The journal starts with a snapshot, so that the session is loadable right away. """
+        from journal import JournalWriter
+
+        CONFIG.savedir.mkdir(exist_ok=True, parents=True)
+        self.journal = JournalWriter(self.journal_fname, maxsize=CONFIG.journal_queue,
+                                     fsync_interval=CONFIG.journal_fsync_interval)
+        self._compact_()
+
+    def _compact_(self):
+        """ Have the journal's writer snapshot the game as it is now, and empty the journal (in the background) """
+        self._epoch += 1
+        self._journaled = 0
+        self.journal.compact(*self._snapshot_(), epoch=self._epoch)
+
+    def close(self):
+        """ Snapshot the game, and wait till everything is on disk. Call this when done with an autosaved game. """
+        if self.journal is not None:
+            self._compact_()
+            self.journal.close()
+            self.journal = None
 
-        try:
-            json.dump(save_dict, self.save_fname.open('w+'))
-        except (TypeError, FileNotFoundError) as e:
-            raise e
+    def _save_(self) -> Path:
+        """
+            To dump the current game to disk. Every file is written to a temporary file and renamed into place, so a
+            crash never leaves a half written save behind.
+        :return:
+        """
+        with PROFILER.phase('save'):
+            return self._write_save_()
+
+    def _write_save_(self) -> Path:
+        from journal import atomic_write
+
+        if self.journal is not None:
+            # Go through the writer, so that this snapshot is ordered with the ones it still has queued
+            self._compact_()
+            self.journal.flush()
+            return self.save_fname
+
+        # A new epoch, so that a journal left over from an earlier run of this session is not played on top of this
+        self._epoch += 1
+        CONFIG.savedir.mkdir(exist_ok=True, parents=True)
+        files, update_index = self._snapshot_()
+        for fname, serialise in files:
+            atomic_write(fname, serialise())
+        update_index()
 
         return self.save_fname
 
     @classmethod
-    def _load_(cls, session_id: str) -> 'Game':
+    def _load_(cls, session_id: str, savedir: Optional[Path] = None) -> 'Game':
         """
             Load things from a savefile (including history and state)
         :param savename:
+        :param savedir: where to look for the savefile. CONFIG.savedir if not given.
         :return:
         """
+        from journal import read_records, RESTORE, EPOCH
+
+        savedir = Path(savedir) if savedir else CONFIG.savedir
+
         # Check if savename is just the filename or the entire dir, and ensure it is a proper path
-        savename = CONFIG.savedir / f"{session_id}.json"
+        savename = savedir / f"{session_id}.json"
 
         # Load the stuff
         try:
@@ -550,9 +996,46 @@ class Game:
         # Make a grid obj
         grid: Grid = Grid.de_serialize(saved_content['grid'])
 
+        # The replay, if there is one which matches the history (older saves don't have any)
+        replay_fname = savedir / f"{session_id}.replay"
+        replay = Replay.load(replay_fname) if replay_fname.exists() else None
+        if replay is not None and len(replay) != len(saved_content['history']):
+            replay = None
+
         # And now make a new self
-        return Game(grid=grid, history=saved_content['history'],
-                    score=saved_content['score'], session_id=saved_content['session_id'])
+        game = Game(grid=grid, history=saved_content['history'],
+                    score=saved_content['score'], session_id=saved_content['session_id'], replay=replay)
+
+        game._epoch = saved_content.get('epoch', 0)
+
+        # Then play what was journaled after the snapshot, if anything. A journal of another epoch is already in it.
+        records = list(read_records(savedir / f"{session_id}.journal"))
+        if records and records[0][1] == EPOCH:
+            records = records[1:] if records[0][0] == game._epoch else []
+
+        applied = None              # the draws of the last record we played, which the generator must go back to
+        for move, direction, score, draws, spawned in records:
+            if direction == RESTORE:
+                vals = np.zeros_like(game.grid.vals)
+                for cell, value in spawned:
+                    vals.flat[cell] = value
+                game._truncate_(move)
+                game.grid.set_vals(vals)
+                game.grid.last_spawn = []
+                game.score = score
+                applied = draws
+                continue
+            if move < len(game.history):
+                continue        # only in journals from before epochs, see journal.py
+            if move > len(game.history):
+                break           # a gap, which should never happen. Don't guess.
+            game._redo_(direction, spawned, score)
+            applied = draws
+        if applied is not None:
+            game.grid._seek_rng_(applied)
+        game._reset_undo_()
+
+        return game
 
 
 if __name__ == '__main__':
@@ -563,13 +1046,13 @@ if __name__ == '__main__':
 
         cmd = input('Write your command here: ').strip().lower()
         if cmd == 'w':
-            g.command(curses.KEY_UP)
+            g.command(KEYS.up)
         if cmd == 's':
-            g.command(curses.KEY_DOWN)
+            g.command(KEYS.down)
         if cmd == 'a':
-            g.command(curses.KEY_LEFT)
+            g.command(KEYS.left)
         if cmd == 'd':
-            g.command(curses.KEY_RIGHT)
+            g.command(KEYS.right)
         if cmd == 'e':
             g.command(ord('s'))
         if cmd == 'r':
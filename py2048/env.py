@@ -0,0 +1,63 @@
+"""
+    A headless environment for programmatic play (agents, evaluation, data collection).
+
+    This is `Game` without the UI: actions are the indices of engine.DIRECTIONS (0: up, 1: down, 2: left, 3: right)
+    rather than key codes, and nothing is formatted, rendered or saved to disk.
+"""
+import numpy as np
+from typing import Optional, Callable, Type
+
+from engine import Game, Grid, DIRECTIONS
+
+
+class Env:
+
+    def __init__(self, dim: int = 4, spawns: int = 1, numgen: Optional[Callable] = None, grid_cls: Type[Grid] = Grid,
+                 record: bool = False):
+        """
+        :param dim: the size of the grid
+        :param spawns: how many new blocks are added after every move that changes the grid
+        :param numgen: the number generator used to populate the grid (see engine)
+        :param grid_cls: Grid or any of its drop-in replacements (e.g. bitboard.BitGrid)
+        :param record: whether games keep a replay and an undo buffer (see Game). Off by default, since they cost
+            time on every step.
+        """
+        self.dim: int = dim
+        self.spawns: int = spawns
+        self.numgen: Optional[Callable] = numgen
+        self.grid_cls: Type[Grid] = grid_cls
+        self.record: bool = record
+        self.game: Optional[Game] = None
+
+    @property
+    def n_actions(self) -> int:
+        return len(DIRECTIONS)
+
+    @property
+    def legal_actions(self) -> np.ndarray:
+        """ A bool mask over actions, True where the action would change the grid """
+        return self.game.grid.legal_moves
+
+    def _observe_(self) -> np.ndarray:
+        return self.game.grid.vals.copy()
+
+    def reset(self, seed: Optional[int] = None) -> np.ndarray:
+        """ Start a new game and return the initial grid. Games started with the same seed play out the same. """
+        grid = self.grid_cls(dim=self.dim, spawns=self.spawns, numgen=self.numgen, seed=seed)
+        self.game = Game(grid=grid, session_id='headless', autosave=False, record=self.record)
+        return self._observe_()
+
+    def step(self, action: int) -> (np.ndarray, int, bool, np.ndarray):
+        """
+            Move the grid. Moves which do not change the grid are allowed, they just don't do anything.
+        :param action: index into engine.DIRECTIONS
+        :return: the new grid, the score gained by this move, whether the game is over, and the legal action mask
+        """
+        if self.game is None:
+            raise ValueError("Call reset before the first step.")
+        if not 0 <= action < self.n_actions:
+            raise ValueError(f"Unknown action: {action}. Expected an integer in [0, {self.n_actions}).")
+
+        reward, _, done = self.game.step(action)
+        legal = self.legal_actions if not done else np.zeros(self.n_actions, dtype=bool)
+        return self._observe_(), reward, done, legal
@@ -0,0 +1,165 @@
+"""
+    Stream (state, action, reward, next_state, done) transitions from many games into sharded .npz files, for training.
+
+    Nothing here holds more than one shard in memory, however many games are played:
+        transitions(...) is a generator which plays games one after another with an agent, yielding as it goes,
+        ShardWriter fills preallocated arrays and writes them out as a shard whenever they are full, and
+        read_shards / read_transitions stream them back, one shard at a time.
+
+    Boards are stored as tile exponents (see utils.to_exponents), so every field has a fixed, small dtype.
+
+    Usage:
+        python export.py --agent random --games 10000 --shard-size 65536 --out data/
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Optional, Iterable, Iterator, List, Union, Tuple
+
+from env import Env
+from tournament import AGENTS, make_agent
+from utils import FancyDict, to_exponents
+
+FIELDS = ('states', 'actions', 'rewards', 'next_states', 'dones')
+
+Transition = Tuple[np.ndarray, int, int, np.ndarray, bool]
+
+
+def transitions(agent: str = 'random', agent_args: Optional[dict] = None, games: int = 1, seed: int = 0,
+                dim: int = 4) -> Iterator[Transition]:
+    """
+        Play `games` games (seeded seed, seed+1, ...) with an agent, and yield every move as it is made.
+    :return: (state, action, reward, next_state, done) with the boards as tile values
+    """
+    env = Env(dim=dim)
+    for game in range(games):
+        player = make_agent(agent, agent_args if agent_args else {}, seed + game)
+        state, done = env.reset(seed=seed + game), False
+        while not done:
+            action = player.act(env.game.grid)
+            if action is None:
+                break
+            next_state, reward, done, _ = env.step(action)
+            yield state, action, reward, next_state, done
+            state = next_state
+
+
+class ShardWriter:
+    """ Collects transitions into fixed size shards, written to `outdir` as <prefix>-00000.npz, <prefix>-00001.npz """
+
+    def __init__(self, outdir: Union[str, Path], dim: int = 4, shard_size: int = 65536, prefix: str = 'transitions',
+                 compress: bool = False):
+        """
+        :param shard_size: transitions per shard (the last one may have fewer)
+        :param compress: write shards with np.savez_compressed instead of np.savez
+        """
+        self.outdir: Path = Path(outdir)
+        self.outdir.mkdir(exist_ok=True, parents=True)
+        self.dim: int = dim
+        self.shard_size: int = shard_size
+        self.prefix: str = prefix
+        self.compress: bool = compress
+
+        self.shards: List[Path] = []
+        self.count: int = 0                     # transitions written so far, in all shards
+        self._fill: int = 0                     # transitions in the current shard
+
+        self._buffers = FancyDict(
+            states=np.zeros((shard_size, dim, dim), dtype=np.uint8),
+            actions=np.zeros(shard_size, dtype=np.uint8),
+            rewards=np.zeros(shard_size, dtype=np.int32),
+            next_states=np.zeros((shard_size, dim, dim), dtype=np.uint8),
+            dones=np.zeros(shard_size, dtype=bool),
+        )
+
+    def __enter__(self) -> 'ShardWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, state: np.ndarray, action: int, reward: int, next_state: np.ndarray, done: bool):
+        i = self._fill
+        self._buffers.states[i] = to_exponents(state)
+        self._buffers.actions[i] = action
+        self._buffers.rewards[i] = reward
+        self._buffers.next_states[i] = to_exponents(next_state)
+        self._buffers.dones[i] = done
+
+        self._fill += 1
+        if self._fill == self.shard_size:
+            self._write_()
+
+    def extend(self, stream: Iterable[Transition]) -> 'ShardWriter':
+        for transition in stream:
+            self.add(*transition)
+        return self
+
+    def _write_(self):
+        if self._fill == 0:
+            return
+
+        # Write to a temporary file first, so that a shard appears on disk complete, or not at all
+        fname = self.outdir / f"{self.prefix}-{len(self.shards):05d}.npz"
+        tmp = fname.with_name(fname.name + '.part')
+        with open(tmp, 'wb') as f:
+            (np.savez_compressed if self.compress else np.savez)(
+                f, **{field: self._buffers[field][:self._fill] for field in FIELDS})
+        os.replace(tmp, fname)
+
+        self.shards.append(fname)
+        self.count += self._fill
+        self._fill = 0
+
+    def close(self):
+        """ Write out the last (partial) shard """
+        self._write_()
+
+
+def shard_paths(source: Union[str, Path, Iterable[Union[str, Path]]]) -> List[Path]:
+    """ The shards in a directory (in order), or the given list of shard files """
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        return sorted(Path(source).glob('*.npz'))
+    if isinstance(source, (str, Path)):
+        return [Path(source)]
+    return [Path(path) for path in source]
+
+
+def read_shards(source: Union[str, Path, Iterable[Union[str, Path]]]) -> Iterator[FancyDict]:
+    """ Yield the arrays (see FIELDS) of one shard at a time """
+    for path in shard_paths(source):
+        with np.load(path) as shard:
+            yield FancyDict(**{field: shard[field] for field in FIELDS})
+
+
+def read_transitions(source: Union[str, Path, Iterable[Union[str, Path]]]) -> Iterator[Transition]:
+    """ Yield (state, action, reward, next_state, done) one at a time, with the boards as tile exponents """
+    for shard in read_shards(source):
+        for i in range(len(shard.actions)):
+            yield (shard.states[i], int(shard.actions[i]), int(shard.rewards[i]), shard.next_states[i],
+                   bool(shard.dones[i]))
+
+
+def main(args: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Play games with an agent and export their transitions as shards.")
+    parser.add_argument('--agent', default='random', choices=list(AGENTS))
+    parser.add_argument('--agent-args', default='{}', help="JSON dict of keyword arguments for the agent")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0, help="games are seeded with seed, seed+1, ...")
+    parser.add_argument('--dim', type=int, default=4)
+    parser.add_argument('--shard-size', type=int, default=65536, help="transitions per shard")
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--out', required=True, help="directory to write the shards to")
+    args = parser.parse_args(args)
+
+    stream = transitions(args.agent, json.loads(args.agent_args), args.games, args.seed, args.dim)
+    with ShardWriter(args.out, dim=args.dim, shard_size=args.shard_size, compress=args.compress) as writer:
+        writer.extend(stream)
+    print(f"Wrote {writer.count} transitions in {len(writer.shards)} shards to {args.out}.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
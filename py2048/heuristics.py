@@ -0,0 +1,132 @@
+"""
+    Board evaluation for search agents, over whole batches of boards at once.
+
+    Most features are scored per line (every row and every column) on tile exponents, and summed over the lines of a
+    board. All lines of all boards go through NumPy together. On 4x4 boards a line has at most 65536 values, so there
+    we compute every feature of every possible line once and a board becomes eight table lookups.
+
+        empty           the number of empty cells
+        merges          the number of neighbouring equal tiles (ignoring the empty cells between them)
+        monotonicity    minus how far the line is from being sorted (in either direction), with the exponents raised
+                        to MONOTONICITY_POWER so that big tiles out of order cost more
+        smoothness      minus the total difference between the exponents of neighbouring tiles
+        sum             minus the sum of the exponents raised to SUM_POWER, so that fewer, bigger tiles score higher
+        corner          (per board) the exponents weighted by a gradient towards the best corner
+"""
+import numpy as np
+from typing import Optional
+
+from kernel import shift_rows
+from utils import FancyDict, to_exponents
+
+MONOTONICITY_POWER: float = 4.
+SUM_POWER: float = 3.5
+
+FEATURES = ('empty', 'merges', 'monotonicity', 'smoothness', 'sum', 'corner')
+LINE_FEATURES = FEATURES[:-1]
+
+DEFAULT_WEIGHTS = FancyDict(empty=270., merges=700., monotonicity=47., smoothness=0., sum=11., corner=0.)
+
+# The largest exponent the 4x4 tables cover (4 bits per cell, like bitboard.py)
+TABLE_MAX_EXPONENT: int = 15
+
+_line_tables: Optional[FancyDict] = None
+
+
+def line_features(lines: np.ndarray) -> FancyDict:
+    """ The features (see LINE_FEATURES) of every line in a (n, dim) array of exponents, as (n,) float arrays """
+    lines = lines.astype(np.float64)
+    packed = shift_rows(lines)
+    pairs = (packed[:, 1:] != 0) & (packed[:, :-1] != 0)
+
+    powered = lines ** MONOTONICITY_POWER
+    steps = powered[:, 1:] - powered[:, :-1]
+    descending = np.where(steps < 0, -steps, 0.).sum(axis=1)
+    ascending = np.where(steps > 0, steps, 0.).sum(axis=1)
+
+    return FancyDict(
+        empty=(lines == 0).sum(axis=1).astype(np.float64),
+        merges=((packed[:, 1:] == packed[:, :-1]) & pairs).sum(axis=1).astype(np.float64),
+        monotonicity=-np.minimum(ascending, descending),
+        smoothness=-(np.abs(packed[:, 1:] - packed[:, :-1]) * pairs).sum(axis=1),
+        sum=-(lines ** SUM_POWER).sum(axis=1),
+    )
+
+
+def corner_feature(exps: np.ndarray) -> np.ndarray:
+    """ For (N, dim, dim) exponents: the largest sum of exponents weighted by a gradient towards one of the corners """
+    dim = exps.shape[-1]
+    rows, cols = np.indices((dim, dim))
+    gradient = (2 * (dim - 1) - rows - cols) / (2 * (dim - 1)) if dim > 1 else np.ones((1, 1))
+    corners = [gradient, gradient[:, ::-1], gradient[::-1, :], gradient[::-1, ::-1]]
+    return np.max([(exps * corner).sum(axis=(1, 2)) for corner in corners], axis=0)
+
+
+def line_tables() -> FancyDict:
+    """ The features of every possible line of a 4x4 board, indexed by its exponents packed 4 bits each """
+    global _line_tables
+    if _line_tables is None:
+        lines = np.arange(1 << 16)
+        _line_tables = line_features(np.stack([(lines >> (4 * c)) & 0xF for c in range(4)], axis=1))
+    return _line_tables
+
+
+def pack_lines(exps: np.ndarray) -> np.ndarray:
+    """ (N, 4, 4) exponents to (N, 8) table indices: the four rows, then the four columns """
+    shifts = np.array([0, 4, 8, 12], dtype=np.int64)
+    exps = exps.astype(np.int64)
+    return np.concatenate([(exps << shifts).sum(axis=2), (exps << shifts[:, None]).sum(axis=1)], axis=1)
+
+
+class Heuristic:
+
+    def __init__(self, **weights: float):
+        """
+            A weighted sum of the FEATURES. Call it on one board, or use `batch` for many.
+        :param weights: the weight of each feature. Features not given keep their DEFAULT_WEIGHTS.
+        """
+        unknown = set(weights) - set(FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown features: {sorted(unknown)}. Expected some of {FEATURES}.")
+        self.weights = FancyDict(**{**DEFAULT_WEIGHTS, **weights})
+        self._table: Optional[np.ndarray] = None
+
+    @property
+    def table(self) -> np.ndarray:
+        """ The weighted line features of every possible 4x4 line """
+        if self._table is None:
+            tables = line_tables()
+            self._table = sum(self.weights[name] * tables[name] for name in LINE_FEATURES)
+        return self._table
+
+    def features(self, boards: np.ndarray) -> FancyDict:
+        """ Every feature of every board in a (N, dim, dim) array of tile values, as (N,) arrays (not weighted) """
+        exps = to_exponents(boards)
+        n, dim, _ = exps.shape
+        lines = np.concatenate([exps, exps.transpose(0, 2, 1)], axis=1).reshape(-1, dim)
+        features = FancyDict(**{name: values.reshape(n, 2 * dim).sum(axis=1)
+                                for name, values in line_features(lines).items()})
+        features.corner = corner_feature(exps)
+        return features
+
+    def batch(self, boards: np.ndarray) -> np.ndarray:
+        """ The value of every board in a (N, dim, dim) array of tile values """
+        boards = np.asarray(boards)
+        exps = to_exponents(boards)
+        if boards.shape[1:] == (4, 4) and exps.max(initial=0) <= TABLE_MAX_EXPONENT:
+            values = self.table[pack_lines(exps)].sum(axis=1)
+        else:
+            features = self.features(boards)
+            values = sum(self.weights[name] * features[name] for name in LINE_FEATURES)
+
+        if self.weights.corner:
+            values = values + self.weights.corner * corner_feature(exps)
+        return values
+
+    def __call__(self, vals: np.ndarray) -> float:
+        return float(self.batch(vals[None])[0])
+
+
+# The heuristic with the default weights
+evaluate_heuristic: Heuristic = Heuristic()
+
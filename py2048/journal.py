@@ -0,0 +1,235 @@
+"""
+    Crash safe autosaving: an append-only journal of moves per session, written by a background thread.
+
+    A session on disk is a snapshot (<session>.json and <session>.replay) plus a journal (<session>.journal) of the
+    moves made after it. Each journal record is framed with its length and a CRC32, so a torn write at the end of the
+    file (e.g. from a crash) is detected and ignored when loading. We lose at most the records not yet flushed.
+
+    The game puts moves on a bounded queue, and a writer thread appends them to the journal in batches, calling fsync at
+    most once every `fsync_interval` seconds. If the disk falls far behind, the queue fills up and the game waits.
+
+    Every now and then the journal is compacted: each snapshot file is written to a temporary file and renamed over the
+    old one (atomically), and then the journal is emptied. Every snapshot has a number (its epoch), and the emptied
+    journal starts with a record of that number: on load, a journal which does not start with the snapshot's epoch
+    is from before the snapshot, and already in it. So a crash anywhere in between loses nothing. (Journals from before
+    epochs have no such record, and their records numbered before the snapshot's move count are skipped instead.)
+
+    Besides moves, a journal has records for undoing (RESTORE): the game went back to an earlier board, which we write
+    in full after the record, as one value per cell, with no spawns. Redoing a move is journaled as the move.
+"""
+import os
+import zlib
+import time
+import queue
+import struct
+import threading
+from pathlib import Path
+from typing import List, Tuple, Optional, Union, Iterator, Callable
+
+from utils import JournalClosed
+
+# payload length, crc32 of the payload
+FRAME = struct.Struct('<HI')
+# move number, direction, score after the move, random numbers drawn by the grid after the move, number of spawns
+RECORD = struct.Struct('<IBqQB')
+# flat cell index, value
+SPAWN = struct.Struct('<HI')
+# one cell of the board of a RESTORE record
+CELL = struct.Struct('<I')
+
+# Directions of records which are not moves
+RESTORE: int = 254      # the game went back to the board after the record, with `move` moves in its history
+EPOCH: int = 255        # the first record of a journal. `move` is the epoch of the snapshot it follows.
+
+
+def atomic_write(path: Path, data: bytes, fsync: bool = True):
+    """ Write data to a temporary file next to path, and rename it over path. Readers see either old or new data. """
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def encode_record(move: int, direction: int, score: int, draws: int, spawned: List[Tuple[int, int]]) -> bytes:
+    payload = RECORD.pack(move, direction, score, draws, len(spawned))
+    payload += b''.join(SPAWN.pack(cell, value) for cell, value in spawned)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_restore(move: int, score: int, draws: int, vals: List[int]) -> bytes:
+    """ A RESTORE record, going back to the board with these (flat) values. Boards of any size fit, unlike spawns. """
+    payload = RECORD.pack(move, RESTORE, score, draws, 0) + struct.pack(f'<{len(vals)}I', *vals)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path: Union[str, Path]) -> Iterator[Tuple[int, int, int, int, List[Tuple[int, int]]]]:
+    """
+        Yield (move, direction, score, draws, spawned) for every record of a journal, stopping at the first one which is
+        incomplete or corrupt (everything after it was never acknowledged as written). The board of a RESTORE record is
+        yielded as its nonzero cells in place of the spawns.
+    """
+    path = Path(path)
+    if not path.exists():
+        return
+    data = path.read_bytes()
+
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size: offset + FRAME.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc or length < RECORD.size:
+            return
+        move, direction, score, draws, n_spawns = RECORD.unpack_from(payload)
+        spawned = [SPAWN.unpack_from(payload, RECORD.size + i * SPAWN.size) for i in range(n_spawns)]
+        if direction == RESTORE and not n_spawns:
+            board = struct.unpack_from(f'<{(length - RECORD.size) // CELL.size}I', payload, RECORD.size)
+            spawned = [(cell, value) for cell, value in enumerate(board) if value]
+        yield move, direction, score, draws, spawned
+        offset += FRAME.size + length
+
+
+class JournalWriter:
+    """ Appends records to one journal file from a background thread. See the module docstring. """
+
+    def __init__(self, path: Union[str, Path], maxsize: int = 4096, fsync_interval: float = 0.5):
+        """
+        :param path: the journal file. Records are appended to whatever is already in it.
+        :param maxsize: how many records (and other requests) can wait in the queue before `append` blocks
+        :param fsync_interval: seconds between fsyncs, while there is anything unsynced
+        """
+        self.path: Path = Path(path)
+        self.fsync_interval: float = fsync_interval
+
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._file = open(self.path, 'ab')
+        self._dirty: bool = False               # written but not fsync-ed
+        self._last_sync: float = time.monotonic()
+        self._error: Optional[BaseException] = None
+
+        self._thread = threading.Thread(target=self._run_, name=f"journal-{self.path.stem}", daemon=True)
+        self._thread.start()
+
+    def _check_(self):
+        if self._error is not None:
+            raise self._error
+
+    def _put_(self, request: Tuple[str, object]):
+        """ Queue a request, waiting while the queue is full, but not for a writer which has stopped """
+        while True:
+            try:
+                return self._queue.put(request, timeout=0.1)
+            except queue.Full:
+                if not self._thread.is_alive():
+                    self._check_()
+                    raise JournalClosed(f"The writer of {self.path} has stopped.")
+
+    def append(self, move: int, direction: int, score: int, draws: int, spawned: List[Tuple[int, int]]):
+        """ Queue one move. Blocks while the queue is full, and raises if the writer stops meanwhile. """
+        self.append_encoded(encode_record(move, direction, score, draws, spawned))
+
+    def append_encoded(self, record: bytes):
+        """ Queue a record made already (by encode_record or encode_restore). Blocks like `append`. """
+        self._check_()
+        self._put_(('record', record))
+
+    def compact(self, files: List[Tuple[Path, Callable[[], bytes]]], callback: Optional[Callable[[], None]] = None,
+                epoch: int = 0):
+        """
+            Queue a compaction: after every record queued so far is written, atomically write the snapshot files (in
+            this order) and empty the journal. The snapshot must include every move queued so far.
+        :param files: the paths, and functions which make their contents. They are called on the writer thread, so
+            that the game does not wait for the serialisation, and must only use copies of the game's state.
+        :param callback: called (from the writer thread) once the snapshot is on disk
+        :param epoch: the number of the snapshot, which the emptied journal starts with (see the module docstring)
+        """
+        self._check_()
+        self._put_(('compact', (files, callback, epoch)))
+
+    def flush(self):
+        """ Block till everything queued so far is written and fsync-ed """
+        self._check_()
+        done = threading.Event()
+        self._put_(('sync', done))
+        while not done.wait(0.1):
+            if not self._thread.is_alive():
+                break
+        self._check_()
+
+    def close(self):
+        """ Write and fsync whatever is queued, and stop the writer thread """
+        if self._thread.is_alive():
+            self._put_(('stop', None))
+            self._thread.join()
+        self._check_()
+
+    def _sync_(self):
+        self._file.flush()
+        if self._dirty:
+            os.fsync(self._file.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def _compact_(self, files: List[Tuple[Path, Callable[[], bytes]]], callback: Optional[Callable[[], None]],
+                  epoch: int):
+        self._sync_()
+        for path, serialise in files:
+            atomic_write(path, serialise())
+        self._file.close()
+        atomic_write(self.path, encode_record(epoch, EPOCH, 0, 0, []))
+        self._file = open(self.path, 'ab')
+        if callback is not None:
+            callback()
+
+    def _run_(self):
+        stop = False
+        while not stop:
+            try:
+                # While something is unsynced, wake up in time to sync it
+                timeout = max(0., self._last_sync + self.fsync_interval - time.monotonic()) if self._dirty else None
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+
+            # Take everything else that is waiting, so that it goes out in one write
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                pending = []
+                for kind, item in batch:
+                    if kind == 'record':
+                        pending.append(item)
+                        continue
+
+                    if pending:
+                        self._file.write(b''.join(pending))
+                        self._dirty, pending = True, []
+                    if kind == 'compact':
+                        self._compact_(*item)
+                    elif kind == 'sync':
+                        self._sync_()
+                        item.set()
+                    elif kind == 'stop':
+                        self._sync_()
+                        stop = True
+
+                if pending:
+                    self._file.write(b''.join(pending))
+                    self._dirty = True
+                self._file.flush()
+                if self._dirty and time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync_()
+            except BaseException as e:
+                # Surface the error to the game on its next call, and don't leave anyone waiting on us
+                self._error, stop = e, True
+                for kind, item in batch:
+                    if kind == 'sync':
+                        item.set()
+
+        self._file.close()
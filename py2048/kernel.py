@@ -0,0 +1,102 @@
+"""
+    Whole-board moves with NumPy array operations: the `Grid._proc_row_` semantics (shift, merge, shift) for every row
+    of one or many boards at once, with no Python loop over rows or cells. The cost grows with the number of cells.
+
+    Every move is done by re-orienting the boards so that the requested direction becomes 'left'. Then:
+        shift: every nonzero cell goes to (the number of nonzero cells up to and including it) - 1
+        merge: runs of equal nonzero cells merge in pairs from the left, i.e. a cell absorbs the one after it when both
+            are equal, and it is at an even position within its run
+        shift again, to close the gaps the merges left.
+"""
+import numpy as np
+from typing import List, Optional
+
+# Same order as engine.DIRECTIONS
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+
+
+def orient(vals: np.ndarray, direction: int) -> np.ndarray:
+    """ A view of (..., dim, dim) boards in which moving in `direction` amounts to moving every row left """
+    if direction == UP:
+        return vals.swapaxes(-1, -2)
+    elif direction == DOWN:
+        return vals.swapaxes(-1, -2)[..., ::-1]
+    elif direction == LEFT:
+        return vals
+    elif direction == RIGHT:
+        return vals[..., ::-1]
+    raise ValueError(f"Unknown direction: {direction}. Expected one of {UP, DOWN, LEFT, RIGHT}.")
+
+
+def shift_rows(rows: np.ndarray) -> np.ndarray:
+    """ Slide all nonzero values of every row in a (n, dim) array to the left, preserving their order """
+    nonzero = rows != 0
+    to = np.cumsum(nonzero, axis=1) - 1
+    out = np.zeros_like(rows)
+    out[np.nonzero(nonzero)[0], to[nonzero]] = rows[nonzero]
+    return out
+
+
+def merge_heads(rows: np.ndarray) -> np.ndarray:
+    """ A (n, dim) bool mask of the cells which absorb their right neighbour when merging (left to right) """
+    n, dim = rows.shape
+    same = (rows[:, 1:] == rows[:, :-1]) & (rows[:, 1:] != 0)       # cell i + 1 equals cell i
+
+    # The position of every cell within its run of equal cells
+    starts = np.ones((n, dim), dtype=bool)
+    starts[:, 1:] = ~same
+    cols = np.arange(dim)
+    run_start = np.maximum.accumulate(np.where(starts, cols, 0), axis=1)
+    even = (cols - run_start) % 2 == 0
+
+    heads = np.zeros((n, dim), dtype=bool)
+    heads[:, :-1] = even[:, :-1] & same
+    return heads
+
+
+def merge_rows(rows: np.ndarray) -> (np.ndarray, np.ndarray):
+    """ Merge consecutive equal cells (left to right) of every row in a (n, dim) array, in place """
+    heads = merge_heads(rows)
+    rows[heads] *= 2
+    rows[:, 1:][heads[:, :-1]] = 0
+    return rows, (rows * heads).sum(axis=1, dtype=np.int64)
+
+
+def proc_rows(rows: np.ndarray) -> (np.ndarray, np.ndarray):
+    """ Vectorized `Grid._proc_row_` over a (n, dim) array. Returns the new rows and the score gained by each row. """
+    rows = shift_rows(rows)
+    rows, scores = merge_rows(rows)
+    return shift_rows(rows), scores
+
+
+def move_board(vals: np.ndarray, direction: int) -> (np.ndarray, List[int]):
+    """
+        Move one (dim, dim) board, in place, exactly like Grid.up/down/left/right(vals) do.
+    :return: the board, and the value of every merged cell in the order the row by row version finds them
+    """
+    view = orient(vals, direction)
+    rows = shift_rows(view)
+    heads = merge_heads(rows)
+    rows[heads] *= 2
+    merges = rows[heads].tolist()
+    rows[:, 1:][heads[:, :-1]] = 0
+    view[...] = shift_rows(rows)
+    return vals, merges
+
+
+def afterstates(vals: np.ndarray, out: Optional[np.ndarray] = None) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+        Move a (dim, dim) board in each of the four directions, all rows of all four together.
+    :param out: a (4, dim, dim) array to write the afterstates into. If not given, we make one.
+    :return: the afterstates (in the order UP, DOWN, LEFT, RIGHT), the score each move gains, and whether it changes
+        the board
+    """
+    dim = vals.shape[0]
+    out = np.empty((4, dim, dim), dtype=vals.dtype) if out is None else out
+    out[:] = vals
+
+    rows, scores = proc_rows(np.concatenate([orient(out[direction], direction) for direction in range(4)]))
+    for direction in range(4):
+        orient(out[direction], direction)[...] = rows[direction * dim: (direction + 1) * dim]
+
+    return out, scores.reshape(4, dim).sum(axis=1), (out != vals).any(axis=(1, 2))
@@ -0,0 +1,205 @@
+"""
+    Keep the games a long running process hosts in memory, up to a limit, and the rest on disk.
+
+    SessionManager is an LRU cache of `Game` objects by session ID. A miss loads the game from its savefiles
+    (Game._load_), and when the cache goes over its limit on sessions or (estimated) memory, the least recently used
+    games are evicted. Evicted games which changed since they were last saved are written back (Game._save_) first,
+    so nothing is lost, and games which did not change are just dropped.
+
+    Managed games never autosave (no journal thread, nothing written from __del__): the manager decides when they are
+    saved. Callers should `mark_dirty` a game after changing it, and `flush` before shutting down.
+
+    The manager does no locking, and the calls which touch the disk are separate (load, write_back) from the ones that
+    only update the cache (get, put, put_loaded), so that an asyncio server can run the first in a thread pool (see
+    server.py). Any of the latter may evict, and returns the games to write back. `open` does both, for simple
+    synchronous use.
+"""
+from collections import OrderedDict
+from typing import Optional, List, Dict, Tuple
+
+from engine import Game
+from utils import FancyDict
+
+# Estimate of the memory a game takes besides its arrays (see Game.nbytes): the Python objects themselves
+GAME_OVERHEAD: int = 4096
+
+
+class SessionManager:
+
+    def __init__(self, max_sessions: int = 1024, max_bytes: Optional[int] = None):
+        """
+        :param max_sessions: the most games we keep in memory
+        :param max_bytes: the most memory (estimated, see Game.nbytes) all of them together may take. No limit if None.
+        """
+        if max_sessions < 1:
+            raise ValueError(f"Must keep at least 1 session. Got {max_sessions}.")
+
+        self.max_sessions: int = max_sessions
+        self.max_bytes: Optional[int] = max_bytes
+
+        self._games: 'OrderedDict[str, Game]' = OrderedDict()      # the least recently used first
+        self._sizes: Dict[str, int] = {}
+        self._dirty: set = set()
+        self._evicting: Dict[str, Game] = {}       # evicted, but not written back yet. Still ours to hand out.
+        self.nbytes: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.loads: int = 0
+        self.evictions: int = 0
+        self.writebacks: int = 0
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._games
+
+    def _size_(self, session_id: str, game: Game):
+        self.nbytes += game.nbytes + GAME_OVERHEAD - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = game.nbytes + GAME_OVERHEAD
+
+    def get(self, session_id: str) -> Tuple[Optional[Game], List[Game]]:
+        """
+            The game, if it is in memory (which makes it the most recently used one), else None.
+        :return: it, and the games which must be written back (see write_back) since taking it back in evicted them.
+            Only a game which was evicted but not written back yet is taken back in.
+        """
+        game = self._games.get(session_id)
+        if game is not None:
+            self._games.move_to_end(session_id)
+            self.hits += 1
+            return game, []
+
+        if session_id in self._evicting:
+            self.hits += 1
+            return self._readmit_(session_id)
+
+        self.misses += 1
+        return None, []
+
+    def _readmit_(self, session_id: str) -> Tuple[Game, List[Game]]:
+        """ Take back in a game which is still being written back. It stays dirty, since it may change from here on. """
+        game = self._evicting[session_id]
+        self._games[session_id] = game
+        self._size_(session_id, game)
+        self._dirty.add(session_id)
+        return game, self._evict_(keep=session_id)
+
+    def put(self, game: Game, dirty: bool = True) -> List[Game]:
+        """
+            Keep a game in memory, as the most recently used one.
+        :param dirty: whether it changed since it was last saved
+        :return: the evicted games which must be written back (see write_back). They stay reachable through `get`
+            till then.
+        """
+        game.autosave = False
+        self._games[game.session_id] = game
+        self._games.move_to_end(game.session_id)
+        self._size_(game.session_id, game)
+        if dirty:
+            self._dirty.add(game.session_id)
+        return self._evict_(keep=game.session_id)
+
+    def put_loaded(self, game: Game) -> Tuple[Game, List[Game]]:
+        """
+            Keep a game we just loaded (see load), unless another copy of it got in memory in the meantime, which wins.
+        :return: the copy we keep, and the games which must be written back
+        """
+        current = self._games.get(game.session_id)
+        if current is not None:
+            self._games.move_to_end(game.session_id)
+            return current, []
+        if game.session_id in self._evicting:
+            return self._readmit_(game.session_id)
+        return game, self.put(game, dirty=False)
+
+    def _evict_(self, keep: Optional[str] = None) -> List[Game]:
+        evicted = []
+        while len(self._games) > self.max_sessions or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+            session_id = next(iter(self._games))
+            if session_id == keep:
+                break               # never evict the game we were just given, however big it is
+            game = self._games.pop(session_id)
+            self.nbytes -= self._sizes.pop(session_id)
+            self.evictions += 1
+            if session_id in self._dirty:
+                self._dirty.discard(session_id)
+                self._evicting[session_id] = game
+                evicted.append(game)
+        return evicted
+
+    def mark_dirty(self, session_id: str):
+        """ Note that a game changed (and may have grown) since it was last saved """
+        game = self._games.get(session_id)
+        if game is not None:
+            self._dirty.add(session_id)
+            self._size_(session_id, game)
+
+    def mark_clean(self, session_id: str):
+        """ Note that a game was just saved """
+        self._dirty.discard(session_id)
+
+    def is_dirty(self, session_id: str) -> bool:
+        return session_id in self._dirty
+
+    def pop(self, session_id: str) -> Optional[Game]:
+        """ Stop managing a game (without saving it). :return: it, if we had it """
+        self._dirty.discard(session_id)
+        self._evicting.pop(session_id, None)
+        game = self._games.pop(session_id, None)
+        if game is not None:
+            self.nbytes -= self._sizes.pop(session_id)
+        return game
+
+    def load(self, session_id: str) -> Game:
+        """ Read a game from disk (Game._load_), without putting it in the cache. Blocking. """
+        game = Game._load_(session_id)
+        game.autosave = False
+        self.loads += 1
+        return game
+
+    def write_back(self, game: Game):
+        """ Save an evicted game (Game._save_). Blocking. """
+        game._save_()
+        self.writebacks += 1
+        if self._evicting.get(game.session_id) is game:
+            del self._evicting[game.session_id]
+
+    def open(self, session_id: str) -> Game:
+        """ The game, from memory or else from disk, writing back whatever that evicts. Blocking. """
+        game, evicted = self.get(session_id)
+        if game is None:
+            game, evicted = self.put_loaded(self.load(session_id))
+        for evicted_game in evicted:
+            self.write_back(evicted_game)
+        return game
+
+    def flush(self) -> int:
+        """ Save every game which changed since it was last saved. Blocking. :return: how many we saved """
+        pending = {**self._evicting, **{session_id: self._games[session_id] for session_id in self._dirty}}
+        for game in pending.values():
+            game._save_()
+            self.writebacks += 1
+        self._evicting, self._dirty = {}, set()
+        return len(pending)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def report(self) -> FancyDict:
+        return FancyDict(
+            sessions=len(self._games),
+            max_sessions=self.max_sessions,
+            nbytes=self.nbytes,
+            max_bytes=self.max_bytes,
+            dirty=len(self._dirty),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hit_rate,
+            loads=self.loads,
+            evictions=self.evictions,
+            writebacks=self.writebacks,
+        )
@@ -0,0 +1,245 @@
+"""
+    An n-tuple network: a value function for 4x4 boards, trained by temporal difference learning through self-play.
+
+    A tuple is a fixed set of k cells. The tile exponents in those cells (4 bits each, like bitboard.py) index a table
+    of 16**k weights, and the value of a board is the sum of the weights its tuples pick. All tables live in one flat
+    float32 array. Every tuple is also looked up in all 8 symmetries (rotations and reflections) of the board, sharing
+    the same table, so the network values symmetric boards the same and learns from each board 8 times over.
+
+    Looking up, or updating, all (tuple, symmetry) pairs of a batch of boards is one fancy index into the weights.
+
+    Training (afterstate TD learning): we move greedily by reward + value of the afterstate, and after every move nudge
+    the value of the previous afterstate towards reward + value of the new one (TD(0)). With lambda > 0 the error is
+    also passed back to the afterstates before it, decayed by lambda per step (a truncated eligibility trace).
+
+    Usage:
+        python ntuple.py --games 10000 --alpha 0.1 --out weights.npy
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import Optional, Iterable, List, Sequence, Union
+
+from bitboard import BitGrid, MOVES
+from engine import FOUR_PROBABILITY, generate_biased_two_four
+from utils import FancyDict, to_exponents
+
+# Four 6-tuples, as in the strongest published 2048 n-tuple players. 4 * 16**6 weights: 256MB as float32.
+DEFAULT_PATTERNS = (
+    (0, 1, 2, 3, 4, 5),
+    (4, 5, 6, 7, 8, 9),
+    (0, 1, 2, 4, 5, 6),
+    (4, 5, 6, 8, 9, 10),
+)
+
+# Rows and squares: 4-tuples, 6 * 16**4 weights. Small and quick to train; for tests and experiments.
+SMALL_PATTERNS = (
+    (0, 1, 2, 3),
+    (4, 5, 6, 7),
+    (0, 1, 4, 5),
+    (1, 2, 5, 6),
+    (5, 6, 9, 10),
+    (0, 4, 8, 12),
+)
+
+_SHIFTS: np.ndarray = np.arange(0, 64, 4, dtype=np.uint64)
+
+# The chance of spawning a 4 in self-play, as for a Grid with the default number generator
+FOUR: float = FOUR_PROBABILITY[generate_biased_two_four]
+
+
+def symmetries() -> np.ndarray:
+    """ (8, 16): for every symmetry of the 4x4 board, which cell of the board ends up in each cell """
+    cells = np.arange(16).reshape(4, 4)
+    rotations = [np.rot90(cells, k) for k in range(4)]
+    return np.stack([board.ravel() for board in rotations + [np.fliplr(board) for board in rotations]])
+
+
+def exponents_of(boards: Sequence[int]) -> np.ndarray:
+    """ (N, 16) tile exponents of N bitboards """
+    return ((np.array(boards, dtype=np.uint64)[:, None] >> _SHIFTS) & np.uint64(0xF)).astype(np.int64)
+
+
+class NTupleNetwork:
+
+    def __init__(self, patterns: Sequence[Sequence[int]] = DEFAULT_PATTERNS, weights: Optional[np.ndarray] = None):
+        """
+        :param patterns: the tuples, as flat cell indices (row * 4 + column). All must have the same length.
+        :param weights: the flat weight array (e.g. memory mapped by `load`). Zeros if not given.
+        """
+        self.patterns = [tuple(int(cell) for cell in pattern) for pattern in patterns]
+        k = len(self.patterns[0])
+        if any(len(pattern) != k for pattern in self.patterns):
+            raise ValueError(f"All patterns must have the same length. Got {self.patterns}.")
+
+        self.size: int = len(self.patterns) * 16 ** k
+        if weights is None:
+            weights = np.zeros(self.size, dtype=np.float32)
+        if weights.shape != (self.size,):
+            raise ValueError(f"Expected {self.size} weights for these patterns. Got an array of shape {weights.shape}.")
+        self.weights: np.ndarray = weights
+
+        # (n_patterns * 8, k) cells to read for every (pattern, symmetry), and where its table starts
+        syms = symmetries()
+        self._cells = np.array([[sym[cell] for cell in pattern] for pattern in self.patterns for sym in syms])
+        self._offsets = np.repeat(np.arange(len(self.patterns)) * 16 ** k, len(syms))
+        self._powers = 16 ** np.arange(k)
+
+    @property
+    def n_lookups(self) -> int:
+        """ Weights summed per board """
+        return len(self._cells)
+
+    def indices(self, exps: np.ndarray) -> np.ndarray:
+        """ (N, 16) exponents to the (N, n_lookups) indices of the weights they pick """
+        return exps[:, self._cells] @ self._powers + self._offsets
+
+    def values(self, exps: np.ndarray) -> np.ndarray:
+        """ The value of every board in an (N, 16) array of exponents """
+        return self.weights[self.indices(exps)].sum(axis=1)
+
+    def batch(self, boards: np.ndarray) -> np.ndarray:
+        """ The value of every board in an (N, 4, 4) array of tile values (so this can evaluate for agents) """
+        return self.values(to_exponents(np.asarray(boards)).reshape(-1, 16).astype(np.int64))
+
+    def __call__(self, vals: np.ndarray) -> float:
+        return float(self.batch(vals[None])[0])
+
+    def update(self, indices: np.ndarray, delta: float):
+        """ Add delta to every weight in indices (repeats count once per occurrence) """
+        np.add.at(self.weights, indices, delta)
+
+    def save(self, path: Union[str, Path]):
+        """ The weights as .npy (which `load` can memory map), and the patterns next to it as .json """
+        path = Path(path)
+        np.save(path, self.weights)
+        path.with_suffix('.json').write_text(json.dumps({'patterns': self.patterns}))
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap_mode: Optional[str] = 'r') -> 'NTupleNetwork':
+        """
+        :param mmap_mode: passed to np.load. 'r' (the default) shares read only weights between processes for free,
+            'r+' trains in place on disk, and None reads everything into memory.
+        """
+        path = Path(path)
+        patterns = json.loads(path.with_suffix('.json').read_text())['patterns']
+        return cls(patterns, weights=np.load(path, mmap_mode=mmap_mode))
+
+
+class TDTrainer:
+
+    def __init__(self, network: NTupleNetwork, alpha: float = 0.1, lam: float = 0., trace_cutoff: float = 0.01,
+                 seed: Optional[int] = None):
+        """
+        :param alpha: learning rate. It is split evenly over the weights a board looks up.
+        :param lam: lambda of TD(lambda). 0 for TD(0).
+        :param trace_cutoff: with lambda > 0, we pass the error back only as far as lambda ** steps >= this
+        :param seed: games are seeded with seed, seed + 1, ...
+        """
+        self.network: NTupleNetwork = network
+        self.alpha: float = alpha
+        self.lam: float = lam
+        self.trace_len: int = 1 if lam <= 0 else 1 + int(np.log(trace_cutoff) / np.log(lam))
+        self.seed: int = seed if seed is not None else 0
+        self.games: int = 0
+
+    def play(self, learn: bool = True) -> FancyDict:
+        """
+            Play one game greedily (learning from it, unless told not to). The game starts like a BitGrid seeded with
+            seed + the number of games played so far, and then spawns (like Grid.spawn, with the default number
+            generator) straight into the bitboard, which saves decoding the board after every move.
+        """
+        network, step = self.network, self.alpha / self.network.n_lookups
+        board = BitGrid(seed=self.seed + self.games).board
+        rng = np.random.default_rng(self.seed + self.games)
+        self.games += 1
+
+        trace: List[np.ndarray] = []           # lookups of the last afterstates, the latest first
+        decay = self.lam ** np.arange(self.trace_len)
+        score, moves = 0, 0
+
+        while True:
+            afters = [move(board) for move in MOVES]
+            legal = np.array([after != board for after, _ in afters])
+            if not legal.any():
+                break
+
+            exps = exponents_of([after for after, _ in afters])
+            indices = network.indices(exps)
+            values = network.weights[indices].sum(axis=1) + np.array([reward for _, reward in afters])
+            direction = int(np.argmax(np.where(legal, values, -np.inf)))
+
+            if learn:
+                if trace:
+                    self._learn_(trace, decay, values[direction] - network.weights[trace[0]].sum(), step)
+                trace.insert(0, indices[direction])
+                del trace[self.trace_len:]
+
+            board, reward = afters[direction]
+            score += reward
+            moves += 1
+
+            # Spawn a 2 (exponent 1) or a 4 (exponent 2) in a free cell
+            free = np.flatnonzero(exps[direction] == 0)
+            where, four = rng.random(2)
+            board |= (2 if four < FOUR else 1) << (4 * int(free[int(where * free.size)]))
+
+        # The last afterstate led to a lost game, which is worth nothing more
+        if learn and trace:
+            self._learn_(trace, decay, -network.weights[trace[0]].sum(), step)
+
+        return FancyDict(score=int(score), moves=moves, max_tile=1 << int(exponents_of([board]).max()))
+
+    def _learn_(self, trace: List[np.ndarray], decay: np.ndarray, error: float, step: float):
+        self.network.update(np.concatenate(trace), np.repeat(step * error * decay[:len(trace)], len(trace[0])))
+
+    def train(self, games: int, log_every: int = 0) -> FancyDict:
+        """ Play and learn from `games` games. :return: scores and speed """
+        start = time.perf_counter()
+        results = []
+        for i in range(games):
+            results.append(self.play())
+            if log_every and (i + 1) % log_every == 0:
+                recent = [r.score for r in results[-log_every:]]
+                print(f"games: {i + 1}  mean score (last {log_every}): {np.mean(recent):.1f}  "
+                      f"games/sec: {(i + 1) / (time.perf_counter() - start):.2f}", file=sys.stderr)
+
+        elapsed = time.perf_counter() - start
+        return FancyDict(
+            games=games,
+            score_mean=float(np.mean([r.score for r in results])) if results else 0.,
+            max_tile=max((r.max_tile for r in results), default=0),
+            moves=int(sum(r.moves for r in results)),
+            games_per_sec=games / elapsed if elapsed else float('nan'),
+            moves_per_sec=sum(r.moves for r in results) / elapsed if elapsed else float('nan'),
+        )
+
+
+def main(args: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Train an n-tuple network by TD learning through self-play.")
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--alpha', type=float, default=0.1)
+    parser.add_argument('--lam', type=float, default=0., help="lambda of TD(lambda)")
+    parser.add_argument('--patterns', default='default', choices=['default', 'small'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--resume', default=None, help="weights (.npy) to continue training from")
+    parser.add_argument('--out', default=None, help="where to save the weights (.npy)")
+    parser.add_argument('--log-every', type=int, default=100)
+    args = parser.parse_args(args)
+
+    if args.resume:
+        network = NTupleNetwork.load(args.resume, mmap_mode=None)
+    else:
+        network = NTupleNetwork(DEFAULT_PATTERNS if args.patterns == 'default' else SMALL_PATTERNS)
+
+    report = TDTrainer(network, alpha=args.alpha, lam=args.lam, seed=args.seed).train(args.games, args.log_every)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        network.save(args.out)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
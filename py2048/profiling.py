@@ -0,0 +1,141 @@
+"""
+    Low overhead instrumentation: time named phases of the game (move, is_over, spawn, render, statusbar, save, ...)
+    and count events, with latencies kept in log scale histograms so that p50/p95/p99 cost no memory per sample.
+
+    There is one profiler, PROFILER, which the engine and the UI report to. It starts off, and when off, timing a
+    phase costs an attribute lookup and entering a do-nothing context manager.
+
+        with PROFILER.phase('move'):
+            ...
+        PROFILER.enabled = True         # or PROFILER.toggle(), or press p in the curses UI
+        PROFILER.report()               # FancyDict of phase -> stats. Also dump(path) as JSON, or table() as text
+"""
+import json
+import math
+import time
+import numpy as np
+from pathlib import Path
+from contextlib import nullcontext
+from typing import Dict, Union
+
+from utils import FancyDict
+
+# Histogram buckets are this many per doubling of the latency (so quantiles are off by at most ~9%), from 1ns up to
+#   2**MAX_OCTAVE ns (~18 minutes, anything slower goes in the last bucket).
+BUCKETS_PER_OCTAVE: int = 8
+MAX_OCTAVE: int = 40
+
+_NULL = nullcontext()
+
+
+class Histogram:
+    """ Counts of latencies (in nanoseconds) in log scale buckets, plus their exact count, sum and max """
+
+    def __init__(self):
+        self.counts: np.ndarray = np.zeros(BUCKETS_PER_OCTAVE * MAX_OCTAVE + 1, dtype=np.int64)
+        self.n: int = 0
+        self.total_ns: int = 0
+        self.max_ns: int = 0
+
+    def add(self, ns: int):
+        bucket = int(math.log2(ns) * BUCKETS_PER_OCTAVE) if ns > 1 else 0
+        self.counts[min(bucket, len(self.counts) - 1)] += 1
+        self.n += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def quantile(self, q: float) -> float:
+        """ The latency (ns) below which a fraction q of the samples fall, at the middle of its bucket """
+        if not self.n:
+            return 0.
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q * self.n))
+        return min(2 ** ((bucket + 0.5) / BUCKETS_PER_OCTAVE), float(self.max_ns))
+
+
+class _Timer:
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *args):
+        self.histogram.add(time.perf_counter_ns() - self.start)
+
+
+class Profiler:
+
+    def __init__(self, enabled: bool = False):
+        self.enabled: bool = enabled
+        self.phases: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self._timers: Dict[str, _Timer] = {}
+
+    def phase(self, name: str):
+        """ A context manager which times what runs inside it as one sample of phase `name` (if we are enabled) """
+        if not self.enabled:
+            return _NULL
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _Timer(self.phases.setdefault(name, Histogram()))
+        return timer
+
+    def record(self, name: str, seconds: float):
+        """ Add a sample to phase `name`, timed by someone else """
+        if self.enabled:
+            self.phases.setdefault(name, Histogram()).add(int(seconds * 1e9))
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def toggle(self) -> bool:
+        """ Switch on or off. :return: whether we are on now """
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def reset(self):
+        """ Forget everything measured so far """
+        self.phases, self.counters, self._timers = {}, {}, {}
+
+    def report(self) -> FancyDict:
+        """ Per phase: how often it ran, and its total, mean, p50, p95, p99 and max latency in milliseconds """
+        phases = FancyDict()
+        for name, hist in sorted(self.phases.items()):
+            phases[name] = FancyDict(
+                count=hist.n,
+                total_ms=hist.total_ns / 1e6,
+                mean_ms=hist.total_ns / hist.n / 1e6 if hist.n else 0.,
+                p50_ms=hist.quantile(0.50) / 1e6,
+                p95_ms=hist.quantile(0.95) / 1e6,
+                p99_ms=hist.quantile(0.99) / 1e6,
+                max_ms=hist.max_ns / 1e6,
+            )
+        return FancyDict(enabled=self.enabled, phases=phases, counters=FancyDict(**self.counters))
+
+    def dump(self, path: Union[str, Path]) -> Path:
+        """ Write the report as JSON """
+        path = Path(path)
+        path.write_text(json.dumps(self.report(), indent=2))
+        return path
+
+    def table(self) -> str:
+        """ The report as a text table, e.g. to show in the curses UI """
+        from tabulate import tabulate
+
+        report = self.report()
+        columns = ['count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+        rows = [[name] + [stats[column] for column in columns] for name, stats in report.phases.items()]
+        text = tabulate(rows, headers=['phase'] + columns, floatfmt='.3f')
+        if report.counters:
+            text += '\n\n' + tabulate(list(report.counters.items()), headers=['counter', 'count'])
+        return text
+
+
+# The profiler the engine and the UI report to
+PROFILER: Profiler = Profiler()
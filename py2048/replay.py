@@ -0,0 +1,201 @@
+"""
+    A compact, seekable log of a game: enough to rebuild the board after any move.
+
+    Every move is one fixed width record of bits:
+        2 bits for the direction, 1 bit for whether anything was spawned, and then for every spawn
+        the cell it went into (log2(dim*dim) bits, rounded up) and 1 bit for its value (0 for a 2, 1 for a 4).
+    On a 4x4 grid with one spawn per move, that is 8 bits a move.
+
+    Every `snapshot_every` moves we also keep the full board (as tile exponents, one byte per cell) and the score.
+    To get to move i we start from the last snapshot at or before i and replay at most `snapshot_every - 1` moves,
+    so seeking costs the same regardless of how long the game is.
+
+    File layout (little endian): header | move records | snapshots (uint8 exponents) | snapshot scores (int64)
+"""
+import struct
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Union, Iterator, Callable
+
+from utils import to_exponents, from_exponents
+
+MAGIC: bytes = b'P2RP'
+VERSION: int = 1
+
+# magic, version, dim, spawns, snapshot_every, n_moves, n_snapshots
+HEADER = struct.Struct('<4sBBBxIQI')
+
+
+class Replay:
+
+    def __init__(self, dim: int, initial: np.ndarray, score: int = 0, spawns: int = 1, snapshot_every: int = 64):
+        """
+        :param dim: the size of the grid
+        :param initial: the board before the first move
+        :param score: the score before the first move
+        :param spawns: how many values the grid spawns after a move
+        :param snapshot_every: keep the full board every these many moves
+        """
+        self.dim: int = dim
+        self.spawns: int = spawns
+        self.snapshot_every: int = snapshot_every
+
+        self._cell_bits: int = max(1, int(dim * dim - 1).bit_length())
+        self._width: int = 2 + 1 + spawns * (self._cell_bits + 1)
+
+        self.n_moves: int = 0
+        self._bits: bytearray = bytearray()
+        self._snapshots: List[np.ndarray] = [to_exponents(initial).ravel()]
+        self._scores: List[int] = [int(score)]
+
+    def __len__(self) -> int:
+        return self.n_moves
+
+    @property
+    def nbytes(self) -> int:
+        """ Roughly how much memory the log takes """
+        return len(self._bits) + sum(snapshot.nbytes for snapshot in self._snapshots) + 8 * len(self._scores)
+
+    def _write_(self, offset: int, value: int, width: int):
+        """ Write `width` bits of value at bit `offset` (least significant bit first) """
+        end = (offset + width + 7) // 8
+        if len(self._bits) < end:
+            self._bits.extend(bytes(end - len(self._bits)))
+        for i in range(width):
+            if (value >> i) & 1:
+                self._bits[(offset + i) // 8] |= 1 << ((offset + i) % 8)
+            else:
+                self._bits[(offset + i) // 8] &= ~(1 << ((offset + i) % 8)) & 0xFF
+
+    def _read_(self, offset: int, width: int) -> int:
+        value = 0
+        for i in range(width):
+            value |= ((self._bits[(offset + i) // 8] >> ((offset + i) % 8)) & 1) << i
+        return value
+
+    def append(self, direction: int, spawned: List[Tuple[int, int]], vals: np.ndarray, score: int):
+        """
+            Log a move.
+        :param direction: index into engine.DIRECTIONS
+        :param spawned: (flat cell index, value) of everything spawned after the move. Empty if nothing was.
+        :param vals: the board after the move and the spawn. Only looked at when we take a snapshot.
+        :param score: the score after the move
+        """
+        if spawned and len(spawned) != self.spawns:
+            raise ValueError(f"Expected {self.spawns} spawns per move. Got {len(spawned)}.")
+
+        record = direction | (int(bool(spawned)) << 2)
+        shift = 3
+        for cell, value in spawned:
+            if value not in (2, 4):
+                raise ValueError(f"Replays can only log spawned 2s and 4s. Got {value}.")
+            record |= (int(cell) | (int(value == 4) << self._cell_bits)) << shift
+            shift += self._cell_bits + 1
+
+        self._write_(self.n_moves * self._width, record, self._width)
+        self.n_moves += 1
+
+        if self.n_moves % self.snapshot_every == 0:
+            self._snapshots.append(to_exponents(vals).ravel())
+            self._scores.append(int(score))
+
+    def record(self, index: int) -> (int, List[Tuple[int, int]]):
+        """ :return: the direction and the spawns of move number `index` """
+        if not 0 <= index < self.n_moves:
+            raise IndexError(f"Move {index} is out of range for a replay of {self.n_moves} moves.")
+
+        record = self._read_(index * self._width, self._width)
+        direction, spawned = record & 0b11, []
+        if (record >> 2) & 1:
+            shift = 3
+            for _ in range(self.spawns):
+                field = record >> shift
+                spawned.append((field & ((1 << self._cell_bits) - 1), 4 if (field >> self._cell_bits) & 1 else 2))
+                shift += self._cell_bits + 1
+        return direction, spawned
+
+    def seek(self, index: int, grid) -> (np.ndarray, int):
+        """
+            The board and score after `index` moves (so seek(0, ..) is the initial board).
+        :param grid: a Grid of the same size; we use its up/down/left/right to simulate moves (it is not modified)
+        """
+        if not 0 <= index <= self.n_moves:
+            raise IndexError(f"Can not seek to move {index} in a replay of {self.n_moves} moves.")
+
+        snapshot = index // self.snapshot_every
+        vals = from_exponents(self._snapshots[snapshot]).reshape(self.dim, self.dim)
+        score = self._scores[snapshot]
+        for vals, score in self._play_(vals, score, snapshot * self.snapshot_every, index, grid):
+            pass
+        return vals, score
+
+    def _play_(self, vals: np.ndarray, score: int, start: int, stop: int, grid) -> Iterator[Tuple[np.ndarray, int]]:
+        """ Starting with the board and score before move `start`, yield them after every move till `stop` """
+        moves = (grid.up, grid.down, grid.left, grid.right)
+        for i in range(start, stop):
+            direction, spawned = self.record(i)
+            vals, merges = moves[direction](vals)
+            score += int(sum(merges))
+            for cell, value in spawned:
+                vals.flat[cell] = value
+            yield vals, score
+
+    def trajectory(self, grid) -> Iterator[Tuple[np.ndarray, int]]:
+        """ The board and score before the first move, and after every move (in order). See seek. """
+        vals, score = self.seek(0, grid)
+        yield vals, score
+        yield from self._play_(vals, score, 0, self.n_moves, grid)
+
+    def truncate(self, n_moves: int):
+        """ Forget everything after the first n_moves moves """
+        if not 0 <= n_moves <= self.n_moves:
+            raise IndexError(f"Can not truncate a replay of {self.n_moves} moves to {n_moves}.")
+        self.n_moves = n_moves
+        del self._bits[(n_moves * self._width + 7) // 8:]
+        del self._snapshots[n_moves // self.snapshot_every + 1:]
+        del self._scores[n_moves // self.snapshot_every + 1:]
+
+    def to_bytes(self) -> bytes:
+        return self.freeze()()
+
+    def freeze(self) -> Callable[[], bytes]:
+        """
+            Take a copy of the log as it is now, and return a function which turns it into bytes (see to_bytes), so
+            that the slow part can run later, e.g. on another thread. The copy is cheap: the move records are one
+            memcpy, and the snapshots are never changed in place, so we keep references to them.
+        """
+        header = HEADER.pack(MAGIC, VERSION, self.dim, self.spawns, self.snapshot_every, self.n_moves,
+                             len(self._snapshots))
+        moves = bytes(self._bits[:(self.n_moves * self._width + 7) // 8])
+        snapshots, scores = list(self._snapshots), list(self._scores)
+
+        def serialise() -> bytes:
+            return header + moves + np.stack(snapshots).astype(np.uint8).tobytes() + \
+                np.array(scores, dtype='<i8').tobytes()
+        return serialise
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Replay':
+        magic, version, dim, spawns, snapshot_every, n_moves, n_snapshots = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a replay (version {VERSION}). Magic: {magic}, version: {version}.")
+
+        replay = cls(dim, np.zeros((dim, dim), dtype=np.int32), spawns=spawns, snapshot_every=snapshot_every)
+        offset = HEADER.size
+        n_bytes = (n_moves * replay._width + 7) // 8
+        replay._bits = bytearray(data[offset: offset + n_bytes])
+        replay.n_moves = n_moves
+        offset += n_bytes
+
+        snapshots = np.frombuffer(data, dtype=np.uint8, count=n_snapshots * dim * dim, offset=offset)
+        replay._snapshots = list(snapshots.reshape(n_snapshots, dim * dim).copy())
+        offset += snapshots.size
+        replay._scores = np.frombuffer(data, dtype='<i8', count=n_snapshots, offset=offset).tolist()
+        return replay
+
+    def save(self, path: Union[str, Path]):
+        Path(path).write_bytes(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'Replay':
+        return cls.from_bytes(Path(path).read_bytes())
@@ -1,17 +1,75 @@
 """ The curses interface for the game """
-import numpy as np
-import curses
-import time
-import atexit
 import curses
 from curses.textpad import Textbox, rectangle
 
-# Local imports
-try:
-    import _pathfix
-except ImportError:
-    from . import _pathfix
+# Local imports. Run as a script, this file's directory is on the path already, so there is nothing to fix.
 from engine import Game, CONFIG
+from profiling import PROFILER
+
+
+class DirtyScreen:
+    """
+        Remembers what we last drew on every row of the screen, and only writes the parts of a row that changed.
+        Nothing is cleared between frames, and all writes go out in one batch (noutrefresh + doupdate) in `flush`,
+        so a move costs bytes proportional to the tiles it changed and not to the size of the terminal.
+    """
+
+    def __init__(self, stdscr, gap: int = 3):
+        """
+        :param stdscr: the curses window to draw on
+        :param gap: changed spans of a row which are at most this many chars apart are written as one span
+        """
+        self.stdscr = stdscr
+        self.gap: int = gap
+        self.rows: dict = {}        # row number -> (text, attr) as it is on the screen right now
+        self.drawn: set = set()     # rows drawn in the current frame
+
+    def invalidate(self):
+        """ Forget what is on the screen (e.g. after something else drew over it) and repaint it all next frame """
+        self.rows = {}
+        self.stdscr.erase()
+
+    def _spans_(self, old: str, new: str) -> list:
+        """ (start, end) of the stretches where two strings of the same length differ """
+        spans = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            if a == b:
+                continue
+            if spans and i - spans[-1][1] <= self.gap:
+                spans[-1][1] = i + 1
+            else:
+                spans.append([i, i + 1])
+        return spans
+
+    def draw(self, y: int, text: str, attr: int = 0):
+        """ Draw (possibly multi line) text starting at row y, column 0 """
+        for i, line in enumerate(text.split('\n')):
+            row = y + i
+            self.drawn.add(row)
+            old, old_attr = self.rows.get(row, (None, None))
+            if old == line and old_attr == attr:
+                continue
+
+            if old is None or old_attr != attr or len(old) != len(line):
+                # Can't diff this one, so write the whole row
+                self.stdscr.move(row, 0)
+                self.stdscr.clrtoeol()
+                self.stdscr.addstr(row, 0, line, attr)
+            else:
+                for start, end in self._spans_(old, line):
+                    self.stdscr.addstr(row, start, line[start:end], attr)
+            self.rows[row] = (line, attr)
+
+    def flush(self):
+        """ Blank the rows drawn last frame but not this one, and push all changes to the terminal at once """
+        for row in set(self.rows) - self.drawn:
+            self.stdscr.move(row, 0)
+            self.stdscr.clrtoeol()
+            del self.rows[row]
+        self.drawn = set()
+
+        self.stdscr.noutrefresh()
+        curses.doupdate()
 
 
 def draw_menu(stdscr):
@@ -19,6 +77,7 @@ def draw_menu(stdscr):
 
     # Create game
     game = Game()
+    screen = DirtyScreen(stdscr)
 
     # Clear and refresh the screen for a blank canvas
     stdscr.clear()
@@ -35,8 +94,9 @@ def draw_menu(stdscr):
     while inp != ord('q'):
 
         # Initialization
-        stdscr.clear()
         height, width = stdscr.getmaxyx()
+        if inp == curses.KEY_RESIZE:
+            screen.invalidate()
 
         # Load game snippet
         if inp == ord('l') or inp == ord('L'):
@@ -74,18 +134,31 @@ def draw_menu(stdscr):
                 stdscr.addstr(2, 2, f"Tried to load {message} but couldn't.\nPress any key to continue.")
                 _ = stdscr.getch()
 
-            stdscr.clear()
+            # The load screen drew all over the place
+            screen.invalidate()
 
         else:
 
             game, status = game.command(inp)
 
+            if status == 12:
+                # Show the profiling report on a screen of its own, till any key is pressed
+                stdscr.clear()
+                report = PROFILER.table() if PROFILER.phases else 'Nothing measured yet. Press p to start profiling.'
+                lines = report.split('\n')[:height - 2]
+                stdscr.addstr(0, 0, '\n'.join(line[:width - 1] for line in lines))
+                stdscr.addstr(min(len(lines) + 1, height - 1), 0, 'Press any key to continue.'[:width - 1])
+                stdscr.refresh()
+                _ = stdscr.getch()
+                screen.invalidate()
+
             # Declaration of strings
             # title = "Curses example"[:width-1]
             # subtitle = "Written by Clay McLeod"[:width-1]
             # keystr = "Last key pressed: {}".format(k)[:width-1]
             statusbarstr = game.get_statusbar_message(width - 1)
-            game_grid = game.grid.__repr__()
+            with PROFILER.phase('render'):
+                game_grid = game.grid.__repr__()
 
         # if k == 0:
         #     keystr = "No key press detected..."[:width-1]
@@ -98,14 +171,12 @@ def draw_menu(stdscr):
 
         # Rendering some text
         # whstr = "Width: {},\n Height: {}".format(width, height)
-        stdscr.addstr(0, 0, game_grid, curses.color_pair(1))
+        screen.draw(0, game_grid, curses.color_pair(1))
 
         # Render status bar
-        stdscr.attron(curses.color_pair(3))
-        stdscr.addstr(height-1, 0, statusbarstr)
+        screen.draw(height-1, statusbarstr, curses.color_pair(3))
         # stdscr.addstr(height-1, len(statusbarstr), "|" * (10))
         # stdscr.addstr(height-1, len(statusbarstr), "|" * (width - len(statusbarstr) - 1))
-        stdscr.attroff(curses.color_pair(3))
 
         # Turning on attributes for title
         stdscr.attron(curses.color_pair(2))
@@ -124,8 +195,9 @@ def draw_menu(stdscr):
         # stdscr.addstr(start_y + 5, start_x_keystr, keystr)
         # stdscr.move(cursor_y, cursor_x)
 
-        # Refresh the screen
-        stdscr.refresh()
+        # Refresh the screen (only the bits that changed)
+        with PROFILER.phase('flush'):
+            screen.flush()
 
         # time.sleep(1)
         #
@@ -138,6 +210,9 @@ def draw_menu(stdscr):
         # Wait for next input
         inp = stdscr.getch()
 
+    # Make sure the autosave journal is flushed and snapshotted before we go
+    game.close()
+
 
 def main():
     curses.wrapper(draw_menu)
@@ -0,0 +1,338 @@
+"""
+    An asyncio server which hosts many games at once, for players and bots to connect to.
+
+    The protocol is line delimited JSON over TCP or a Unix socket: every request is one JSON object on a line, and it
+    gets exactly one JSON object (on a line) back, in order. Requests carry an "op", and can carry an "id", which the
+    response repeats.
+
+        {"op": "new", "seed": 7, "dim": 4}              -> a new game (seed and dim are optional)
+        {"op": "move", "session": ..., "direction": 0}  -> Game.step. Directions by index or name (engine.DIRECTIONS)
+        {"op": "undo", "session": ...}, {"op": "redo", "session": ...}
+        {"op": "state", "session": ...}
+        {"op": "save", "session": ...}                  -> Game._save_, to CONFIG.savedir
+        {"op": "load", "session": ...}                  -> Game._load_ from CONFIG.savedir (if it is not in memory)
+        {"op": "close", "session": ...}                 -> stop hosting the game (without saving it)
+        {"op": "ping"}, {"op": "stats"}
+
+    Any game saved in CONFIG.savedir can be asked for by its session ID, loaded or not. The games in memory are kept
+    by a manager.SessionManager: past its limits, the least recently used ones are written back to disk and dropped.
+    Everything which changed is saved when the server closes.
+
+    Responses are {"ok": true, ...} with the state of the game (session, board, score, moves, gameover), or
+    {"ok": false, "error": "..."}.
+
+    Game logic runs on the event loop (a move takes microseconds). Saves and loads, which touch the disk, run in a
+    thread pool (as do the write backs of evicted games), at most `max_io` at a time. Requests on one game are
+    serialised by a lock per game.
+
+    Backpressure: a connection's requests are handled one at a time, and we read its next line only once the response
+    to the last one has been written out (drained), so a client which does not read its responses stops being served.
+    Every connection also has a token bucket rate limit, and requests over it are answered with an error right away.
+
+    Usage:
+        python server.py --port 2048
+        python server.py --unix /tmp/py2048.sock
+"""
+import sys
+import json
+import time
+import asyncio
+import weakref
+import argparse
+import functools
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterable, List
+
+from engine import Game, Grid, CONFIG, DIRECTIONS
+from manager import SessionManager
+from utils import FancyDict, UnknownSessionID, ProtocolError
+
+# Longest request line we accept, in bytes
+MAX_LINE: int = 1 << 16
+
+
+class RateLimiter:
+
+    def __init__(self, rate: float, burst: int):
+        """ A token bucket: `rate` requests per second on average, and bursts of up to `burst` at once """
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = burst
+        self.last: float = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    @property
+    def retry_after(self) -> float:
+        """ Seconds till the next request would be allowed """
+        return max(0., (1 - self.tokens) / self.rate)
+
+
+class GameServer:
+
+    def __init__(self, max_sessions: int = 10000, max_bytes: Optional[int] = None, max_connections: int = 1024,
+                 rate: float = 200., burst: int = 50, max_io: int = 8):
+        """
+        :param max_sessions: the most games we keep in memory. Beyond this, the least recently used ones are saved
+            (if they changed) and dropped, and loaded again when asked for (see manager.SessionManager).
+        :param max_bytes: the most memory (estimated) the games in memory may take. No limit if None.
+        :param max_connections: the most clients connected at once. Connections beyond this are closed right away.
+        :param rate: requests per second allowed per connection, on average
+        :param burst: requests allowed per connection at once
+        :param max_io: the most saves and loads running (in threads) at once
+        """
+        self.max_connections: int = max_connections
+        self.rate: float = rate
+        self.burst: int = burst
+        self.max_io: int = max_io
+
+        self.manager: SessionManager = SessionManager(max_sessions, max_bytes)
+        self._locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._io: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+        self.connections: int = 0
+        self.stats = FancyDict(requests=0, errors=0, rate_limited=0, refused_connections=0)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 2048, unix: Optional[str] = None) -> 'GameServer':
+        """ Start listening on a TCP port, or on a Unix socket if `unix` (its path) is given """
+        self._executor = ThreadPoolExecutor(self.max_io, thread_name_prefix='py2048-io')
+        self._io = asyncio.Semaphore(self.max_io)
+        if unix:
+            self._server = await asyncio.start_unix_server(self._serve_, path=unix, limit=MAX_LINE)
+        else:
+            self._server = await asyncio.start_server(self._serve_, host, port, limit=MAX_LINE)
+        return self
+
+    @property
+    def address(self):
+        """ Where we listen: (host, port), or the path of the Unix socket """
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """ Stop listening, and save every game in memory which changed since it was last saved """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            await self._run_io_(self.manager.flush)
+            self._executor.shutdown(wait=True)
+
+    async def _run_io_(self, fn, *args):
+        """ Run a blocking (disk) call in the thread pool """
+        async with self._io:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def _serve_(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.connections >= self.max_connections:
+            self.stats.refused_connections += 1
+            writer.close()
+            return
+
+        self.connections += 1
+        limiter = RateLimiter(self.rate, self.burst)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    await self._send_(writer, {'ok': False, 'error': f"Request longer than {MAX_LINE} bytes."})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                if limiter.allow():
+                    response = await self.handle_line(line)
+                else:
+                    self.stats.rate_limited += 1
+                    response = {'ok': False, 'error': 'Rate limited.', 'retry_after': limiter.retry_after}
+                await self._send_(writer, response)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    @staticmethod
+    async def _send_(writer: asyncio.StreamWriter, response: dict):
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+
+    async def handle_line(self, line: bytes) -> dict:
+        """ One request line to its response """
+        self.stats.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ProtocolError(f"Expected a JSON object. Got {type(request).__name__}.")
+            request_id = request.get('id')
+            response = await self.handle(request)
+        except (ProtocolError, UnknownSessionID, json.JSONDecodeError) as e:
+            self.stats.errors += 1
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            self.stats.errors += 1
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+        if request_id is not None:
+            response['id'] = request_id
+        return response
+
+    async def handle(self, request: dict) -> dict:
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'stats':
+            return {'ok': True, **self.report()}
+        if op == 'new':
+            return self._state_(await self._new_(request.get('seed'), int(request.get('dim', 4))))
+        if op not in ('load', 'move', 'undo', 'redo', 'state', 'save', 'close'):
+            raise ProtocolError(f"Unknown op: {op}.")
+
+        session_id = self._session_id_(request)
+
+        # Get the game under its lock, so that it can not be written back (and changed after) till we are done. The
+        #   games that evicts are written back after, under their own locks, so we never wait for one while holding
+        #   another.
+        evicted = []
+        try:
+            async with self._lock_(session_id):
+                if op == 'close':
+                    self.manager.pop(session_id)
+                    return {'ok': True, 'session': session_id}
+
+                game, evicted = await self._game_(session_id)
+                if op == 'move':
+                    gain, changed, gameover = game.step(self._direction_(request.get('direction')))
+                    self.manager.mark_dirty(session_id)
+                    return self._state_(game, gain=gain, changed=changed)
+                if op in ('undo', 'redo'):
+                    changed = game.undo() if op == 'undo' else game.redo()
+                    self.manager.mark_dirty(session_id)
+                    return self._state_(game, changed=changed)
+                if op == 'save':
+                    path = await self._run_io_(game._save_)
+                    self.manager.mark_clean(session_id)
+                    return self._state_(game, path=str(path))
+                return self._state_(game)
+        finally:
+            await self._write_back_(evicted)
+
+    @staticmethod
+    def _session_id_(request: dict) -> str:
+        session_id = request.get('session')
+        if not isinstance(session_id, str) or not session_id:
+            raise ProtocolError("Expected a session ID (a string) in 'session'.")
+        if Path(session_id).name != session_id:
+            raise ProtocolError(f"Not a valid session ID: {session_id}.")
+        return session_id
+
+    @staticmethod
+    def _direction_(direction) -> int:
+        if isinstance(direction, str) and direction in DIRECTIONS:
+            return DIRECTIONS.index(direction)
+        if isinstance(direction, int) and not isinstance(direction, bool) and 0 <= direction < len(DIRECTIONS):
+            return direction
+        raise ProtocolError(f"Unknown direction: {direction}. Expected one of {DIRECTIONS} or its index.")
+
+    def _lock_(self, session_id: str) -> asyncio.Lock:
+        """ The lock which serialises everything done to a game. It lives as long as anyone holds or waits for it. """
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    async def _write_back_(self, evicted: List[Game]):
+        """ Write back (in the thread pool) games the manager evicted """
+        for game in evicted:
+            async with self._lock_(game.session_id):
+                await self._run_io_(self.manager.write_back, game)
+
+    async def _host_(self, game: Game, dirty: bool) -> Game:
+        """ Keep a game in memory, writing back the games that evicts """
+        await self._write_back_(self.manager.put(game, dirty=dirty))
+        return game
+
+    async def _game_(self, session_id: str) -> (Game, List[Game]):
+        """ A game from memory, or else loaded from disk (in the thread pool), and the games that evicts """
+        game, evicted = self.manager.get(session_id)
+        if game is None:
+            game, evicted = self.manager.put_loaded(await self._run_io_(self.manager.load, session_id))
+        return game, evicted
+
+    async def _new_(self, seed: Optional[int], dim: int) -> Game:
+        if not 2 <= dim <= 16:
+            raise ProtocolError(f"Expected a dim between 2 and 16. Got {dim}.")
+
+        # Picking a session ID looks for savefiles of the same name on disk
+        session_id = await self._run_io_(Game._gen_session_id_)
+        while session_id in self.manager:
+            session_id = await self._run_io_(Game._gen_session_id_)
+
+        # Dirty, as it is not on disk yet: if it gets evicted, it is saved
+        return await self._host_(Game(grid=Grid(dim=dim, seed=seed), session_id=session_id, autosave=False), True)
+
+    @staticmethod
+    def _state_(game: Game, **extra) -> dict:
+        return {
+            'ok': True,
+            'session': game.session_id,
+            'board': game.grid.vals.tolist(),
+            'score': int(game.score),
+            'moves': len(game.history),
+            'gameover': bool(game.grid.is_over),
+            **extra,
+        }
+
+    def report(self) -> FancyDict:
+        return FancyDict(connections=self.connections, **self.stats, cache=self.manager.report())
+
+
+async def _main_(args):
+    server = await GameServer(max_sessions=args.max_sessions, max_bytes=args.max_bytes,
+                              max_connections=args.max_connections, rate=args.rate, burst=args.burst,
+                              max_io=args.max_io).start(args.host, args.port, args.unix)
+    print(f"Serving on {server.address}. Saves go to {CONFIG.savedir}.", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(args: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Host many games over a line delimited JSON protocol.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2048)
+    parser.add_argument('--unix', default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--max-sessions', type=int, default=10000, help="games to keep in memory")
+    parser.add_argument('--max-bytes', type=int, default=None, help="memory the games in memory may take (roughly)")
+    parser.add_argument('--max-connections', type=int, default=1024)
+    parser.add_argument('--rate', type=float, default=200., help="requests per second per connection")
+    parser.add_argument('--burst', type=int, default=50)
+    parser.add_argument('--max-io', type=int, default=8, help="saves and loads running at once")
+    args = parser.parse_args(args)
+
+    try:
+        asyncio.run(_main_(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
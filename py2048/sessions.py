@@ -0,0 +1,113 @@
+"""
+    A persistent index of saved sessions, so that listing them does not mean opening every savefile.
+
+    It is an SQLite database next to the savefiles (savedir/index.sqlite) with one row per session:
+    session id, score, max tile, whether the game is over, and when it was last saved.
+    `Game._save_` keeps it up to date. An index which was never filled from the savefiles (it is new, or from before we
+    kept track, so there may be saves from before it existed) is rebuilt when opened: `SessionIndex.rebuild` scans the
+    savefiles once, and marks the index as filled (with SQLite's user_version).
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, List, Dict, Union
+
+from utils import FancyDict
+
+INDEX_FNAME: str = 'index.sqlite'
+
+# The user_version of an index which was filled from the savefiles
+INDEX_VERSION: int = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    score INTEGER NOT NULL,
+    max_tile INTEGER NOT NULL,
+    gameover INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_mtime ON sessions (mtime);
+CREATE INDEX IF NOT EXISTS sessions_score ON sessions (score);
+CREATE INDEX IF NOT EXISTS sessions_gameover_mtime ON sessions (gameover, mtime);
+CREATE INDEX IF NOT EXISTS sessions_gameover_score ON sessions (gameover, score);
+"""
+
+_COLUMNS = ('session_id', 'score', 'max_tile', 'gameover', 'mtime')
+
+
+class SessionIndex:
+
+    # One open index per savedir, shared by everyone in the process
+    _instances: Dict[Path, 'SessionIndex'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, savedir: Path):
+        self.savedir: Path = Path(savedir)
+        self.savedir.mkdir(exist_ok=True, parents=True)
+        self.path: Path = self.savedir / INDEX_FNAME
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        if self._conn.execute('PRAGMA user_version').fetchone()[0] < INDEX_VERSION:
+            self.rebuild()
+
+    @classmethod
+    def get(cls, savedir: Union[str, Path]) -> 'SessionIndex':
+        """ The (shared) index of a savedir """
+        savedir = Path(savedir).resolve()
+        with cls._instances_lock:
+            if savedir not in cls._instances:
+                cls._instances[savedir] = cls(savedir)
+            return cls._instances[savedir]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def update(self, session_id: str, score: int, max_tile: int, gameover: bool, mtime: float):
+        """ Add or overwrite the entry of a session """
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)',
+                               (session_id, int(score), int(max_tile), int(bool(gameover)), float(mtime)))
+
+    def remove(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    def _query_(self, order: str, n: int, playable: Optional[bool]) -> List[FancyDict]:
+        where = '' if playable is None else f'WHERE gameover = {int(not playable)}'
+        with self._lock:
+            rows = self._conn.execute(f'SELECT {", ".join(_COLUMNS)} FROM sessions {where} '
+                                      f'ORDER BY {order} DESC LIMIT ?', (n,)).fetchall()
+        return [FancyDict(**{**dict(zip(_COLUMNS, row)), 'gameover': bool(row[3])}) for row in rows]
+
+    def newest(self, n: int, playable: Optional[bool] = None) -> List[FancyDict]:
+        """ The n most recently saved sessions. If playable is given, only those whose game is (not) over. """
+        return self._query_('mtime', n, playable)
+
+    def top(self, k: int, playable: Optional[bool] = None) -> List[FancyDict]:
+        """ The k highest scoring sessions. If playable is given, only those whose game is (not) over. """
+        return self._query_('score', k, playable)
+
+    def rebuild(self) -> int:
+        """ Throw away the index and fill it again by reading every savefile. Returns the number of sessions. """
+        entries = []
+        for fname in self.savedir.glob('*.json'):
+            try:
+                saved = json.load(fname.open('r'))
+                max_tile = max(max(row) for row in saved['grid']['vals'].values())
+                entries.append((saved['session_id'], int(saved['score']), int(max_tile), int(bool(saved['gameover'])),
+                                fname.stat().st_mtime))
+            except (json.decoder.JSONDecodeError, KeyError, ValueError):
+                continue
+
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM sessions')
+            self._conn.executemany('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)', entries)
+            self._conn.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+        return len(entries)
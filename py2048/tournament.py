@@ -0,0 +1,178 @@
+"""
+    Play many seeded games per agent configuration, spread over a process pool.
+
+    Every finished game is streamed (as one JSON line) to the output as soon as it comes back from its worker.
+    At the end we print aggregate statistics with 95% confidence intervals.
+
+    Usage:
+        python tournament.py --agent expectimax --agent-args '{"depth": 2}' --games 10000 --workers 8 \
+            --out results.jsonl
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+from typing import Optional, Iterable, Iterator, List
+
+from env import Env
+from agents import Agent, RandomAgent, ExpectimaxAgent
+from utils import FancyDict
+
+AGENTS = {
+    'random': RandomAgent,
+    'expectimax': ExpectimaxAgent,
+}
+
+# z value for two-sided 95% confidence intervals
+Z95: float = 1.959964
+
+
+def make_agent(name: str, agent_args: dict, seed: int) -> Agent:
+    if name not in AGENTS:
+        raise ValueError(f"Unknown agent: {name}. Expected one of {list(AGENTS)}.")
+    if name == 'random':
+        return RandomAgent(seed=seed, **agent_args)
+    return AGENTS[name](**agent_args)
+
+
+def play_game(task: tuple) -> dict:
+    """ Play one full game. The task is (agent name, agent args, seed, dim), so that it can be pickled to a worker. """
+    name, agent_args, seed, dim = task
+    agent = make_agent(name, agent_args, seed)
+    env = Env(dim=dim)
+
+    start = time.perf_counter()
+    env.reset(seed=seed)
+    done, moves = False, 0
+    while not done:
+        action = agent.act(env.game.grid)
+        if action is None:
+            break
+        _, _, done, _ = env.step(action)
+        moves += 1
+
+    return {
+        'seed': seed,
+        'score': env.game.score,
+        'max_tile': int(env.game.grid.max),
+        'moves': moves,
+        'wall_time': time.perf_counter() - start,
+    }
+
+
+def run(agent: str, agent_args: dict, games: int, workers: int, seed: int = 0, dim: int = 4) -> Iterator[dict]:
+    """ Play `games` games with seeds seed, seed+1, ... and yield their results in the order they finish """
+    tasks = [(agent, agent_args, seed + i, dim) for i in range(games)]
+    if workers <= 1:
+        yield from map(play_game, tasks)
+        return
+
+    # Many small chunks keep all workers busy till the end, without paying for a round trip per game
+    chunksize = max(1, games // (workers * 32))
+    with mp.Pool(workers) as pool:
+        yield from pool.imap_unordered(play_game, tasks, chunksize=chunksize)
+
+
+def mean_ci(values: np.ndarray) -> (float, float, float):
+    """ Mean, and the normal approximation of its 95% confidence interval """
+    mean = float(values.mean())
+    half = Z95 * float(values.std(ddof=1)) / np.sqrt(values.size) if values.size > 1 else float('nan')
+    return mean, mean - half, mean + half
+
+
+def proportion_ci(hits: int, n: int) -> (float, float, float):
+    """ A proportion, and its 95% Wilson score interval """
+    p = hits / n
+    denom = 1 + Z95 ** 2 / n
+    centre = (p + Z95 ** 2 / (2 * n)) / denom
+    half = Z95 * np.sqrt(p * (1 - p) / n + Z95 ** 2 / (4 * n * n)) / denom
+    return p, centre - half, centre + half
+
+
+def summarise(results: List[dict], wall_time: Optional[float] = None) -> FancyDict:
+    """ Aggregate statistics over game results. With no results, there is nothing but the count (and the timing). """
+    if not results:
+        summary = FancyDict(games=0)
+        if wall_time:
+            summary.wall_time = wall_time
+            summary.games_per_sec = 0.
+        return summary
+
+    scores = np.array([r['score'] for r in results], dtype=np.float64)
+    moves = np.array([r['moves'] for r in results], dtype=np.float64)
+    max_tiles = np.array([r['max_tile'] for r in results])
+    game_times = np.array([r['wall_time'] for r in results])
+
+    summary = FancyDict(
+        games=len(results),
+        score=mean_ci(scores),
+        score_median=float(np.median(scores)),
+        moves=mean_ci(moves),
+        max_tile={int(tile): int((max_tiles == tile).sum()) for tile in np.unique(max_tiles)},
+        reached={int(tile): proportion_ci(int((max_tiles >= tile).sum()), len(results))
+                 for tile in (512, 1024, 2048, 4096) if (max_tiles >= tile).any()},
+        moves_per_sec=float(moves.sum() / game_times.sum()) if game_times.sum() else float('nan'),
+    )
+    if wall_time:
+        summary.wall_time = wall_time
+        summary.games_per_sec = len(results) / wall_time
+    return summary
+
+
+def format_summary(summary: FancyDict) -> str:
+    from tabulate import tabulate
+
+    def fmt(stat):
+        return f"{stat[0]:.4g}  [{stat[1]:.4g}, {stat[2]:.4g}]"
+
+    rows = [['games', summary.games]]
+    if summary.games:
+        rows += [
+            ['score (95% CI)', fmt(summary.score)],
+            ['score median', summary.score_median],
+            ['moves (95% CI)', fmt(summary.moves)],
+            ['moves/sec (per worker)', f"{summary.moves_per_sec:.1f}"],
+        ]
+    if 'games_per_sec' in summary:
+        rows += [['wall time (s)', f"{summary.wall_time:.2f}"], ['games/sec', f"{summary.games_per_sec:.2f}"]]
+    if summary.games:
+        rows += [[f"reached {tile} (95% CI)", fmt(stat)] for tile, stat in summary.reached.items()]
+        rows += [[f"max tile {tile}", count] for tile, count in summary.max_tile.items()]
+    return tabulate(rows)
+
+
+def main(args: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Play many games with an agent and report statistics.")
+    parser.add_argument('--agent', default='random', choices=list(AGENTS))
+    parser.add_argument('--agent-args', default='{}', help="JSON dict of keyword arguments for the agent")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=mp.cpu_count())
+    parser.add_argument('--seed', type=int, default=0, help="games are seeded with seed, seed+1, ...")
+    parser.add_argument('--dim', type=int, default=4)
+    parser.add_argument('--out', default=None, help="file to stream per game results to (JSON lines). "
+                                                     "Defaults to stdout.")
+    parser.add_argument('--summary', default=None, help="file to write the aggregate statistics to (JSON)")
+    args = parser.parse_args(args)
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    results = []
+    start = time.perf_counter()
+    try:
+        for result in run(args.agent, json.loads(args.agent_args), args.games, args.workers, args.seed, args.dim):
+            results.append(result)
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    finally:
+        if args.out:
+            out.close()
+
+    summary = summarise(results, wall_time=time.perf_counter() - start)
+    print(format_summary(summary), file=sys.stderr)
+    if args.summary:
+        json.dump(summary, open(args.summary, 'w+'), indent=2)
+
+
+if __name__ == '__main__':
+    main()
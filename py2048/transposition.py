@@ -0,0 +1,163 @@
+"""
+    Zobrist hashing of boards, up to symmetry, and a bounded cache of search results keyed by those hashes.
+
+    Every (cell, tile exponent) pair gets a fixed random 64-bit key, and the hash of a board is the XOR of the keys of
+    its tiles. Changing a cell only needs two XORs, which is how `Grid` keeps its hashes up to date move by move.
+
+    A board has 8 symmetric versions (rotations and reflections) which play out the same, so we hash all 8 (as seen
+    from the original board: the key of cell c in version s is the key of the cell that c lands on) and call the
+    smallest one the canonical hash. Boards which are symmetric to each other share it.
+"""
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from utils import FancyDict, to_exponents
+
+# Tiles up to 2**(MAX_EXPONENT - 1) can be hashed
+MAX_EXPONENT: int = 32
+
+ZOBRIST_SEED: int = 2048
+
+_keys: Dict[int, np.ndarray] = {}
+_positions: Dict[int, np.ndarray] = {}
+
+
+def symmetry_positions(dim: int) -> np.ndarray:
+    """ (8, dim * dim): where cell c (flat index) of a board lands in each of its 8 symmetric versions """
+    if dim not in _positions:
+        cells = np.arange(dim * dim).reshape(dim, dim)
+        rotations = [np.rot90(cells, k) for k in range(4)]
+        versions = np.stack([board.ravel() for board in rotations + [np.fliplr(board) for board in rotations]])
+        _positions[dim] = np.argsort(versions, axis=1)       # versions[s][i] is the cell which lands on i
+    return _positions[dim]
+
+
+def zobrist_keys(dim: int) -> np.ndarray:
+    """ (dim * dim, MAX_EXPONENT) uint64 keys. The key of an empty cell (exponent 0) is 0. """
+    if dim not in _keys:
+        rng = np.random.default_rng([ZOBRIST_SEED, dim])
+        keys = rng.integers(0, np.iinfo(np.uint64).max, (dim * dim, MAX_EXPONENT), dtype=np.uint64, endpoint=True)
+        keys[:, 0] = 0
+        _keys[dim] = keys
+    return _keys[dim]
+
+
+def zobrist_hashes(vals: np.ndarray) -> np.ndarray:
+    """ (8,) uint64 hashes of the 8 symmetric versions of a (dim, dim) board of tile values """
+    dim = vals.shape[0]
+    exps = to_exponents(vals).ravel()
+    return np.bitwise_xor.reduce(zobrist_keys(dim)[symmetry_positions(dim), exps], axis=1)
+
+
+def update_hashes(hashes: np.ndarray, dim: int, cells: np.ndarray, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    """
+        The hashes (from zobrist_hashes) after some cells of the board changed, without looking at the rest of it.
+    :param cells: flat indices of the cells that changed
+    :param old: their exponents before
+    :param new: their exponents after
+    """
+    keys, positions = zobrist_keys(dim), symmetry_positions(dim)[:, cells]
+    return hashes ^ np.bitwise_xor.reduce(keys[positions, old] ^ keys[positions, new], axis=1)
+
+
+def canonical_hash(vals: np.ndarray) -> int:
+    """ The same for a board and all its rotations and reflections """
+    return int(zobrist_hashes(vals).min())
+
+
+class TranspositionCache:
+
+    def __init__(self, capacity: int = 1 << 20, policy: str = 'lru'):
+        """
+            Values of searched positions, keyed by (canonical) hash. An entry is only good for searches no deeper than
+            the one which stored it.
+        :param capacity: the most entries we keep
+        :param policy: what to do when the cache is full
+            'lru': evict the least recently used entry.
+            'depth': a fixed table of `capacity` slots (hash modulo capacity) in preallocated arrays. A new entry only
+                replaces the one in its slot if it comes from a search at least as deep. 17 bytes per slot.
+        """
+        if policy not in ('lru', 'depth'):
+            raise ValueError(f"Unknown replacement policy: {policy}. Expected 'lru' or 'depth'.")
+        if capacity < 1:
+            raise ValueError(f"Capacity must be at least 1. Got {capacity}.")
+
+        self.capacity: int = capacity
+        self.policy: str = policy
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.stores: int = 0
+        self.evictions: int = 0         # entries thrown out to make room for others
+        self.rejections: int = 0        # entries not stored, since their slot holds a deeper one ('depth' only)
+
+        self._entries: OrderedDict = OrderedDict()
+        if policy == 'depth':
+            self._keys = np.zeros(capacity, dtype=np.uint64)
+            self._depths = np.full(capacity, -1, dtype=np.int8)
+            self._values = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self._entries) if self.policy == 'lru' else int((self._depths >= 0).sum())
+
+    def get(self, key: int, depth: int) -> Optional[float]:
+        """ The stored value of a position, if it was searched at least this deep """
+        if self.policy == 'lru':
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= depth:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        else:
+            slot = key % self.capacity
+            if self._depths[slot] >= depth and self._keys[slot] == key:
+                self.hits += 1
+                return float(self._values[slot])
+
+        self.misses += 1
+        return None
+
+    def put(self, key: int, depth: int, value: float):
+        self.stores += 1
+        if self.policy == 'lru':
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                if self._entries[key][0] > depth:
+                    return                      # keep the deeper result
+            elif len(self._entries) >= self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (depth, value)
+            return
+
+        slot = key % self.capacity
+        if self._depths[slot] > depth:
+            self.rejections += 1
+            return
+        if self._depths[slot] >= 0 and self._keys[slot] != key:
+            self.evictions += 1
+        self._keys[slot], self._depths[slot], self._values[slot] = key, depth, value
+
+    def clear(self):
+        self._entries.clear()
+        if self.policy == 'depth':
+            self._depths[:] = -1
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def report(self) -> FancyDict:
+        return FancyDict(
+            policy=self.policy,
+            capacity=self.capacity,
+            entries=len(self),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hit_rate,
+            stores=self.stores,
+            evictions=self.evictions,
+            rejections=self.rejections,
+        )
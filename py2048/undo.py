@@ -0,0 +1,150 @@
+"""
+    A bounded undo/redo buffer of game states: a ring of arrays, so memory stays the same however long the game goes
+    on, and stepping back or forth copies one state. The arrays start small and double till they hold `capacity`
+    states, so that the many short (or idle) games a server hosts do not all pay for a full buffer.
+
+    A state is the board (as tile exponents, one byte per cell; or as they are, for grids which may spawn values that
+    are not powers of two), the score, how many random numbers the grid had drawn
+    (see Grid.draws; enough to put its generator back) and how long the history was. With it, we keep the move which
+    led to it (direction and spawns), so that redoing can play that move again like the journal does (Game._redo_).
+
+    Once full, pushing a new state forgets the oldest one. Pushing after an undo forgets the states which were undone.
+"""
+import numpy as np
+from typing import List, Optional, Tuple
+
+from utils import FancyDict, to_exponents, from_exponents
+
+NO_DIRECTION: int = 255         # the direction of a state which no move led to (e.g. the start of a game)
+
+# States a buffer has room for at first
+INITIAL_SIZE: int = 16
+
+_ARRAYS = ('_boards', '_scores', '_draws', '_moves', '_directions', '_spawn_cells', '_spawn_vals')
+
+
+class UndoBuffer:
+
+    def __init__(self, dim: int, spawns: int = 1, capacity: int = 1024, raw: bool = False):
+        """
+        :param dim: the size of the grid
+        :param spawns: how many values the grid spawns after a move
+        :param capacity: the most states we keep (so one less can be undone in a row)
+        :param raw: keep tile values as they are, instead of their exponents. For grids with a custom numgen.
+        """
+        if capacity < 1:
+            raise ValueError(f"Capacity must be at least 1. Got {capacity}.")
+
+        self.dim: int = dim
+        self.capacity: int = capacity
+        self.raw: bool = raw
+
+        size = min(capacity, INITIAL_SIZE)
+        tiles = np.int32 if raw else np.uint8
+        self._boards = np.zeros((size, dim * dim), dtype=tiles)
+        self._scores = np.zeros(size, dtype=np.int64)
+        self._draws = np.zeros(size, dtype=np.int64)
+        self._moves = np.zeros(size, dtype=np.int64)
+        self._directions = np.full(size, NO_DIRECTION, dtype=np.uint8)
+        self._spawn_cells = np.zeros((size, spawns), dtype=np.int32)
+        self._spawn_vals = np.zeros((size, spawns), dtype=tiles)            # 0 where nothing was spawned
+
+        self._start: int = 0        # ring index of the oldest state
+        self._len: int = 0          # states kept, including those which were undone (and can be redone)
+        self._pos: int = -1         # position (from the oldest) of the current state
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def nbytes(self) -> int:
+        """ The memory the arrays take, which grows (up to capacity) with the states pushed """
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+    @property
+    def can_undo(self) -> bool:
+        return self._pos > 0
+
+    @property
+    def can_redo(self) -> bool:
+        return self._pos < self._len - 1
+
+    def _slot_(self, pos: int) -> int:
+        return (self._start + pos) % self.capacity
+
+    def _grow_(self):
+        """ Double the room we have (up to capacity). We only grow before the ring wraps around, so _start is 0. """
+        size = min(2 * len(self._scores), self.capacity)
+        for name in _ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def push(self, vals: np.ndarray, score: int, draws: int, moves: int, direction: int = NO_DIRECTION,
+             spawned: Optional[List[Tuple[int, int]]] = None):
+        """
+            Add a state after the current one, and make it the current one. Those which were undone are forgotten.
+        :param vals: the board
+        :param score: the score
+        :param draws: Grid.draws
+        :param moves: the length of the game's history
+        :param direction: the direction of the move which led here, if any
+        :param spawned: (flat cell index, value) of what that move spawned
+        """
+        self._len = self._pos + 1
+        if self._len == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._len -= 1
+
+        if self._len == len(self._scores):
+            self._grow_()
+
+        slot = self._slot_(self._len)
+        self._boards[slot] = (vals if self.raw else to_exponents(vals)).ravel()
+        self._scores[slot] = score
+        self._draws[slot] = draws
+        self._moves[slot] = moves
+        self._directions[slot] = direction
+        self._spawn_vals[slot] = 0
+        for i, (cell, value) in enumerate(spawned if spawned else []):
+            self._spawn_cells[slot, i] = cell
+            self._spawn_vals[slot, i] = value if self.raw else int(value).bit_length() - 1
+
+        self._len += 1
+        self._pos = self._len - 1
+
+    def state(self, pos: Optional[int] = None) -> FancyDict:
+        """ The state at a position (counting from the oldest one kept), by default the current one """
+        slot = self._slot_(self._pos if pos is None else pos)
+        board = self._boards[slot].copy() if self.raw else from_exponents(self._boards[slot])
+        return FancyDict(
+            vals=board.reshape(self.dim, self.dim),
+            score=int(self._scores[slot]),
+            draws=int(self._draws[slot]),
+            moves=int(self._moves[slot]),
+            direction=int(self._directions[slot]),
+            spawned=[(int(cell), int(value) if self.raw else 1 << int(value))
+                     for cell, value in zip(self._spawn_cells[slot], self._spawn_vals[slot]) if value],
+        )
+
+    def undo(self) -> Optional[FancyDict]:
+        """ Step back. :return: the state we are at now, or None if there is nothing to undo """
+        if not self.can_undo:
+            return None
+        self._pos -= 1
+        return self.state()
+
+    def redo(self) -> Optional[FancyDict]:
+        """ Step forward again. :return: the state we are at now, or None if there is nothing to redo """
+        if not self.can_redo:
+            return None
+        self._pos += 1
+        return self.state()
+
+    def set_moves(self, moves: int):
+        """ Correct the history length of the current state (redoing does not bring back moves which did nothing) """
+        self._moves[self._slot_(self._pos)] = moves
+
+    def clear(self):
+        self._start, self._len, self._pos = 0, 0, -1
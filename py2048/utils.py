@@ -15,6 +15,14 @@ class VisualisationError(Exception):
     ...
 
 
+class ProtocolError(ValueError):
+    ...
+
+
+class JournalClosed(IOError):
+    ...
+
+
 def mutstr(base: str, ind: int, val: str):
     if len(base) <= ind:
         raise ValueError(f"Asked to change the character nr. {ind} in a string of only {base.__len__()} chars.")
@@ -27,13 +35,24 @@ def nparr_to_dict(data: np.ndarray) -> dict:
 
 
 def dict_to_nparr(data: dict) -> np.ndarray:
-    n_row, n_col = len(data), len(data[0])
-    op = np.zeros((n_row, n_row), dtype=np.int)
-    for i, row in enumerate(data):
-        op[i] = row
+    n_row, n_col = len(data), len(data["row_0"])
+    op = np.zeros((n_row, n_col), dtype=np.int32)
+    for i in range(n_row):
+        op[i] = data[f"row_{i}"]
     return op
 
 
+def to_exponents(vals: np.ndarray) -> np.ndarray:
+    """ Tile values to their log2 (0 for an empty cell), as uint8 """
+    return np.where(vals > 0, np.frexp(vals)[1] - 1, 0).astype(np.uint8)
+
+
+def from_exponents(exps: np.ndarray) -> np.ndarray:
+    """ The inverse of to_exponents, as int32 tile values """
+    exps = exps.astype(np.int32)
+    return np.where(exps > 0, np.left_shift(1, exps), 0).astype(np.int32)
+
+
 class FancyDict(dict):
     """
         A dictionary that can be invoked both by:
@@ -1,11 +1,9 @@
 """ Here are utils for visualisation of the grid and the game """
 from abc import ABC
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, Tuple
 from math import log10, floor
 import numpy as np
 
-from utils import mutstr
-
 
 class Theme(ABC):
 
@@ -115,18 +113,20 @@ class Theme(ABC):
             raise ValueError(f"Unequal length of next and current string. Len next: {len(next_sent)}. "
                              f"Len current: {len(current)}.")
 
-        intersections = current[::]
+        # Work on a list of chars and join once at the end, instead of rebuilding the string for every replacement
+        intersections = list(current)
+        above, below = (self.ver, self.topinter), (self.ver, self.bottominter)
         for i, (char, char_p, char_n) in enumerate(zip(current, prev_sent, next_sent)):
             if char != self.hor: continue
-            if char_p in [self.ver, self.topinter] and char_n in [self.ver, self.bottominter]:
-                current = mutstr(current, i, self.fourwayinter)
-            elif char_p in [self.ver, self.topinter]:
-                current = mutstr(current, i, self.bottominter)
-            elif char_n in [self.ver, self.bottominter]:
-                current = mutstr(current, i, self.topinter)
+            if char_p in above and char_n in below:
+                intersections[i] = self.fourwayinter
+            elif char_p in above:
+                intersections[i] = self.bottominter
+            elif char_n in below:
+                intersections[i] = self.topinter
             else:
                 ...
-        return current
+        return ''.join(intersections)
 
 
 class Rounded(Theme):
@@ -174,28 +174,39 @@ class VisualizeGrid:
         self.pad_hor: int = pad_hor
         self.pad_ver: int = pad_ver
 
-    def _make_row_(self, row: np.ndarray, val_len: int):
-        # return self.ver + self.ver.join([self.pad*celllen for _ in range(numcells)]) + self.ver
-        # noinspection PyArgumentList
-        row = [self.align(str(num), val_len, self.theme.pad) for num in row]
-        return self.theme.ver + self.theme.ver.join([self.theme.pad + cellval + self.theme.pad for cellval in row]) + \
-               self.theme.ver
+        # The frame of the board with a '{}' slot for every cell, see _template_.
+        self._templates: Dict[Tuple, str] = {}
+
+    def _make_row_(self, numcells: int) -> str:
+        """ Returns a │ {} │ {} │ {} │ with a format slot for every cell """
+        pad = self.theme.pad * self.pad_hor
+        return self.theme.ver + self.theme.ver.join([pad + '{}' + pad for _ in range(numcells)]) + self.theme.ver
+
+    def _template_(self, dim: int, val_len: int) -> str:
+        """
+            The whole board as a format string (one '{}' per cell, row by row). Building the frame and working out
+            its intersections is the expensive part of rendering, and it only depends on the theme, the grid size and
+            the cell width. So we do it once per combination, and every frame is then a single str.format call.
+            When the grid's maxchar changes, the cell width changes and we build (and keep) another template.
+        """
+        key = (type(self.theme).__name__, dim, val_len, self.pad_hor, self.pad_ver)
+        if key in self._templates:
+            return self._templates[key]
 
-    def __call__(self, grid):
-        """ Give it an initialized grid """
-        val_len = grid.maxchar
         cell_len = val_len + (2 * self.pad_hor)
 
         # left border + all cell content + cell borders + right border
-        row_len = 1 + (grid.dim * cell_len) + (grid.dim - 1) + 1
+        row_len = 1 + (dim * cell_len) + (dim - 1) + 1
 
-        # Let's start
+        # Let's start. Value rows are left empty till the intersections are done; they only hold ver and pad chars.
         quarry = [self.theme.top(row_len)]
-        for rowid in range(grid.dim):
-            quarry += [self.theme.empty(cell_len, grid.dim) for _ in range(self.pad_ver)]
-            quarry += [self._make_row_(grid.vals[rowid], val_len)]
-            quarry += [self.theme.empty(cell_len, grid.dim) for _ in range(self.pad_ver)]
-            if not rowid == grid.dim-1:
+        value_rows = []
+        for rowid in range(dim):
+            quarry += [self.theme.empty(cell_len, dim) for _ in range(self.pad_ver)]
+            value_rows.append(len(quarry))
+            quarry += [self.theme.empty(cell_len, dim)]
+            quarry += [self.theme.empty(cell_len, dim) for _ in range(self.pad_ver)]
+            if not rowid == dim-1:
                 quarry += [self.theme.hline(row_len)]
         quarry += [self.theme.bottom(row_len)]
 
@@ -203,9 +214,27 @@ class VisualizeGrid:
         quarry[0] = self.theme.intersect(quarry[0], next_sent=quarry[1])
         for i in range(1, len(quarry)-1):
             quarry[i] = self.theme.intersect(quarry[i], prev_sent=quarry[i-1], next_sent=quarry[i+1])
-        quarry[-1] = self.theme.intersect(quarry[-1], prev_sent=quarry[i-2])
+        quarry[-1] = self.theme.intersect(quarry[-1], prev_sent=quarry[-2])
+
+        # And put the slots in
+        quarry = [line.replace('{', '{{').replace('}', '}}') for line in quarry]
+        for i in value_rows:
+            quarry[i] = self._make_row_(dim)
+
+        # A handful of widths ever show up in a game, but don't let this grow without bounds
+        if len(self._templates) >= 64:
+            self._templates.clear()
+        self._templates[key] = '\n'.join(quarry)
+        return self._templates[key]
+
+    def __call__(self, grid):
+        """ Give it an initialized grid """
+        val_len = grid.maxchar
+        pad = self.theme.pad
 
-        return '\n'.join(quarry)
+        # noinspection PyArgumentList
+        cells = [self.align(str(num), val_len, pad) for num in grid.vals.ravel().tolist()]
+        return self._template_(grid.dim, val_len).format(*cells)
 
     def game_over(self, grid):
 
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from py2048.agents import ExpectimaxAgent
+from py2048.env import Env
+
+
+def grid_of(vals: list):
+    """ A Grid (from the same module the agents import) with these values """
+    env = Env()
+    env.reset(seed=0)
+    grid = env.game.grid
+    grid.set_vals(np.array(vals, dtype=np.int32))
+    return grid
+
+
+MIDGAME = [[2, 0, 4, 8],
+           [0, 16, 2, 0],
+           [4, 2, 32, 64],
+           [0, 0, 8, 128]]
+
+
+class TestAgents:
+
+    def test_depth_validation(self):
+        with pytest.raises(ValueError):
+            ExpectimaxAgent(depth=0)
+
+    def test_time_budget_stops_deepening(self):
+        agent = ExpectimaxAgent(depth=10, time_budget=0.05)
+        grid = grid_of(MIDGAME)
+        direction = agent.act(grid)
+        assert grid.legal_moves[direction]
+        assert 1 <= agent.depths[-1] < 10 and agent.latencies[-1] < 1.
+
+    def test_prob_cutoff_prunes(self):
+        nodes = []
+        for cutoff in [0., 1e-2]:
+            agent = ExpectimaxAgent(depth=3, prob_cutoff=cutoff)
+            assert agent.act(grid_of(MIDGAME)) is not None
+            nodes.append(agent.nodes[-1])
+        assert nodes[1] < nodes[0]
+
+    def test_lost_board(self):
+        lost = [[2, 4, 2, 4],
+                [4, 2, 4, 2],
+                [2, 4, 2, 4],
+                [4, 2, 4, 2]]
+        for agent in [ExpectimaxAgent(depth=2), ExpectimaxAgent(depth=3, time_budget=0.05)]:
+            assert agent.act(grid_of(lost)) is None
+            assert agent.report().moves == 1
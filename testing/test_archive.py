@@ -0,0 +1,54 @@
+import numpy as np
+from pathlib import Path
+from py2048 import engine
+from py2048.engine import Game, Grid
+from py2048.archive import Archive, ArchiveWriter, convert_savedir, NO_ACTION
+
+
+class TestArchive:
+
+    def test_convert_savedir(self, tmp_path: Path, monkeypatch):
+        savedir = tmp_path / 'saves'
+        monkeypatch.setattr(engine.CONFIG, 'savedir', savedir)
+        expected = {}
+        for seed in range(3):
+            game = Game(grid=Grid(seed=seed), session_id=f"game{seed}", autosave=False)
+            for direction in np.random.default_rng(seed).integers(0, 4, 40 + 10 * seed):
+                game.step(int(direction))
+            states = [game.seek(i)[0] for i in range(len(game.history) + 1)]
+            expected[game.session_id] = (states, game.score)
+            game._save_()
+
+        assert convert_savedir(savedir, tmp_path / 'games.p2a') == 3
+        archive = Archive(tmp_path / 'games.p2a')
+        assert len(archive) == 3 and archive.n_boards == sum(len(states) for states, _ in expected.values())
+        assert isinstance(archive.records, np.memmap)
+
+        for i in range(len(archive)):
+            game = archive[i]
+            states, score = expected[game.session_id]
+            assert game.score == score and len(game.boards) == len(states) == len(game.actions) + 1
+            assert np.all(archive.vals(i) == np.stack(states))
+            assert np.shares_memory(game.boards, archive.records)
+
+    def test_empty(self, tmp_path: Path):
+        ArchiveWriter(tmp_path / 'empty.p2a').close()
+        archive = Archive(tmp_path / 'empty.p2a')
+        assert len(archive) == 0 and archive.boards.shape == (0, 4, 4)
+
+    def test_add(self, tmp_path: Path):
+        boards = np.array([[[2, 0], [0, 0]], [[2, 0], [2, 0]], [[4, 0], [0, 2]]], dtype=np.int32)
+        with ArchiveWriter(tmp_path / 'small.p2a', dim=2) as writer:
+            writer.add(boards, [0, 0], session_id='small', score=4)
+        archive = Archive(tmp_path / 'small.p2a')
+        assert archive.actions.tolist() == [NO_ACTION, 0, 0]
+        assert archive[0].boards.tolist() == [[[1, 0], [0, 0]], [[1, 0], [1, 0]], [[2, 0], [0, 1]]]
+
+    def test_long_session_id(self, tmp_path: Path):
+        """ IDs longer than the index holds are cut where a character ends, so that they still decode """
+        boards = np.zeros((1, 2, 2), dtype=np.int32)
+        with ArchiveWriter(tmp_path / 'ids.p2a', dim=2) as writer:
+            writer.add(boards, [], session_id='é' * 20)           # 40 bytes of UTF-8
+            writer.add(boards, [], session_id='a' + 'é' * 20)     # the 32nd byte is half an é
+        archive = Archive(tmp_path / 'ids.p2a')
+        assert archive[0].session_id == 'é' * 16 and archive[1].session_id == 'a' + 'é' * 15
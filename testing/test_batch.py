@@ -0,0 +1,51 @@
+import numpy as np
+from py2048.engine import Grid
+from py2048 import engine
+from py2048.batch import BatchGrid, move_boards, boards_over
+from py2048.kernel import move_board
+
+
+class TestBatchGrid:
+
+    def test_moves_match_grid(self):
+        """ Moving a batch of boards should give the same boards and scores as moving them one at a time """
+        rng = np.random.default_rng(0)
+        vals = np.where(rng.random((200, 5, 5)) < 0.4, 0, 2 ** rng.integers(1, 6, (200, 5, 5))).astype(np.int32)
+        actions = rng.integers(0, 4, 200)
+
+        moved, scores = move_boards(vals, actions)
+
+        grid = Grid(dim=5)
+        for board, action, op, score in zip(vals, actions, moved, scores):
+            grid.set_vals(board.copy())
+            merges = [grid.up, grid.down, grid.left, grid.right][action]()
+            assert np.all(grid.vals == op), f"INPUT: {board}, ACTION: {action}"
+            assert sum(merges) == score
+            assert grid.is_over == boards_over(board[None])[0]
+
+    def test_step(self):
+        batch = BatchGrid(64, seed=0)
+        assert np.all((batch.vals != 0).sum(axis=(1, 2)) == 2)
+
+        before = batch.vals.copy()
+        scores, changed, over = batch.step(np.full(64, 2))
+        assert np.all((batch.vals != 0).sum(axis=(1, 2))[changed] == 2 + 1 - (scores[changed] > 0))
+        assert np.all(batch.vals[~changed] == before[~changed])
+        assert not over.any()
+
+
+class TestKernel:
+
+    def test_matches_rows(self, monkeypatch):
+        """ The whole-board kernel gives the same boards and merges (in the same order) as going row by row """
+        rng = np.random.default_rng(1)
+        monkeypatch.setattr(engine.CONFIG, 'vector_dim', 1000)
+        for dim in (2, 3, 4, 9, 32):
+            grid = Grid(dim=dim)
+            for _ in range(20):
+                board = np.where(rng.random((dim, dim)) < 0.3, 0, 2 ** rng.integers(1, 4, (dim, dim))).astype(np.int32)
+                for direction, simulate in enumerate((grid.up, grid.down, grid.left, grid.right)):
+                    expected, expected_merges = simulate(board.copy())
+                    vals, merges = move_board(board.copy(), direction)
+                    assert np.all(vals == expected), f"INPUT: {board}, DIRECTION: {direction}"
+                    assert merges == expected_merges
@@ -0,0 +1,20 @@
+import time
+from py2048.benchmark import measure, compare
+
+
+class TestBenchmark:
+
+    def test_compare(self):
+        baseline = {'move': 1.0, 'spawn': 2.0, 'gone': 1.0}
+        rows = compare({'move': 1.3, 'spawn': 2.2, 'new': 5.0}, baseline, tolerance=0.2)
+        flags = {name: flag for name, _, _, _, flag in rows}
+        assert flags == {'move': 'REGRESSION', 'spawn': ''}         # 30% slower is flagged, 10% slower is not
+        assert [row[:4] for row in rows if row[0] == 'move'] == [['move', 1.0, 1.3, 1.3]]
+        assert all(flag == '' for *_, flag in compare(baseline, baseline, tolerance=0.))
+
+    def test_measure(self):
+        calls = []
+        secs = measure(lambda arg: calls.append(arg) or time.sleep(0.001), setup=lambda: len(calls), min_time=0.01,
+                       repeats=2)
+        assert 0.001 <= secs < 0.1
+        assert calls == list(range(len(calls))) and len(calls) >= 2         # setup runs before every call
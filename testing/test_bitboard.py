@@ -0,0 +1,34 @@
+import numpy as np
+from py2048.engine import Grid
+from py2048.bitboard import BitGrid, pack, unpack, transpose
+
+
+def random_board(rng: np.random.Generator) -> np.ndarray:
+    exps = rng.integers(1, 12, (4, 4))
+    return np.where(rng.random((4, 4)) < 0.4, 0, 1 << exps).astype(np.int32)
+
+
+class TestBitboard:
+
+    def test_pack_unpack(self):
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            vals = random_board(rng)
+            assert np.all(unpack(pack(vals)) == vals)
+            assert transpose(pack(vals)) == pack(vals.T.copy())
+
+    def test_moves_match_grid(self):
+        """ Every direction should give the same board and the same merges as the regular grid """
+        rng = np.random.default_rng(0)
+        grid, bitgrid = Grid(), BitGrid()
+        for _ in range(500):
+            vals = random_board(rng)
+            for direction in ['up', 'down', 'left', 'right']:
+                grid.set_vals(vals.copy())
+                bitgrid.set_vals(vals.copy())
+                merges = getattr(grid, direction)()
+                bitmerges = getattr(bitgrid, direction)()
+
+                assert np.all(grid.vals == bitgrid.vals), f"INPUT: {vals}, DIRECTION: {direction}"
+                assert [int(x) for x in merges] == bitmerges
+                assert grid.is_unchanged == bitgrid.is_unchanged
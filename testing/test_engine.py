@@ -38,14 +38,137 @@ class TestGridShifts:
             _inp = np.array(_inp)
             _op = np.array(_op)
 
-            assert np.all(_op == grid._proc_row_(_inp)), f"INPUT:         {_inp}," \
+            assert np.all(_op == grid._proc_row_(_inp)[0]), f"INPUT:         {_inp}," \
                                                          f"\nOUTPUT:        {_op}," \
-                                                         f"\nACTUAL OUTPUT: {grid._proc_row_(_inp)}"
+                                                         f"\nACTUAL OUTPUT: {grid._proc_row_(_inp)[0]}"
 
 
 class TestGridConsistency:
-    ...
+
+    def test_simulation_leaves_grid_alone(self):
+        """ Simulating moves on a copy (as is_over and legal_moves do) must not touch the grid itself """
+        grid = Grid()
+        vals = np.array([[2, 4, 2, 4], [2, 8, 16, 8], [4, 2, 4, 2], [2, 4, 2, 4]], dtype=np.int32)
+        grid.set_vals(vals.copy())
+
+        assert not grid.is_over
+        assert list(grid.legal_moves) == [True, True, False, False]
+        assert np.all(grid.vals == vals)
+
+        grid.up(grid.vals.copy())
+        assert np.all(grid.vals == vals)
+
+    def test_move_uses_transitions(self):
+        grid = Grid()
+        vals = np.array([[2, 2, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 4]], dtype=np.int32)
+        grid.set_vals(vals.copy())
+
+        afterstate, changed, merges = grid.transitions[2]
+        assert grid.left() == merges == [4]
+        assert changed and not grid.is_unchanged
+        assert np.all(grid.vals == afterstate)
+
+        grid.left()
+        assert grid.is_unchanged
+
+    def test_transitions_are_lazy(self):
+        """ A move only computes its own direction, and legal_moves all four """
+        grid = Grid()
+        grid.set_vals(np.array([[2, 2, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 4]], dtype=np.int32))
+        grid.move(2)
+        assert [transition is not None for transition in grid._transitions] == [False, False, True, False]
+        grid.transition(0)          # of the new state
+        assert [transition is not None for transition in grid._transitions] == [True, False, False, False]
+        assert list(grid.legal_moves) == [True, True, False, True]
+        assert None not in grid._transitions
+
+    def test_afterstates(self):
+        rng = np.random.default_rng(2)
+        for dim in (3, 4, 9):
+            grid = Grid(dim=dim)
+            out = np.zeros((4, dim, dim), dtype=np.int32)
+            for _ in range(20):
+                vals = np.where(rng.random((dim, dim)) < 0.4, 0, 2 ** rng.integers(1, 4, (dim, dim))).astype(np.int32)
+                afters, scores, changed = grid.afterstates(vals, out=out)
+                assert afters is out
+                for direction, simulate in enumerate((grid.up, grid.down, grid.left, grid.right)):
+                    expected, merges = simulate(vals.copy())
+                    assert np.all(afters[direction] == expected) and scores[direction] == sum(merges)
+                    assert changed[direction] == (not np.array_equal(expected, vals))
+
+    def test_chance_outcomes(self):
+        vals = np.array([[2, 4, 0, 8], [2, 8, 16, 8], [4, 0, 4, 2], [2, 4, 2, 0]], dtype=np.int32)
+
+        boards, probs = Grid(seed=0).chance_outcomes(vals)
+        assert len(boards) == 6 and np.isclose(probs.sum(), 1)
+        assert np.all((boards != vals).sum(axis=(1, 2)) == 1)
+        assert np.isclose(probs[(boards == 4).sum(axis=(1, 2)) > (vals == 4).sum()].sum(), 0.2)
+
+        boards, probs = Grid(seed=0, spawns=2).chance_outcomes(vals)
+        assert len(boards) == 3 * 4 and np.isclose(probs.sum(), 1)
+        assert len({board.tobytes() for board in boards}) == 12
+
+        # The empirical distribution of spawns matches
+        grid, counts = Grid(seed=0), {}
+        for _ in range(4000):
+            grid.set_vals(vals.copy())
+            grid.spawn()
+            counts[grid.vals.tobytes()] = counts.get(grid.vals.tobytes(), 0) + 1
+        boards, probs = grid.chance_outcomes(vals)
+        for board, prob in zip(boards, probs):
+            assert abs(counts.get(board.tobytes(), 0) / 4000 - prob) < 0.03
 
 
 class TestGridInits:
-    ...
\ No newline at end of file
+
+    def test_seeded_spawns(self):
+        """ Grids with the same seed spawn the same values in the same places, also across a save and load """
+        one, two = Grid(seed=7), Grid(seed=7)
+        for direction in [0, 2, 1, 3] * 10:
+            if one.is_over:
+                break
+            for grid in (one, two):
+                grid.move(direction)
+                if not grid.is_unchanged:
+                    grid.spawn()
+            assert np.all(one.vals == two.vals)
+
+        three = Grid.de_serialize(one.serialise())
+        assert np.all(three.vals == one.vals) and three.draws == one.draws
+        one.spawn(), three.spawn()
+        assert np.all(three.vals == one.vals)
+
+    def test_spawn_distinct_cells(self):
+        grid = Grid(seed=0)
+        grid.set_vals(np.zeros((4, 4), dtype=np.int32))
+        grid.spawn(16)
+        assert np.all(grid.vals != 0)
+
+    def test_custom_numgen(self):
+        """ Numgens which take no arguments still work. Those which take a generator spawn reproducibly. """
+        grid = Grid(seed=0, numgen=lambda: 2)
+        grid.set_vals(np.zeros((4, 4), dtype=np.int32))
+        grid.spawn(16)
+        assert np.all(grid.vals == 2)
+
+        def eights(rng: np.random.Generator) -> int:
+            return int(rng.choice([2, 8]))
+
+        one, two = Grid(seed=5, numgen=eights), Grid(seed=6, numgen=eights)
+        two.seed = one.seed
+        two._seek_rng_(one.draws)
+        for grid in (one, two):
+            grid.set_vals(np.zeros((4, 4), dtype=np.int32))
+            grid.spawn(12)
+        assert np.all(one.vals == two.vals) and set(np.unique(one.vals)) == {0, 2, 8}
+
+
+class TestImport:
+
+    def test_import_budget(self):
+        """ Importing the engine (or the bitboards) is quick, and loads no UI or persistence modules """
+        from py2048.benchmark import IMPORT_BUDGET, import_time
+        for module, budget in IMPORT_BUDGET.items():
+            secs, loaded = import_time(module, repeats=1)
+            assert not loaded, f"importing {module} pulled in {loaded}"
+            assert secs < budget, f"importing {module} took {secs:.3f}s, more than its budget of {budget}s"
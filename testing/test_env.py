@@ -0,0 +1,36 @@
+import numpy as np
+from py2048.env import Env
+from py2048.bitboard import BitGrid
+
+
+class TestEnv:
+
+    def test_random_play(self):
+        """ Play random legal moves till the end; rewards should add up to the game score """
+        for grid_cls in [BitGrid, None]:
+            env = Env(grid_cls=grid_cls) if grid_cls else Env()
+            rng = np.random.default_rng(0)
+            obs = env.reset(seed=0)
+            legal = env.legal_actions
+            total, done = 0, False
+            while not done:
+                obs, reward, done, legal_next = env.step(int(rng.choice(np.flatnonzero(legal))))
+                total += reward
+                legal = legal_next
+
+            assert total == env.game.score
+            assert not legal.any()
+            assert np.all(obs == env.game.grid.vals)
+
+    def test_record(self):
+        """ Games of an env keep no replay or undo buffer unless asked to, and play out the same either way """
+        boards = []
+        for record in [False, True]:
+            env = Env(record=record)
+            env.reset(seed=3)
+            for action in np.random.default_rng(3).integers(0, 4, 50):
+                env.step(int(action))
+            assert len(env.game.replay) == (len(env.game.history) if record else 0)
+            boards.append(env.game.grid.vals.copy())
+            assert env.game.undo() == record
+        assert np.all(boards[0] == boards[1])
@@ -0,0 +1,26 @@
+import numpy as np
+from pathlib import Path
+from py2048.export import transitions, ShardWriter, read_shards, read_transitions
+from py2048.utils import to_exponents
+
+
+class TestExport:
+
+    def test_roundtrip(self, tmp_path: Path):
+        expected = list(transitions('random', games=3, seed=0))
+        with ShardWriter(tmp_path, shard_size=100) as writer:
+            writer.extend(transitions('random', games=3, seed=0))
+
+        assert writer.count == len(expected)
+        assert len(writer.shards) == (len(expected) + 99) // 100
+        assert [len(shard.actions) for shard in read_shards(tmp_path)][:-1] == [100] * (len(writer.shards) - 1)
+        assert sum(shard.dones.sum() for shard in read_shards(tmp_path)) == 3
+
+        for (state, action, reward, next_state, done), got in zip(expected, read_transitions(tmp_path)):
+            assert np.all(got[0] == to_exponents(state)) and np.all(got[3] == to_exponents(next_state))
+            assert got[1:3] == (action, reward) and got[4] == done
+
+        # Consecutive transitions of a game chain up
+        shard = next(read_shards(tmp_path))
+        chained = ~shard.dones[:-1]
+        assert np.all(shard.next_states[:-1][chained] == shard.states[1:][chained])
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from py2048.heuristics import Heuristic, line_features
+
+
+class TestHeuristic:
+
+    def boards(self, n: int, dim: int, maxexp: int = 12) -> np.ndarray:
+        rng = np.random.default_rng(dim)
+        vals = 2 ** rng.integers(1, maxexp, (n, dim, dim))
+        return np.where(rng.random((n, dim, dim)) < 0.4, 0, vals).astype(np.int32)
+
+    def test_tables_match_features(self):
+        """ The 4x4 lookup tables give the same values as computing the features directly """
+        heuristic = Heuristic(smoothness=3., corner=5.)
+        boards = self.boards(2000, 4)
+        features = heuristic.features(boards)
+        expected = sum(heuristic.weights[name] * features[name] for name in features)
+        assert np.allclose(heuristic.batch(boards), expected)
+        assert np.isclose(heuristic(boards[0]), expected[0])
+
+    def test_line_features(self):
+        features = line_features(np.array([[1, 0, 1, 2], [3, 2, 1, 0]]))
+        assert features.empty.tolist() == [1, 1]
+        assert features.merges.tolist() == [1, 0]
+        assert features.smoothness.tolist() == [-1, -2]
+        assert features.monotonicity.tolist() == [-1, 0]
+
+    def test_other_sizes(self):
+        heuristic = Heuristic()
+        boards = self.boards(50, 6)
+        assert heuristic.batch(boards).shape == (50,)
+        assert np.isclose(heuristic(boards[3]), heuristic.batch(boards)[3])
+
+    def test_unknown_weight(self):
+        with pytest.raises(ValueError):
+            Heuristic(emptiness=1.)
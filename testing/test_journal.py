@@ -0,0 +1,138 @@
+import threading
+import numpy as np
+import pytest
+from pathlib import Path
+from py2048 import engine
+from py2048.engine import Game, Grid
+from py2048.journal import read_records, encode_record, JournalWriter, EPOCH, RESTORE
+
+
+@pytest.fixture
+def savedir(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(engine.CONFIG, 'savedir', tmp_path)
+    monkeypatch.setattr(engine.CONFIG, 'compact_every', 50)
+    return tmp_path
+
+
+def play(moves: int) -> Game:
+    game = Game(grid=Grid(seed=1), session_id='journaled')
+    for _ in range(moves):
+        legal = game.grid.legal_moves
+        game.step(next(direction for direction in (0, 2, 3, 1) if legal[direction]))    # up, left, right, down
+    assert len(game.history) == moves
+    return game
+
+
+class TestJournal:
+
+    def test_crash_recovery(self, savedir: Path):
+        """ Without a final save, the snapshot plus the journal still has every move """
+        game = play(120)
+        game.journal.flush()
+        game.autosave = False           # no save at deletion, as if we crashed here
+
+        records = list(read_records(game.journal_fname))
+        assert len(records) == 21 and records[0][:2] == (3, EPOCH)        # the third snapshot, and 20 moves
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == game.history and loaded.score == game.score
+        assert np.all(loaded.grid.vals == game.grid.vals)
+        assert loaded.grid.draws == game.grid.draws
+        assert np.all(loaded.seek(len(game.history))[0] == game.grid.vals)
+
+    def test_torn_tail(self, savedir: Path):
+        game = play(120)
+        game.journal.flush()
+        game.autosave = False
+
+        # Chop the last record in half: only that move is lost
+        fname = game.journal_fname
+        fname.write_bytes(fname.read_bytes()[:-5])
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == game.history[:-1]
+
+    def test_close(self, savedir: Path):
+        game = play(70)
+        game.close()
+        assert [record[1] for record in read_records(game.journal_fname)] == [EPOCH]
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == game.history and np.all(loaded.grid.vals == game.grid.vals)
+
+    def test_undo_redo(self, savedir: Path):
+        """ Undoing and redoing is journaled, not snapshotted, and a crash after it loses nothing """
+        game = play(60)
+        for _ in range(5):
+            game.undo()
+        game.redo()
+        game.step(next(direction for direction in range(4) if game.grid.legal_moves[direction]))
+        game.journal.flush()
+        game.autosave = False
+
+        directions = [record[1] for record in read_records(game.journal_fname)]
+        assert directions[0] == EPOCH and directions.count(RESTORE) == 5 and len(directions) == 1 + 10 + 5 + 1 + 1
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == game.history and loaded.score == game.score
+        assert np.all(loaded.grid.vals == game.grid.vals) and loaded.grid.draws == game.grid.draws
+
+    def test_undo_full_big_board(self, savedir: Path):
+        """ Undoing to a board with more nonzero cells than a record has room for spawns """
+        vals = (2 << (np.indices((16, 16)).sum(axis=0) % 2)).astype(np.int32)     # 2s and 4s, with no merges
+        vals[0, 0] = 4                                                              # but for 4, 4 at the top
+        grid = Grid(dim=16, seed=1)
+        grid.set_vals(vals)
+        game = Game(grid=grid, session_id='journaled')
+        game.step(2)
+        assert game.undo() and np.all(game.grid.vals == vals)
+        game.journal.flush()
+        game.autosave = False
+
+        assert [record[1] for record in read_records(game.journal_fname)] == [EPOCH, 2, RESTORE]
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == [] and np.all(loaded.grid.vals == vals) and loaded.grid.draws == game.grid.draws
+
+    def test_stale_journal(self, savedir: Path):
+        """ A journal from before the snapshot (as after a crash in the middle of compacting) is not played again """
+        game = play(40)
+        game.journal.flush()
+        stale = game.journal_fname.read_bytes()
+        for _ in range(3):
+            game.undo()
+        game.close()
+        game.journal_fname.write_bytes(stale)
+
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == game.history and np.all(loaded.grid.vals == game.grid.vals)
+
+    def test_draws_after_gap(self, savedir: Path):
+        """ Records which are not played (here after a gap) do not move the random generator """
+        game = play(30)
+        game.journal.flush()
+        game.autosave = False
+        with game.journal_fname.open('ab') as f:
+            f.write(encode_record(len(game.history) + 3, 0, 0, 0, []))
+
+        loaded = Game._load_('journaled')
+        loaded.autosave = False
+        assert loaded.history == game.history and loaded.grid.draws == game.grid.draws
+
+    def test_writer_dies_while_queue_is_full(self, tmp_path: Path):
+        """ A game waiting for room in the queue gets the writer's error, instead of waiting forever """
+        writer = JournalWriter(tmp_path / 'dying.journal', maxsize=1)
+        stuck, failing = threading.Event(), threading.Event()
+
+        def serialise() -> bytes:
+            stuck.set()
+            failing.wait()
+            raise OSError('disk gone')
+
+        writer.compact([(tmp_path / 'dying.json', serialise)])
+        stuck.wait()
+        writer.append(0, 0, 0, 0, [])          # fills the queue, while the writer is stuck in the compaction
+        threading.Timer(0.2, failing.set).start()
+        with pytest.raises(OSError, match='disk gone'):
+            writer.append(1, 0, 0, 0, [])
@@ -0,0 +1,58 @@
+import sys
+import pytest
+from pathlib import Path
+from py2048 import manager
+from py2048.manager import SessionManager
+
+# The engine module the manager's games come from
+engine = sys.modules[manager.Game.__module__]
+
+
+@pytest.fixture
+def savedir(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(engine.CONFIG, 'savedir', tmp_path)
+    return tmp_path
+
+
+def new_game(session_id: str, seed: int = 0):
+    game = engine.Game(grid=engine.Grid(seed=seed), session_id=session_id, autosave=False)
+    game.step(2)
+    return game
+
+
+class TestManager:
+
+    def test_lru_write_back(self, savedir: Path):
+        sessions = SessionManager(max_sessions=2)
+        assert sessions.put(new_game('a')) == [] and sessions.put(new_game('b', 1)) == []
+        assert sessions.get('a')[0] is not None             # b is now the least recently used
+
+        evicted = sessions.put(new_game('c', 2))
+        assert [game.session_id for game in evicted] == ['b'] and 'b' not in sessions
+
+        # Still ours till it is written back. Taking it back in evicts again, to stay within the limit.
+        game, evicted_a = sessions.get('b')
+        assert game is evicted[0] and [game.session_id for game in evicted_a] == ['a'] and len(sessions) == 2
+        evicted += evicted_a + sessions.put(new_game('d', 3))
+        for game in evicted:
+            sessions.write_back(game)
+        assert (savedir / 'b.json').exists() and (savedir / 'a.json').exists() and len(sessions) == 2
+
+        # Clean games are dropped without saving, and come back from disk
+        sessions = SessionManager(max_sessions=1)
+        game = sessions.open('b')
+        assert game.score == evicted[0].score and not sessions.is_dirty('b')
+        sessions.put(new_game('e'), dirty=False)
+        assert 'b' not in sessions and sessions.writebacks == 0
+        assert sessions.open('b').history == game.history
+
+        report = sessions.report()
+        assert (report.hits, report.misses, report.loads, report.evictions) == (0, 2, 2, 2)
+
+    def test_memory_limit(self, savedir: Path):
+        one = new_game('one')
+        sessions = SessionManager(max_sessions=100, max_bytes=int(2.5 * (one.nbytes + manager.GAME_OVERHEAD)))
+        for i in range(5):
+            sessions.put(new_game(f"g{i}", i), dirty=False)
+        assert len(sessions) == 2 and sessions.nbytes <= sessions.max_bytes
+        assert sessions.flush() == 0
@@ -0,0 +1,29 @@
+import numpy as np
+from pathlib import Path
+from py2048.ntuple import NTupleNetwork, TDTrainer, SMALL_PATTERNS
+
+
+class TestNTuple:
+
+    def test_symmetric(self):
+        """ Boards which are rotations or reflections of each other have the same value """
+        network = NTupleNetwork(SMALL_PATTERNS)
+        network.weights[:] = np.random.default_rng(0).random(network.size)
+        vals = np.array([[2, 4, 0, 8], [0, 16, 2, 0], [4, 0, 0, 32], [2, 0, 0, 2]], dtype=np.int32)
+        boards = [np.rot90(vals, k) for k in range(4)] + [np.fliplr(np.rot90(vals, k)) for k in range(4)]
+        assert np.allclose(network.batch(np.stack(boards)), network(vals))
+
+    def test_train_and_load(self, tmp_path: Path):
+        network = NTupleNetwork(SMALL_PATTERNS)
+        report = TDTrainer(network, alpha=0.1, lam=0.5, seed=0).train(20)
+        assert report.games == 20 and report.moves > 0 and np.abs(network.weights).sum() > 0
+
+        # The same seed plays the same games
+        again = NTupleNetwork(SMALL_PATTERNS)
+        assert TDTrainer(again, alpha=0.1, lam=0.5, seed=0).train(20).score_mean == report.score_mean
+        assert np.array_equal(again.weights, network.weights)
+
+        network.save(tmp_path / 'weights.npy')
+        loaded = NTupleNetwork.load(tmp_path / 'weights.npy')
+        assert isinstance(loaded.weights, np.memmap) and np.array_equal(loaded.weights, network.weights)
+        assert TDTrainer(loaded, seed=1).play(learn=False).moves > 0
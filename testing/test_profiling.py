@@ -0,0 +1,62 @@
+import json
+import numpy as np
+from py2048.profiling import Profiler, Histogram
+from py2048.env import Env
+
+
+class TestProfiling:
+
+    def test_histogram_quantiles(self):
+        hist = Histogram()
+        for ns in range(1, 10001):
+            hist.add(ns * 1000)
+        # Within a bucket (~9%) of the exact quantiles
+        for q in (0.5, 0.95, 0.99):
+            assert abs(hist.quantile(q) / (q * 1e7) - 1) < 0.1
+        assert hist.quantile(1.) <= hist.max_ns == 1e7
+
+    def test_profiler(self, tmp_path):
+        profiler = Profiler()
+        with profiler.phase('off'):
+            pass
+        profiler.count('off')
+        assert not profiler.phases and not profiler.counters
+
+        assert profiler.toggle()
+        for _ in range(10):
+            with profiler.phase('work'):
+                sum(range(1000))
+            profiler.count('work')
+        profiler.record('other', 0.002)
+
+        report = profiler.report()
+        assert report.phases.work.count == 10 and report.counters.work == 10
+        assert report.phases.work.p50_ms <= report.phases.work.p99_ms <= report.phases.work.max_ms
+        assert np.isclose(report.phases.other.total_ms, 2.)
+        assert json.loads(profiler.dump(tmp_path / 'profile.json').read_text())['phases']['work']['count'] == 10
+        assert 'work' in profiler.table()
+
+        profiler.reset()
+        assert not profiler.report().phases
+
+    def test_game_phases(self):
+        """ The game reports its phases to PROFILER once profiling is switched on with 'p' """
+        env = Env()
+        env.reset(seed=0)
+        game = env.game
+        from profiling import PROFILER          # the one the engine reports to
+
+        PROFILER.reset()
+        game, status = game.command(ord('p'))
+        try:
+            assert status == 11 and PROFILER.enabled
+            for key in (259, 260, 258, 261) * 3:
+                game.command(key)
+            game.get_statusbar_message(120)
+            assert game.command(ord('P'))[1] == 12
+            report = PROFILER.report()
+            assert {'move', 'is_over', 'spawn', 'statusbar'} <= set(report.phases)
+            assert report.phases.move.count == 12
+        finally:
+            game.command(ord('p'))
+        assert not PROFILER.enabled
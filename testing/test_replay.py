@@ -0,0 +1,47 @@
+import numpy as np
+from py2048.engine import Game, Grid
+from py2048.replay import Replay, HEADER
+
+
+class TestReplay:
+
+    def play(self, moves: int = 300) -> (Game, list):
+        """ Play a game, keeping the board and score after every move """
+        game = Game(grid=Grid(seed=1), session_id='replay', autosave=False)
+        game.replay.snapshot_every = 16
+        states = [(game.grid.vals.copy(), game.score)]
+        for direction in np.random.default_rng(1).integers(0, 4, moves):
+            _, _, gameover = game.step(int(direction))
+            if gameover:
+                break
+            states.append((game.grid.vals.copy(), game.score))
+        return game, states
+
+    def test_seek(self):
+        game, states = self.play()
+        for index in [0, 1, 15, 16, 17, len(states) - 1] + list(range(0, len(states), 7)):
+            vals, score = game.seek(index)
+            assert np.all(vals == states[index][0]), f"MOVE: {index}"
+            assert score == states[index][1]
+
+    def test_bytes_roundtrip(self):
+        game, states = self.play()
+        replay = Replay.from_bytes(game.replay.to_bytes())
+        assert len(replay) == len(game.replay) == len(game.history)
+
+        # One byte per move on a 4x4 grid, plus 16 exponents and a score per snapshot
+        n_snapshots = len(replay) // 16 + 1
+        assert len(game.replay.to_bytes()) == HEADER.size + len(replay) + n_snapshots * (16 + 8)
+        for index in range(0, len(states), 5):
+            assert np.all(replay.seek(index, game.grid)[0] == states[index][0])
+
+        replay.truncate(20)
+        assert np.all(replay.seek(20, game.grid)[0] == states[20][0])
+
+    def test_custom_numgen(self):
+        """ A grid which may spawn anything (not just 2s and 4s) plays without a replay, and can still be undone """
+        game = Game(grid=Grid(seed=2, numgen=lambda: 8), session_id='eights', autosave=False)
+        for direction in [0, 2, 1, 3] * 5:
+            game.step(direction)
+        assert 8 in game.grid.vals and len(game.replay) == 0 and len(game.history) == 20
+        assert game.undo() and game.redo()
@@ -0,0 +1,69 @@
+import pytest
+from py2048 import run
+from py2048.run import DirtyScreen
+
+
+class Recorder:
+    """ Stands in for a curses window, and records what is drawn on it """
+
+    def __init__(self):
+        self.calls = []
+
+    def move(self, y: int, x: int):
+        self.calls.append(('move', y, x))
+
+    def clrtoeol(self):
+        self.calls.append(('clrtoeol',))
+
+    def addstr(self, y: int, x: int, text: str, attr: int = 0):
+        self.calls.append(('addstr', y, x, text, attr))
+
+    def erase(self):
+        self.calls.append(('erase',))
+
+    def noutrefresh(self):
+        self.calls.append(('noutrefresh',))
+
+    def writes(self) -> list:
+        return [call[1:4] for call in self.calls if call[0] == 'addstr']
+
+
+@pytest.fixture
+def screen(monkeypatch) -> DirtyScreen:
+    monkeypatch.setattr(run.curses, 'doupdate', lambda: None)
+    return DirtyScreen(Recorder(), gap=2)
+
+
+def frame(screen: DirtyScreen, text: str, attr: int = 0) -> list:
+    screen.stdscr.calls = []
+    screen.draw(0, text, attr)
+    screen.flush()
+    return screen.stdscr.writes()
+
+
+class TestRun:
+
+    def test_spans(self, screen: DirtyScreen):
+        assert screen._spans_('abcdefgh', 'abcdefgh') == []
+        assert screen._spans_('abcdefgh', 'aXcdefgY') == [[1, 2], [7, 8]]
+        assert screen._spans_('abcdefgh', 'aXcYefgh') == [[1, 4]]          # close enough to write as one
+
+    def test_only_changes_are_drawn(self, screen: DirtyScreen):
+        assert frame(screen, 'hello world\nsecond row') == [(0, 0, 'hello world'), (1, 0, 'second row')]
+        assert frame(screen, 'hello world\nsecond row') == []
+        assert frame(screen, 'hellO world\nsecond rOw') == [(0, 4, 'O'), (1, 8, 'O')]
+
+        # A row of another length, or in another colour, is written whole
+        assert frame(screen, 'hellO world!\nsecond rOw') == [(0, 0, 'hellO world!')]
+        assert frame(screen, 'hellO world!\nsecond rOw', attr=1) == [(0, 0, 'hellO world!'), (1, 0, 'second rOw')]
+
+    def test_stale_rows_are_blanked(self, screen: DirtyScreen):
+        frame(screen, 'one\ntwo\nthree')
+        assert frame(screen, 'one') == []
+        assert ('move', 1, 0) in screen.stdscr.calls and ('move', 2, 0) in screen.stdscr.calls
+        assert set(screen.rows) == {0}
+
+    def test_invalidate(self, screen: DirtyScreen):
+        frame(screen, 'one\ntwo')
+        screen.invalidate()
+        assert frame(screen, 'one\ntwo') == [(0, 0, 'one'), (1, 0, 'two')]
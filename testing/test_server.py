@@ -0,0 +1,122 @@
+import json
+import asyncio
+import pytest
+from pathlib import Path
+from py2048 import server
+
+
+@pytest.fixture
+def savedir(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(server.CONFIG, 'savedir', tmp_path)
+    return tmp_path
+
+
+async def request(reader, writer, **payload) -> dict:
+    writer.write(json.dumps(payload).encode() + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+class TestServer:
+
+    def test_sessions(self, savedir: Path):
+        async def scenario():
+            game_server = await server.GameServer().start(unix=str(savedir / 'server.sock'))
+            reader, writer = await asyncio.open_unix_connection(str(savedir / 'server.sock'))
+
+            new = await request(reader, writer, op='new', seed=3, id=1)
+            assert new['ok'] and new['id'] == 1 and new['moves'] == 0
+            session = new['session']
+
+            moved = [await request(reader, writer, op='move', session=session, direction=direction)
+                     for direction in ['up', 2, 'down', 3] * 5]
+            assert all(response['ok'] for response in moved)
+            state = await request(reader, writer, op='state', session=session)
+            assert state['moves'] == 20 and state['board'] == moved[-1]['board']
+
+            assert (await request(reader, writer, op='save', session=session))['ok']
+            assert (savedir / f"{session}.json").exists()
+            assert (await request(reader, writer, op='close', session=session))['ok']
+            assert session not in game_server.manager
+
+            # A game which is not in memory is loaded (from its save) when asked for
+            loaded = await request(reader, writer, op='load', session=session)
+            assert loaded['ok'] and loaded['board'] == state['board'] and loaded['score'] == state['score']
+
+            # Bad requests get errors, and the connection stays usable
+            assert not (await request(reader, writer, op='move', session=session, direction=7))['ok']
+            assert not (await request(reader, writer, op='load', session='nobody'))['ok']
+            assert not (await request(reader, writer, op='fly'))['ok']
+            writer.write(b'not json\n')
+            assert not json.loads(await reader.readline())['ok']
+            assert (await request(reader, writer, op='ping'))['ok']
+
+            writer.close()
+            await game_server.close()
+
+        asyncio.run(scenario())
+
+    def test_eviction(self, savedir: Path):
+        """ Past its limit, the server saves the least recently used games and loads them again when asked for """
+        async def scenario():
+            game_server = await server.GameServer(max_sessions=2).start(port=0)
+            host, port = game_server.address[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+
+            sessions = [(await request(reader, writer, op='new', seed=seed))['session'] for seed in range(3)]
+            for session in sessions:
+                await request(reader, writer, op='move', session=session, direction='left')
+            states = [await request(reader, writer, op='state', session=session) for session in sessions]
+            cache = game_server.manager.report()
+            assert cache.sessions == 2 and cache.evictions > 0 and cache.writebacks > 0 and cache.loads > 0
+            assert all(state['moves'] == 1 for state in states)
+
+            writer.close()
+            await game_server.close()
+            assert all((savedir / f"{session}.json").exists() for session in sessions)
+
+        asyncio.run(scenario())
+
+    def test_concurrent_eviction(self, savedir: Path):
+        """ Many clients on few slots: the limit holds, and every move is kept however often its game was evicted """
+        async def client(address, seed: int, shared: list) -> (str, int):
+            reader, writer = await asyncio.open_connection(*address)
+            session = (await request(reader, writer, op='new', seed=seed))['session']
+            shared.append(session)
+            moves = 0
+            for i in range(40):
+                moves += (await request(reader, writer, op='move', session=session, direction=i % 4))['changed']
+                await request(reader, writer, op='state', session=shared[i % len(shared)])
+            writer.close()
+            return session, moves
+
+        async def scenario():
+            game_server = await server.GameServer(max_sessions=3).start(port=0)
+            shared = []
+            results = await asyncio.gather(*[client(game_server.address[:2], seed, shared) for seed in range(6)])
+            assert len(game_server.manager) <= 3
+
+            reader, writer = await asyncio.open_connection(*game_server.address[:2])
+            for session, moves in results:
+                state = await request(reader, writer, op='state', session=session)
+                assert state['ok'] and state['moves'] == 40
+            writer.close()
+            await game_server.close()
+
+        asyncio.run(scenario())
+
+    def test_rate_limit(self, savedir: Path):
+        async def scenario():
+            game_server = await server.GameServer(rate=1., burst=5).start(port=0)
+            host, port = game_server.address[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+
+            responses = [await request(reader, writer, op='ping') for _ in range(8)]
+            assert [response['ok'] for response in responses] == [True] * 5 + [False] * 3
+            assert responses[-1]['retry_after'] > 0
+            assert game_server.report().rate_limited == 3
+
+            writer.close()
+            await game_server.close()
+
+        asyncio.run(scenario())
@@ -0,0 +1,42 @@
+import json
+from pathlib import Path
+from py2048.sessions import SessionIndex
+
+
+class TestSessionIndex:
+
+    def test_newest_and_top(self, tmp_path: Path):
+        index = SessionIndex(tmp_path)
+        index.update('a', score=100, max_tile=64, gameover=False, mtime=1.)
+        index.update('b', score=300, max_tile=128, gameover=True, mtime=2.)
+        index.update('c', score=200, max_tile=128, gameover=False, mtime=3.)
+        index.update('a', score=150, max_tile=64, gameover=False, mtime=4.)
+
+        assert len(index) == 3
+        assert [entry.session_id for entry in index.newest(2)] == ['a', 'c']
+        assert [entry.session_id for entry in index.top(3)] == ['b', 'c', 'a']
+        assert [entry.session_id for entry in index.top(3, playable=True)] == ['c', 'a']
+        assert index.newest(1)[0].score == 150 and index.top(1)[0].gameover is True
+
+    def test_rebuild(self, tmp_path: Path):
+        for i in range(3):
+            saved = {'session_id': f's{i}', 'score': i * 10, 'gameover': i == 2,
+                     'grid': {'vals': {'0': [2, 0], '1': [0, 2 ** (i + 2)]}}}
+            json.dump(saved, (tmp_path / f's{i}.json').open('w'))
+        (tmp_path / 'broken.json').write_text('{')
+
+        index = SessionIndex(tmp_path)
+        assert index.rebuild() == 3
+        assert {entry.session_id: entry.max_tile for entry in index.top(5)} == {'s0': 4, 's1': 8, 's2': 16}
+
+    def test_migration(self, tmp_path: Path):
+        """ Saves from before the index existed are found when it is first opened, however many are saved after """
+        json.dump({'session_id': 'old', 'score': 10, 'gameover': False, 'grid': {'vals': {'0': [2, 4]}}},
+                  (tmp_path / 'old.json').open('w'))
+        index = SessionIndex(tmp_path)
+        index.update('new', score=20, max_tile=8, gameover=False, mtime=1.)
+        assert {entry.session_id for entry in index.newest(5)} == {'old', 'new'}
+
+        # Once filled, opening it again does not scan the savefiles
+        (tmp_path / 'old.json').unlink()
+        assert len(SessionIndex(tmp_path)) == 2
@@ -0,0 +1,25 @@
+from py2048.tournament import run, summarise, format_summary
+
+
+class TestTournament:
+
+    def test_tournament(self):
+        """ Games come back from the workers in any order, but each seed plays out the same as in process """
+        results = list(run('random', {}, games=6, workers=2, seed=10))
+        assert sorted(result['seed'] for result in results) == list(range(10, 16))
+        serial = {result['seed']: result for result in run('random', {}, games=6, workers=1, seed=10)}
+        for result in results:
+            expected = serial[result['seed']]
+            assert (result['score'], result['moves']) == (expected['score'], expected['moves'])
+
+        summary = summarise(results, wall_time=1.)
+        assert summary.games == 6 and summary.games_per_sec == 6.
+        mean, low, high = summary.score
+        assert low <= mean <= high and mean == sum(result['score'] for result in results) / 6
+        assert sum(summary.max_tile.values()) == 6 and summary.moves_per_sec > 0
+        assert 'score (95% CI)' in format_summary(summary)
+
+    def test_empty_summary(self):
+        summary = summarise([], wall_time=1.)
+        assert summary.games == 0 and summary.games_per_sec == 0.
+        assert 'games' in format_summary(summary) and summarise([]) == {'games': 0}
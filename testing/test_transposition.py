@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from py2048.transposition import TranspositionCache, zobrist_hashes, canonical_hash
+from py2048.engine import Grid
+from py2048.bitboard import BitGrid
+from py2048.agents import ExpectimaxAgent
+from py2048.env import Env
+
+
+def random_board(dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vals = 2 ** rng.integers(1, 12, (dim, dim))
+    return np.where(rng.random((dim, dim)) < 0.4, 0, vals).astype(np.int32)
+
+
+class TestTransposition:
+
+    @pytest.mark.parametrize('dim', [3, 4, 5])
+    def test_symmetric_boards_share_hash(self, dim: int):
+        vals = random_board(dim, dim)
+        rotations = [np.rot90(vals, k) for k in range(4)]
+        versions = rotations + [np.fliplr(board) for board in rotations]
+        assert len({canonical_hash(version) for version in versions}) == 1
+
+        # Each symmetric version has the same 8 hashes, and the one of the version itself among them
+        hashes = zobrist_hashes(vals)
+        assert set(hashes) == set(zobrist_hashes(versions[5]))
+        assert canonical_hash(vals) != canonical_hash(random_board(dim, dim + 100))
+
+    @pytest.mark.parametrize('grid_cls, dim', [(Grid, 4), (Grid, 8), (BitGrid, 4)])
+    def test_grid_hashes_follow_moves(self, grid_cls, dim: int):
+        """ Hashes kept up to date through moves and spawns equal hashes computed from scratch """
+        grid = Grid(dim=dim, seed=5) if grid_cls is Grid else grid_cls(seed=5)
+        grid.hashes
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            legal = np.flatnonzero(grid.legal_moves)
+            if not legal.size:
+                break
+            grid.move(int(rng.choice(legal)))
+            grid.spawn()
+            assert (grid.hashes == zobrist_hashes(grid.vals)).all()
+
+        grid.set_vals(random_board(dim, 1))
+        assert grid.canonical_hash == canonical_hash(grid.vals)
+
+    def test_lru_cache(self):
+        cache = TranspositionCache(capacity=2)
+        cache.put(1, 2, 10.)
+        cache.put(2, 2, 20.)
+        assert cache.get(1, 2) == 10.           # 1 is now the most recently used
+        assert cache.get(1, 3) is None          # not searched deep enough
+        cache.put(3, 1, 30.)
+        assert cache.get(2, 1) is None
+        assert cache.get(3, 1) == 30.
+        cache.put(1, 1, 0.)                     # a shallower result does not replace a deeper one
+        assert cache.get(1, 2) == 10.
+        assert (cache.hits, cache.misses, cache.evictions, len(cache)) == (3, 2, 1, 2)
+
+    def test_depth_cache(self):
+        cache = TranspositionCache(capacity=4, policy='depth')
+        cache.put(1, 3, 10.)
+        cache.put(5, 2, 50.)                    # same slot, shallower: rejected
+        assert cache.get(5, 1) is None
+        cache.put(5, 3, 50.)
+        assert cache.get(1, 1) is None
+        assert cache.get(5, 3) == 50.
+        assert (cache.rejections, cache.evictions, len(cache)) == (1, 1, 1)
+        cache.clear()
+        assert len(cache) == 0
+
+        with pytest.raises(ValueError):
+            TranspositionCache(policy='fifo')
+
+    def test_agent_with_cache(self):
+        env = Env()
+        env.reset(seed=3)
+        grid = env.game.grid            # a Grid from the same module the agents import
+        agent = ExpectimaxAgent(depth=3, cache_size=1 << 16)
+        plain = ExpectimaxAgent(depth=3)
+        for _ in range(5):
+            direction = agent.act(grid)
+            assert direction == plain.act(grid)
+            grid.move(direction)
+            grid.spawn()
+
+        report = agent.report()
+        assert report.cache.hits > 0
+        assert sum(agent.nodes) < sum(plain.nodes)
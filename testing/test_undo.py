@@ -0,0 +1,78 @@
+import numpy as np
+from py2048.undo import UndoBuffer
+from py2048.env import Env
+
+
+def play(game, n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        game.step(int(rng.integers(4)))
+
+
+class TestUndo:
+
+    def test_ring_buffer(self):
+        buffer = UndoBuffer(dim=2, capacity=3)
+        for i in range(5):
+            buffer.push(np.full((2, 2), 2 ** i, dtype=np.int32), score=i, draws=10 * i, moves=i, direction=i % 4,
+                        spawned=[(i % 4, 4)])
+        assert len(buffer) == 3                 # the two oldest states are forgotten
+        assert buffer.state().score == 4 and buffer.state().spawned == [(0, 4)]
+
+        assert buffer.undo().score == 3
+        assert buffer.undo().vals.tolist() == [[4, 4], [4, 4]]
+        assert buffer.undo() is None
+        assert buffer.redo().draws == 30
+
+        # A new state after an undo replaces what could have been redone
+        buffer.push(np.zeros((2, 2), dtype=np.int32), score=9, draws=0, moves=4)
+        assert buffer.redo() is None and buffer.state().score == 9 and buffer.state().spawned == []
+        assert buffer.undo().score == 3
+
+    def test_game_undo_redo(self):
+        env = Env(record=True)
+        env.reset(seed=1)
+        game = env.game
+        play(game, 40)
+        vals, score, draws, history = game.grid.vals.copy(), game.score, game.grid.draws, list(game.history)
+
+        # Undo everything back to the start (the buffer is much bigger than the game)
+        undone = 0
+        while game.command(ord('u'))[1] == 13:
+            undone += 1
+        assert game.command(ord('u'))[1] == 14
+        assert game.history == [] and len(game.replay) == 0 and game.score == 0
+        assert np.all(game.grid.vals == game.replay.seek(0, game.grid)[0])
+
+        for _ in range(undone):
+            assert game.redo()
+        assert not game.redo()
+        assert np.all(game.grid.vals == vals) and game.score == score and game.grid.draws == draws
+        assert len(game.history) == undone <= len(history)        # moves which changed nothing are not redone
+        assert np.all(game.seek(len(game.history))[0] == vals)
+
+        # After undoing, playing the same move again spawns the same as before
+        direction = (259, 258, 260, 261).index(game.history[-1])
+        game.undo()
+        game.step(direction)
+        assert np.all(game.grid.vals == vals) and game.score == score
+        assert not game.redo()
+        assert np.all(game.seek(len(game.history))[0] == game.grid.vals)
+
+    def test_undo_custom_numgen(self):
+        """ Values which are not powers of two (threes, and what they merge into) come back as they were """
+        env = Env(numgen=lambda: 3, record=True)
+        env.reset(seed=1)
+        game = env.game
+        boards = [game.grid.vals.copy()]
+        for direction in [0, 2, 1, 3] * 5:
+            if game.step(direction)[1]:
+                boards.append(game.grid.vals.copy())
+        assert np.any(game.grid.vals == 6)
+
+        for board in reversed(boards[:-1]):
+            assert game.undo() and np.all(game.grid.vals == board)
+        assert not game.undo()
+        while game.redo():
+            pass
+        assert np.all(game.grid.vals == boards[-1])
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from py2048.engine import Grid
+from py2048.visualisation import VisualizeGrid
+
+# As the renderer drew them before it was rewritten around templates
+EXPECTED = [
+    ('center', {}, [[0, 2], [4, 0]], """
+╭───────┬───────╮
+│   0   │   2   │
+├───────┼───────┤
+│   4   │   0   │
+╰───────┴───────╯"""),
+    ('left', {}, [[2, 0, 4], [16, 2048, 0], [0, 8, 131072]], """
+╭────────┬────────┬────────╮
+│      2 │      0 │      4 │
+├────────┼────────┼────────┤
+│     16 │   2048 │      0 │
+├────────┼────────┼────────┤
+│      0 │      8 │ 131072 │
+╰────────┴────────┴────────╯"""),
+    ('right', {'pad_ver': 1}, [[2, 4], [8, 1024]], """
+╭───────┬───────╮
+│       │       │
+│ 2     │ 4     │
+│       │       │
+├───────┼───────┤
+│       │       │
+│ 8     │ 1024  │
+│       │       │
+╰───────┴───────╯"""),
+]
+
+
+def grid_of(vals: list) -> Grid:
+    grid = Grid(dim=len(vals), seed=0)
+    grid.set_vals(np.array(vals, dtype=np.int32))
+    return grid
+
+
+class TestVisualisation:
+
+    @pytest.mark.parametrize('align, options, vals, expected', EXPECTED)
+    def test_render(self, align: str, options: dict, vals: list, expected: str):
+        viz = VisualizeGrid(align=align, **options)
+        assert viz(grid_of(vals)) == expected.lstrip('\n')
+        assert viz(grid_of(vals)) == expected.lstrip('\n')          # again, from the cached template
+
+    def test_template_per_width(self):
+        """ A wider cell (a longer number) gets a template of its own, and the old one still works """
+        viz = VisualizeGrid()
+        narrow, wide = grid_of([[2, 0], [0, 4]]), grid_of([[2, 0], [0, 1048576]])
+        first = viz(narrow)
+        lines = viz(wide).split('\n')
+        assert len({len(line) for line in lines}) == 1 and len(lines[0]) > len(first.split('\n')[0])
+        assert viz(narrow) == first and len(viz._templates) == 2